@@ -0,0 +1,266 @@
+"""GUIを使わずに複数ファイルをまとめて文字起こしするバッチ実行用エントリポイント。
+
+    $ python batch.py "recordings/*.mp4" --profile "Gemini Flash" --jobs 4
+
+tkinter は読み込まないので、ディスプレイの無いサーバでも実行できる。
+"""
+import argparse
+import asyncio
+import configparser
+import datetime
+import glob
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+
+# Windows コンソール（cp932）でも絵文字が出せるよう UTF-8 に切り替える
+for stream in (sys.stdout, sys.stderr):
+    try:
+        stream.reconfigure(encoding="utf-8")  # type: ignore[attr-defined]
+    except (AttributeError, ValueError):
+        pass
+
+from lib.constants import ButtonState
+from lib.debug_options import DebugOptions
+from lib.ffmpeg_utils import probe_duration
+from lib.model_profile import ModelProfile, ProfileRegistry, effective_prompt
+from lib.output_options import OutputOptions, unsupported_output_error
+from lib.rate_limiter import load_quotas
+from lib.job_workspace import load_workspace_settings
+from lib.upload_encoding import load_upload_encodings
+from lib.raw_response import is_raw_response_file
+from lib.transcription_cache import TranscriptionCache
+from lib.transcription_controller import TranscriptionController
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="SnackWhisper - GUIなしのバッチ文字起こし")
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="文字起こしする動画/音声ファイル。glob パターン（例: \"rec/**/*.mp4\"）も指定可",
+    )
+    parser.add_argument(
+        "--profile",
+        help="config.ini の [profile:名前] の名前。省略時は選択中のプロファイル",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=2,
+        help="同時に処理するファイル数（デフォルト: 2）",
+    )
+    parser.add_argument(
+        "--config",
+        default="config.ini",
+        help="設定ファイルのパス（デフォルト: config.ini）",
+    )
+    parser.add_argument(
+        "--silence-removal",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="静音除去を行うか。省略時は config.ini の flag_silence_removal に従う",
+    )
+    parser.add_argument(
+        "--debug",
+        action="store_true",
+        help="コンソールに進行状況を逐次出力",
+    )
+    return parser.parse_args()
+
+
+def expand_inputs(patterns: list[str]) -> list[str]:
+    """ファイル名と glob パターンを展開し、重複を除いて指定順に並べる"""
+    files: list[str] = []
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matched = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matched = [pattern]
+        for path in matched:
+            if os.path.isfile(path) and path not in files:
+                files.append(path)
+    return files
+
+
+@dataclass
+class ProviderStats:
+    requests: int = 0
+    failures: int = 0
+
+
+@dataclass
+class BatchStats:
+    succeeded: int = 0
+    failed: int = 0
+    audio_sec: float = 0.0
+    providers: dict[str, ProviderStats] = field(default_factory=dict)
+
+    def add_requests(self, provider: str, requests: int, failures: int):
+        stats = self.providers.setdefault(provider, ProviderStats())
+        stats.requests += requests
+        stats.failures += failures
+
+    def report(self, wall_sec: float) -> str:
+        audio_min = self.audio_sec / 60
+        wall_min = wall_sec / 60
+        speed = audio_min / wall_min if wall_min > 0 else 0.0
+        lines = [
+            "==== バッチ結果",
+            f"ファイル: 成功 {self.succeeded} / 失敗 {self.failed}",
+            f"音声: {audio_min:.1f} 分 / 経過: {wall_min:.1f} 分 ({speed:.1f} 音声分/実時間分)",
+        ]
+        for provider, stats in self.providers.items():
+            lines.append(f"{provider}: リクエスト {stats.requests} / 失敗 {stats.failures}")
+        return "\n".join(lines)
+
+
+def make_status_function(audio_file: str):
+    filebody = os.path.basename(audio_file)
+
+    def set_status(message: str, _button_state: ButtonState = ButtonState.NONE):
+        ts = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{ts}] {filebody}: {message}", flush=True)
+
+    return set_status
+
+
+async def transcribe_one(
+    audio_file: str,
+    profile: ModelProfile,
+    output_options: OutputOptions,
+    debug_options: DebugOptions,
+    config: configparser.ConfigParser,
+    cache: TranscriptionCache,
+    flag_silence_removal: bool,
+    stats: BatchStats,
+    semaphore: asyncio.Semaphore,
+):
+    async with semaphore:
+        controller = TranscriptionController(profile, audio_file, output_options=output_options)
+        controller.result_encoding = config.get("DEFAULT", "result_encoding", fallback="utf-8")
+        controller.keep_silence_removed_files = (
+            config.get("DEFAULT", "keep_silenced", fallback="False") == "True"
+        )
+        controller.save_raw_response = (
+            config.get("DEFAULT", "save_raw_response", fallback="True") == "True"
+        )
+        extract_processes = config.getint("DEFAULT", "extract_processes", fallback=0)
+        if extract_processes > 0:
+            controller.extract_processes = extract_processes
+        controller.set_debug_options(debug_options)
+        prompt = effective_prompt(profile)
+        if prompt:
+            controller.set_prompt(prompt)
+        controller.set_status_function = make_status_function(audio_file)
+        controller.set_cache(cache)
+        transcriptor = controller.build_transcriptor()
+
+        try:
+            saved_file = await controller.run_async(flag_silence_removal)
+        except Exception as e:
+            controller.handle_error(e)
+            stats.failed += 1
+        else:
+            controller.set_status(f"🤩 完了しました: {os.path.basename(saved_file)}")
+            stats.succeeded += 1
+            if not is_raw_response_file(audio_file):
+                try:
+                    stats.audio_sec += await asyncio.to_thread(probe_duration, audio_file)
+                except Exception:
+                    pass
+        finally:
+            stats.add_requests(
+                profile.provider, transcriptor.request_count, transcriptor.failure_count
+            )
+
+
+async def run_batch(
+    files: list[str],
+    profile: ModelProfile,
+    output_options: OutputOptions,
+    debug_options: DebugOptions,
+    config: configparser.ConfigParser,
+    flag_silence_removal: bool,
+    jobs: int,
+) -> BatchStats:
+    stats = BatchStats()
+    cache = TranscriptionCache.load(config)
+    semaphore = asyncio.Semaphore(max(1, jobs))
+    await asyncio.gather(*[
+        transcribe_one(
+            audio_file, profile, output_options, debug_options, config, cache,
+            flag_silence_removal, stats, semaphore,
+        )
+        for audio_file in files
+    ])
+    return stats
+
+
+def main() -> int:
+    args = parse_args()
+
+    config = configparser.ConfigParser()
+    config.read(args.config, encoding="utf-8")
+    load_quotas(config)
+    load_upload_encodings(config)
+    load_workspace_settings(config)
+
+    registry = ProfileRegistry.load(config)
+    if args.profile:
+        profile = registry.find(args.profile)
+    else:
+        profile = registry.selected_profile()
+    if profile is None:
+        print(f"😮 プロファイルが見つかりません: {args.profile or '(未選択)'}", file=sys.stderr)
+        print("登録済み: " + ", ".join(registry.names()), file=sys.stderr)
+        return 2
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        print("😮 対象ファイルがありません", file=sys.stderr)
+        return 2
+
+    output_options = OutputOptions.load(config)
+    debug_options = DebugOptions(config)
+    if args.debug:
+        debug_options.console_out = True
+        debug_options.export_errorlog = True
+
+    if args.silence_removal is None:
+        flag_silence_removal = config.get("DEFAULT", "flag_silence_removal", fallback="True") == "True"
+    else:
+        flag_silence_removal = args.silence_removal
+
+    # APIキーの確認はファイルごとではなく最初に1回だけ行う。
+    # *_raw.json だけなら作り直しのみなので確認しない
+    if not all(is_raw_response_file(path) for path in files):
+        # 作れない出力形式なら、音声を送ってから描画で失敗する前に止める
+        error = unsupported_output_error(profile.provider, profile.model, output_options)
+        if error is not None:
+            print("😮 " + error, file=sys.stderr)
+            return 2
+        if not profile.api_key:
+            print(f"😮‍💨 プロファイル「{profile.name}」のAPIキーが未設定です", file=sys.stderr)
+            return 2
+        checker = TranscriptionController(profile, files[0], output_options=output_options)
+        checker.set_debug_options(debug_options)
+        if checker.check_api_token() is False:
+            print("😮‍💨 APIトークンが無効です", file=sys.stderr)
+            return 2
+
+    print(f"😆 {len(files)} ファイルを {profile.name} ({profile.provider}/{profile.model}) で処理します", flush=True)
+    started = time.monotonic()
+    stats = asyncio.run(
+        run_batch(
+            files, profile, output_options, debug_options, config,
+            flag_silence_removal, args.jobs,
+        )
+    )
+    print(stats.report(time.monotonic() - started), flush=True)
+    return 0 if stats.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,17 @@
+import os
+import sys
+
+
+def app_data_dir(*names: str) -> str:
+    """ジャーナルやキャッシュを置くユーザ単位のディレクトリを返す（無ければ作る）。
+    Windows は %LOCALAPPDATA%\\SnackWhisper、それ以外は ~/.cache/snackwhisper"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        root = os.path.join(base, "SnackWhisper")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        root = os.path.join(base, "snackwhisper")
+
+    path = os.path.join(root, *names)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+from lib.time_map import TimeMap
+
+
+@dataclass
+class AudioChunk:
+    """APIに送る分割済み音声ファイル1つ分。
+    start_sec は分割元ファイルの先頭からの位置（秒）で、タイムスタンプの補正に使う。
+    duration_sec はこのファイル自体の長さで、分かっている場合のみ入る。
+    time_map は静音除去した場合のみ入り、start_sec + ファイル内の秒数 を元音声の秒数に戻す"""
+
+    path: str
+    index: int = 0
+    start_sec: float = 0.0
+    duration_sec: float | None = None
+    time_map: TimeMap | None = None
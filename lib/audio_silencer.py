@@ -1,107 +1,200 @@
+import csv
+import math
 import os
 import subprocess
 import sys
 import tempfile
-from typing import List
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator
+from lib.audio_chunk import AudioChunk
+from lib.audio_splitter import find_pauses
+from lib.ffmpeg_utils import subprocess_options
+from lib.pcm_workspace import PcmWorkspace
+from lib.silence_detector import SilenceDetector
+from lib.time_map import TimeMap
+from lib.upload_encoding import UPLOAD_ENCODINGS, UploadEncoding
+
+
+# exec_chunks で並列にデコード・エンコードする ffmpeg の数の既定値
+DEFAULT_EXTRACT_PROCESSES = min(8, os.cpu_count() or 1)
 
 
 class AudioSilencer:
     def __init__(
         self,
         input_path,
+        encoding: UploadEncoding | None = None,
+        temp_dir: str | None = None,
     ):
         self.input_path = input_path
+        # 一時ファイルを作る場所。None ならOSの一時ディレクトリ
+        self.temp_dir = temp_dir
+        # APIへ送る音声の形式。分割時間の見積もりにも使う
+        self.encoding = encoding or UPLOAD_ENCODINGS["mp3_hq"]
         self.flag_silence_removal = True
 
-    # 音声ファイルから無音部分を除去
-    def remove_silence_multiple(self, input_files: List[str], suffix="_silenced.mp3"):
-        newfiles: List[str] = []
-        for input_file in input_files:
-            body = os.path.splitext(input_file)[0]
-            newfile = body + suffix
-
-            self.remove_silence(input_file, newfile)
-            newfiles.append(newfile)
-        return newfiles
-
-    def remove_silence(self, input_path, output_path):
-
-        # 音声ファイルを読み込み
-        # この中で2回cmd.exeのウィンドウが開かれている
-        sound = AudioSegment.from_file(input_path)
-        # この後で1回cmd.exeのウィンドウが開かれている
-
-        # 元の音声の長さを計算し、分単位で表示
-        org_ms = len(sound)
-
+    def exec_chunks(
+        self,
+        plan_split_points: Callable[[float, list[tuple[float, float]]], list[float]],
+        duration_sec: float | None = None,
+        processes: int = 1,
+        keep_file: str | None = None,
+    ) -> Iterator[AudioChunk]:
+        """元ファイルをジョブの間1回だけPCMにデコードし、静音検出・分割位置の検出・分割ファイルのエンコードを
+        すべてそこから行う。plan_split_points(送る音声の秒数, 「間」の一覧) は分割位置（秒）を返す。
+        分割ファイルは processes 個並列にエンコードし、先頭から順に返す。
+        keep_file を指定すると、静音除去後の音声全体もそこへ書き出す"""
+
+        temp_dir = tempfile.mkdtemp(prefix="transcribe_", dir=self.temp_dir)
         if sys.flags.debug:
-            print("original: {:.2f} [min]".format(org_ms / 60 / 1000))
-
-        # 無音部分を検出し、音声を分割
-        chunks = split_on_silence(
-            sound, min_silence_len=100, silence_thresh=-55, keep_silence=100
+            print("==== Decode audio: " + temp_dir)
+
+        workspace = PcmWorkspace.decode(
+            self.input_path,
+            temp_dir,
+            self.encoding.sample_rate,
+            self.encoding.channels,
+            duration_sec,
+            processes,
         )
+        executor = ThreadPoolExecutor(max_workers=max(1, processes), thread_name_prefix="encode")
+        futures: list[Future] = []
+        try:
+            intervals: list[tuple[int, int]] | None = None
+            # フラグを確認して静音部分を除去
+            if self.flag_silence_removal:
+                intervals = workspace.speech_intervals(SilenceDetector())
+                # 元の音声と除去後の長さを分単位で表示
+                if sys.flags.debug:
+                    print("original: {:.2f} [min]".format(workspace.duration_sec / 60))
+                    print("speech ratio: {:.1%}".format(workspace.speech_ratio(intervals)))
+
+            if keep_file is not None:
+                futures.append(executor.submit(workspace.encode, keep_file, self.encoding, intervals))
+
+            # 分割位置は送る音声（静音除去後）の時刻で、その中の「間」を優先して決める
+            kept = intervals if intervals is not None else [(0, math.ceil(workspace.duration_sec * 1000))]
+            total_ms = sum(end - start for start, end in kept)
+            pauses = find_pauses(workspace.blocks(intervals), workspace.sample_rate)
+            points = [round(point * 1000) for point in plan_split_points(total_ms / 1000, pauses)]
+            bounds = [0, *[point for point in points if 0 < point < total_ms], total_ms]
+            if sys.flags.debug:
+                print(f"==== Encode {len(bounds) - 1} chunks with {processes} processes")
+
+            def encode(index: int, chunk_intervals: list[tuple[int, int]], length_ms: int) -> AudioChunk:
+                split_file = os.path.join(temp_dir, f"split-{index:03d}" + self.encoding.extension)
+                workspace.encode(split_file, self.encoding, chunk_intervals)
+                start_sec = chunk_intervals[0][0] / 1000
+                chunk = AudioChunk(path=split_file, index=index, start_sec=start_sec, duration_sec=length_ms / 1000)
+                if intervals is not None:
+                    # 分割ファイル内の時刻 (start_sec + 秒) → 元音声の時刻
+                    local = TimeMap.from_kept_ms(chunk_intervals, workspace.sample_rate)
+                    chunk.time_map = TimeMap([
+                        (output_start + start_sec, source_start, length)
+                        for output_start, source_start, length in local.ranges
+                    ])
+                return chunk
+
+            chunk_futures: list[Future] = []
+            for index, (first_ms, last_ms) in enumerate(zip(bounds, bounds[1:])):
+                chunk_intervals = slice_kept(kept, first_ms, last_ms)
+                if chunk_intervals:
+                    chunk_futures.append(executor.submit(encode, index, chunk_intervals, last_ms - first_ms))
+            futures += chunk_futures
+
+            for future in chunk_futures:
+                yield future.result()
+            for future in futures:
+                future.result()
+        finally:
+            # 文字起こし側が途中で失敗したら、まだ始まっていないエンコードは取り消す
+            executor.shutdown(wait=True, cancel_futures=True)
+            workspace.close()
+
+    def exec_stream(self, segment_sec: float, split_points: list[float] | None = None) -> Iterator[AudioChunk]:
+        """音声抽出と分割を1つのffmpegで行い、分割ファイルができた順に返す。静音除去はしない
+        （静音除去する場合は exec_chunks でPCMを経由する）。
+        ffmpegが後続の分割ファイルを書いている間に、先頭から文字起こしへ回せる。
+        split_points（秒）を指定するとその位置で、無ければ segment_sec ごとに切る"""
+
+        temp_dir = tempfile.mkdtemp(prefix="transcribe_", dir=self.temp_dir)
+        output_filepath = os.path.join(temp_dir, "split-%03d" + self.encoding.extension)
 
-        # 無音部分を除去した新しい音声を作成
-        no_silence_audio = AudioSegment.empty()
-        for chunk in chunks:
-            no_silence_audio += chunk
-
-        # 無音部分を除去した音声を出力
-        no_silence_audio.export(output_path, format="mp3")
-        org_ms = len(no_silence_audio)
         if sys.flags.debug:
-            print("removed: {:.2f} [min]".format(org_ms / 60 / 1000))
-
-    def extract_audio(self, input_file, output_file):
-        startupinfo = None
-        if os.name == "nt":  # Windowsの場合
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
+            print("==== Extract and split audio: " + output_filepath)
 
+        # -segment_list pipe:1 で、分割ファイルが書き終わるたびに
+        # 「ファイル名,開始秒,終了秒」が標準出力に1行ずつ出てくる
         command = [
             "ffmpeg",
             "-i",
-            input_file,
+            self.input_path,
             "-vn",
-            "-acodec",
-            "libmp3lame",
-            output_file,
+            *self.encoding.ffmpeg_args(),
+            "-f",
+            "segment",
+            *(
+                ["-segment_times", ",".join(f"{point:.3f}" for point in split_points)]
+                if split_points
+                else ["-segment_time", str(segment_sec)]
+            ),
+            "-reset_timestamps",
+            "1",
+            "-segment_list",
+            "pipe:1",
+            "-segment_list_type",
+            "csv",
+            output_filepath,
             "-loglevel",
             "quiet",
         ]
-        subprocess.run(
+        process = subprocess.Popen(
             command,
-            check=True,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            startupinfo=startupinfo,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            **subprocess_options(),
         )
-
-    def exec(self) -> List[str]:
-
-        # テンポラリディレクトリを作成
-        temp_dir = tempfile.mkdtemp(prefix="transcribe_")
-
-        # # Extract audio from MP4 to MP3
-        if sys.flags.debug:
-            print("==== Extract audio from MP4 to MP3")
-
-        # self.input_path のbody後ろに_audioe.mp3をつけたファイル名を作る
-        filename_audio = os.path.basename(self.input_path).split(".")[0] + "_audio.mp3"
-        mp3_file = os.path.join(temp_dir, filename_audio)
-
-        self.extract_audio(self.input_path, mp3_file)
-
-        if sys.flags.debug:
-            print("==== remove silence part")
-
-        # フラグを確認して静音部分を除去
-        if self.flag_silence_removal:
-            silenced_files = self.remove_silence_multiple([mp3_file])
-        else:
-            silenced_files = [mp3_file]
-
-        return silenced_files
+        assert process.stdout is not None
+
+        try:
+            for index, row in enumerate(csv.reader(process.stdout)):
+                if len(row) < 3:
+                    continue
+                split_file = os.path.join(temp_dir, row[0])
+                start_sec, end_sec = float(row[1]), float(row[2])
+
+                yield AudioChunk(
+                    path=split_file,
+                    index=index,
+                    start_sec=start_sec,
+                    duration_sec=end_sec - start_sec,
+                )
+
+            returncode = process.wait()
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, command)
+        finally:
+            # 文字起こし側が途中で失敗したら、残りの抽出は打ち切る
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+    def bytes_per_sec(self) -> float:
+        return self.encoding.bytes_per_sec()
+
+
+def slice_kept(intervals: list[tuple[int, int]], start_ms: int, end_ms: int) -> list[tuple[int, int]]:
+    """intervals をつないだ音声の [start_ms, end_ms) に当たる、元音声の区間 (開始ms, 終了ms)"""
+    result: list[tuple[int, int]] = []
+    offset = 0
+    for first, last in intervals:
+        low = max(start_ms, offset)
+        high = min(end_ms, offset + last - first)
+        if low < high:
+            result.append((first + low - offset, first + high - offset))
+        offset += last - first
+        if offset >= end_ms:
+            break
+    return result
@@ -0,0 +1,64 @@
+import bisect
+import math
+from typing import Iterable
+import numpy as np
+from lib.pcm_workspace import decode_pcm_blocks
+from lib.silence_detector import SilenceDetector
+
+
+# 分割位置を探すときの「間」の条件。静音除去よりも緩く、文の切れ目程度の間を拾う
+SPLIT_SILENCE_THRESH_DBFS = -40
+SPLIT_MIN_SILENCE_MS = 300
+# 解析用のデコード形式（分割位置を決めるだけなのでモノラル・低サンプリングレートで十分）
+ANALYSIS_SAMPLE_RATE = 16000
+# 均等割りの位置から前後どこまで「間」を探すか（目標の長さに対する割合と上限秒数）
+SPLIT_SEARCH_RATIO = 0.1
+SPLIT_SEARCH_MAX_SEC = 30.0
+
+
+def silence_map(input_file: str) -> list[tuple[float, float]]:
+    """音声中の「間」の一覧 (開始秒, 終了秒)"""
+    blocks = decode_pcm_blocks(input_file, ANALYSIS_SAMPLE_RATE, 1)
+    try:
+        return find_pauses(blocks, ANALYSIS_SAMPLE_RATE)
+    finally:
+        blocks.close()
+
+
+def find_pauses(blocks: Iterable[np.ndarray], sample_rate: int) -> list[tuple[float, float]]:
+    """デコード済みのPCMブロックから「間」の一覧 (開始秒, 終了秒) を求める"""
+    detector = SilenceDetector(
+        silence_thresh_dbfs=SPLIT_SILENCE_THRESH_DBFS,
+        min_silence_ms=SPLIT_MIN_SILENCE_MS,
+        keep_silence_ms=0,
+    )
+    ranges = detector.silences(blocks, sample_rate)
+    return [(start / 1000, end / 1000) for start, end in ranges]
+
+
+def chunk_count(duration_sec: float, size_bytes: float, max_bytes: float, max_chunk_sec: float) -> int:
+    """1つあたりのサイズと長さの両方が上限に収まる、最少の分割数"""
+    return max(1, math.ceil(size_bytes / max_bytes), math.ceil(duration_sec / max_chunk_sec))
+
+
+def plan_split_points(duration_sec: float, count: int, silences: list[tuple[float, float]]) -> list[float]:
+    """count 個に均等に分けた位置の近くにある「間」の中央を分割位置（秒）として返す。
+    近くに「間」が無ければ均等割りの位置で切る"""
+    target = duration_sec / count
+    tolerance = min(target * SPLIT_SEARCH_RATIO, SPLIT_SEARCH_MAX_SEC)
+    ends = [end for _start, end in silences]
+
+    points: list[float] = []
+    for k in range(1, count):
+        ideal = k * target
+        best = ideal
+        best_distance = math.inf
+        # ideal - tolerance より後ろで終わる「間」から順に見る
+        for start, end in silences[bisect.bisect_left(ends, ideal - tolerance):]:
+            if start > ideal + tolerance:
+                break
+            cut = min(max((start + end) / 2, ideal - tolerance), ideal + tolerance)
+            if abs(cut - ideal) < best_distance:
+                best, best_distance = cut, abs(cut - ideal)
+        points.append(best)
+    return points
@@ -1,10 +1,38 @@
+import asyncio
+import csv
+import dataclasses
+import io
+import math
 import os
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable
+from lib.audio_chunk import AudioChunk
+from lib.audio_splitter import chunk_count, plan_split_points, silence_map
 from lib.debug_options import DebugOptions
+from lib.ffmpeg_utils import probe_duration, subprocess_options
+from lib.job_journal import JobJournal, file_sha256
+from lib.model_profile import ChunkingCapability, chunking_capability
 from lib.output_options import OutputOptions
+from lib.transcription_cache import TranscriptionCache, cache_key
+from lib.upload_encoding import BITEXACT_ARGS
+from lib.time_map import TimeMap
+from lib.rate_limiter import (
+    DEFAULT_RETRY_AFTER_SEC,
+    MAX_ATTEMPTS,
+    RateLimitScheduler,
+    parse_retry_after,
+)
+
+
+# サイズの見積もりはビットレートの公称値から求めるので、コンテナの分などの余裕を見ておく
+SPLIT_SIZE_MARGIN = 0.9
 
 
 class Transcription:
@@ -13,15 +41,28 @@ class Transcription:
     def __init__(self):
         self.transcription = ""
         self.last_timestamp_sec = 0
+        # タイムスタンプ付きの区間。元音声での秒数を小数のまま持つ（JSON出力用）
+        self.segments: list[dict] = []
+        # 全体の要約とTODO（要約の出力オプションを使うときだけ）
+        self.summary = ""
 
     def add_transcription(self, text: str, last_timestamp_sec: int):
         self.transcription += text
         self.last_timestamp_sec = last_timestamp_sec
 
+    def add_segment(self, start_sec: float, end_sec: float | None, text: str, speaker: str | None = None):
+        segment: dict = {"start_sec": start_sec, "end_sec": end_sec, "text": text}
+        if speaker:
+            segment["speaker"] = speaker
+        self.segments.append(segment)
+
 
 class BaseTranscriptionCaller(ABC):
     """各プロバイダの文字起こしAPI呼び出しの基底クラス"""
 
+    # キャッシュキーに含めるプロバイダ名
+    provider = ""
+
     def __init__(self, api_key: str, timestamp_flag: bool):
         self.api_key = api_key
         self.timestamp_flag = timestamp_flag
@@ -39,6 +80,29 @@ class BaseTranscriptionCaller(ABC):
         self.split_segment_sec = 0
         self.dry_run = False
         self.console_out = False
+        self.parallelism = 1
+        # 次に渡されるファイルの、元音声での開始位置（複数ファイルを続けて処理するとき用）
+        self._next_file_offset_sec = 0.0
+
+        # API呼び出しの統計（バッチ実行時のスループット表示用）
+        self.request_count = 0
+        self.failure_count = 0
+        self._stats_lock = threading.Lock()
+
+        # プロバイダ+APIキー単位で共有するレート制限。None なら制限しない
+        self.scheduler: RateLimitScheduler | None = None
+        # 分割ファイルごとの結果を記録して再実行時に再利用する。None なら記録しない
+        self.journal: JobJournal | None = None
+        # 同じ音声・同じ条件の結果をジョブをまたいで再利用する。None なら使わない
+        self.cache: TranscriptionCache | None = None
+        # 追記した順の {index, start_sec, response}。出力形式を後から作り直すために保存する
+        self.rendered_chunks: list[dict] = []
+        # 分割ファイルを作る場所。None ならOSの一時ディレクトリ
+        self.temp_dir: str | None = None
+        # 追記中の分割ファイルの対応表（_source_sec で使う）
+        self._time_map: TimeMap | None = None
+        # 保存済みのレスポンスから作り直している間は True。finalize でAPIを呼ばない
+        self.offline = False
 
     def set_options(self, options: DebugOptions):
         self.debug_options = options
@@ -56,83 +120,517 @@ class BaseTranscriptionCaller(ABC):
         if prompt is not None:
             self.prompt = prompt
 
+    def set_scheduler(self, scheduler: RateLimitScheduler | None):
+        self.scheduler = scheduler
+
+    def set_journal(self, journal: JobJournal | None):
+        self.journal = journal
+
+    def set_cache(self, cache: TranscriptionCache | None):
+        self.cache = cache
+
+    def set_temp_dir(self, temp_dir: str | None):
+        self.temp_dir = temp_dir
+
+    def set_parallelism(self, parallelism: int):
+        """同時にAPIへ送る分割ファイル数の上限"""
+        self.parallelism = max(1, int(parallelism))
+
     def transcribe_audio_files(self, audio_files: list[str]):
-        for audio_file in audio_files:
-            if sys.flags.debug:
-                print("==== split audio file")
+        try:
+            for audio_file in audio_files:
+                self.transcribe_chunks(self._chunks_for_file(audio_file))
 
-            if (
-                self.split_segment_sec > 0
-                or os.path.getsize(audio_file) > 20 * 1024 * 1024
-            ):
-                cropped_files = self.split_audio(audio_file, 5 * 1024 * 1024)
-            else:
-                cropped_files = [audio_file]
+            self.finalize()
+        finally:
+            self.close()
+        return self.transcription
 
-            if sys.flags.debug:
-                print(cropped_files)
+    async def transcribe_audio_files_async(self, audio_files: list[str]):
+        """transcribe_audio_files の asyncio 版。各プロバイダの非同期クライアントで送信する"""
+        try:
+            try:
+                for audio_file in audio_files:
+                    chunks = await asyncio.to_thread(self._chunks_for_file, audio_file)
+                    await self.transcribe_chunks_async(chunks)
+            finally:
+                await self._aclose_async_client()
 
-            for cropped_file in cropped_files:
-                self._transcribe_single_file(cropped_file)
+            # 要約で同期APIを呼び、レート制限の枠も待つので、イベントループを止めないようスレッドで実行する
+            await asyncio.to_thread(self.finalize)
+        finally:
+            await asyncio.to_thread(self.close)
+        return self.transcription
+
+    def _chunks_for_file(self, audio_file: str) -> list[AudioChunk]:
+        """必要ならファイルを分割し、元音声での位置付きの分割ファイル一覧を返す"""
+        if sys.flags.debug:
+            print("==== split audio file")
+
+        # 分割するかはサイズと長さの両方で決まるので、split_audio で長さを調べてから決める
+        chunks = self.split_audio(audio_file)
+
+        if sys.flags.debug:
+            print(chunks)
+
+        # 2ファイル目以降は直前のファイルの長さぶん時刻をずらす。
+        # 結果に出てきた最後の時刻ではなく実際の長さを使うので、並列・順不同で処理してもずれない
+        file_offset_sec = self._next_file_offset_sec
+        for chunk in chunks:
+            chunk.start_sec += file_offset_sec
+        self._next_file_offset_sec = file_offset_sec + self._file_duration(audio_file, chunks)
+        return chunks
+
+    def _file_duration(self, audio_file: str, chunks: list[AudioChunk]) -> float:
+        if chunks and all(chunk.duration_sec is not None for chunk in chunks):
+            return sum(chunk.duration_sec or 0.0 for chunk in chunks)
+        if self.dry_run:
+            return 0.0
+        return probe_duration(audio_file)
+
+    def transcribe_chunk_stream(self, chunks: Iterable[AudioChunk]):
+        """分割ファイルが出来上がるそばから文字起こしし、最後に finalize する"""
+        try:
+            self.transcribe_chunks(chunks)
+            self.finalize()
+        finally:
+            self.close()
+        return self.transcription
+
+    async def transcribe_chunk_stream_async(self, chunks: Iterable[AudioChunk]):
+        """transcribe_chunk_stream の asyncio 版"""
+        try:
+            try:
+                await self.transcribe_chunks_async(chunks)
+            finally:
+                await self._aclose_async_client()
+
+            # 要約で同期APIを呼び、レート制限の枠も待つので、イベントループを止めないようスレッドで実行する
+            await asyncio.to_thread(self.finalize)
+        finally:
+            # 裏で動いている削除などが終わるまで待つので、イベントループを止めないようスレッドで実行する
+            await asyncio.to_thread(self.close)
+        return self.transcription
+
+    def transcribe_chunks(self, chunks: Iterable[AudioChunk]):
+        """分割ファイルを最大 self.parallelism 並列でAPIに送り、結果は元の順番で追記する。
+        chunks はジェネレータでもよく、次の分割ファイルを待つ間も送信済みの分は進む"""
+        if not self.dry_run:
+            # ワーカースレッドで同時にクライアントを生成しないよう先に用意しておく
+            self._ensure_client()
+
+        pending: deque[tuple[AudioChunk, Future]] = deque()
+        executor = ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="transcribe")
+        try:
+            for chunk in chunks:
+                stored = self._lookup_stored(chunk)
+                if stored is None or not stored[1]:
+                    self._prefetch_chunk(chunk)
+                pending.append((chunk, executor.submit(self._journaled_request, chunk, stored)))
+                self._render_completed(pending)
+
+            while pending:
+                chunk, future = pending.popleft()
+                self._render(chunk, future.result())
+        finally:
+            # 途中で失敗したら未着手の分割ファイルは送らない
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._discard_prefetched()
+            _close_iterator(chunks)
+
+    async def transcribe_chunks_async(self, chunks: Iterable[AudioChunk]):
+        """transcribe_chunks の asyncio 版。同時リクエスト数は self.parallelism まで"""
+        semaphore = asyncio.Semaphore(self.parallelism)
+
+        async def request(chunk: AudioChunk, stored: tuple[str, bool, object] | None):
+            async with semaphore:
+                return await self._journaled_request_async(chunk, stored)
+
+        pending: deque[tuple[AudioChunk, asyncio.Future]] = deque()
+        iterator = iter(chunks)
+        fetching: asyncio.Future | None = None
+        try:
+            while True:
+                # ffmpeg の出力待ちでイベントループを止めないようスレッドで次を取り出す。
+                # キャンセルされても取り出し中のスレッドは止まらないので、shield して後で待てるようにしておく
+                fetching = asyncio.ensure_future(asyncio.to_thread(next, iterator, None))
+                chunk = await asyncio.shield(fetching)
+                fetching = None
+                if chunk is None:
+                    break
+                stored = await asyncio.to_thread(self._lookup_stored, chunk)
+                if stored is None or not stored[1]:
+                    # 準備でAPIを呼ぶこともあるので、イベントループを止めないようスレッドで行う
+                    await asyncio.to_thread(self._prefetch_chunk, chunk)
+                pending.append((chunk, asyncio.ensure_future(request(chunk, stored))))
+                self._render_completed(pending)
+
+            while pending:
+                chunk, task = pending.popleft()
+                self._render(chunk, await task)
+        finally:
+            for _, task in pending:
+                task.cancel()
+            await asyncio.gather(*(task for _, task in pending), return_exceptions=True)
+            if fetching is not None:
+                # next() の実行中はジェネレータを閉じられず、ffmpeg が作業ディレクトリに書き続けるので戻るまで待つ
+                await asyncio.gather(fetching, return_exceptions=True)
+            self._discard_prefetched()
+            await asyncio.to_thread(_close_iterator, chunks)
+
+    def _render_completed(self, pending: deque):
+        """先頭から完了済みの分だけを順番に追記する"""
+        while pending and pending[0][1].done():
+            chunk, future = pending.popleft()
+            self._render(chunk, future.result())
+
+    def _render(self, chunk: AudioChunk, response):
+        entry = {"index": chunk.index, "start_sec": chunk.start_sec, "response": response}
+        if chunk.time_map is not None:
+            entry["time_map"] = chunk.time_map.to_list()
+        self.rendered_chunks.append(entry)
+
+        self._time_map = chunk.time_map
+        try:
+            self._render_chunk(response, chunk.start_sec)
+        finally:
+            self._time_map = None
+
+    def _source_sec(self, sec: float) -> float:
+        """offset_sec + ファイル内の秒数 を元音声の秒数に直す。静音除去していなければそのまま"""
+        if self._time_map is None:
+            return sec
+        return self._time_map.to_source(sec)
+
+    def render_responses(self, rendered_chunks: Iterable[dict], summary: str = ""):
+        """保存済みのレスポンス（と要約）から、APIを呼ばずに出力を作り直す"""
+        self.offline = True
+        self.transcription.summary = summary
+        for entry in rendered_chunks:
+            time_map = entry.get("time_map")
+            self._render(
+                AudioChunk(
+                    path="",
+                    index=entry.get("index", 0),
+                    start_sec=entry["start_sec"],
+                    time_map=TimeMap.from_list(time_map) if time_map else None,
+                ),
+                entry["response"],
+            )
 
         self.finalize()
         return self.transcription
 
+    def chunking(self) -> ChunkingCapability:
+        """このモデルが1リクエストで受け付ける音声の上限と、分割の目安"""
+        return chunking_capability(self.provider, self.model)
+
+    def planned_chunk_count(self, duration_sec: float, size_bytes: float) -> int:
+        """上限と分割の目安に収まる最少の分割数。split_segment_sec が指定されていれば長さだけで決める"""
+        if self.split_segment_sec > 0:
+            return chunk_count(duration_sec, 0, math.inf, self.split_segment_sec)
+        capability = self.chunking()
+        return chunk_count(duration_sec, size_bytes, capability.max_bytes * SPLIT_SIZE_MARGIN, capability.chunk_sec)
+
+    def segment_duration(self, duration_sec: float | None, bytes_per_sec: float) -> float:
+        """抽出後のビットレートから、分割ファイル1つあたりの秒数を見積もる。
+        分割不要な長さなら duration_sec より長い値を返す"""
+        if self.split_segment_sec > 0:
+            return float(self.split_segment_sec)
+        if duration_sec is None:
+            # 長さが分からなければ、上限だけで区切る
+            capability = self.chunking()
+            return min(capability.max_bytes * SPLIT_SIZE_MARGIN / bytes_per_sec, capability.chunk_sec)
+
+        count = self.planned_chunk_count(duration_sec, duration_sec * bytes_per_sec)
+        if count <= 1:
+            return duration_sec + 1.0
+        # ほぼ同じ長さに分ける。最後だけ極端に短くならないよう、ミリ秒単位で切り上げる
+        return math.ceil(duration_sec / count * 1000) / 1000
+
+    def split_points(
+        self, duration_sec: float, bytes_per_sec: float, pauses: list[tuple[float, float]]
+    ) -> list[float]:
+        """抽出後の長さとビットレートから分割数を決め、均等割りの位置に近い「間」で切る位置（秒）を返す。
+        分割不要なら空のリスト"""
+        count = self.planned_chunk_count(duration_sec, duration_sec * bytes_per_sec)
+        if count <= 1:
+            return []
+        return plan_split_points(duration_sec, count, pauses)
+
+    def _journaled_request(self, chunk: AudioChunk, stored: tuple[str, bool, object] | None = None):
+        """ジャーナルかキャッシュに同じ中身の分割ファイルの結果があればそれを返し、
+        無ければ送信して両方に記録する。stored は先に探した _stored_response の結果"""
+        if self.journal is None and self.cache is None:
+            return self._counted_request(chunk)
+
+        chunk_hash, found, response = stored or self._stored_response(chunk)
+        if found:
+            return response
+
+        response = self._counted_request(chunk)
+        self._store_response(chunk, chunk_hash, response)
+        return response
+
+    async def _journaled_request_async(self, chunk: AudioChunk, stored: tuple[str, bool, object] | None = None):
+        """_journaled_request の asyncio 版"""
+        if self.journal is None and self.cache is None:
+            return await self._counted_request_async(chunk)
+
+        chunk_hash, found, response = stored or await asyncio.to_thread(self._stored_response, chunk)
+        if found:
+            return response
+
+        response = await self._counted_request_async(chunk)
+        await asyncio.to_thread(self._store_response, chunk, chunk_hash, response)
+        return response
+
+    def _lookup_stored(self, chunk: AudioChunk) -> tuple[str, bool, object] | None:
+        """ジャーナル・キャッシュを使うときだけ _stored_response で探す。
+        送信の前に探しておき、結果がある分割ファイルはアップロードなどの準備を始めない"""
+        if self.journal is None and self.cache is None:
+            return None
+        return self._stored_response(chunk)
+
+    def _stored_response(self, chunk: AudioChunk) -> tuple[str, bool, object]:
+        """ジャーナル、キャッシュの順に結果を探す。戻り値: (中身のハッシュ, 見つかったか, レスポンス)"""
+        chunk_hash = file_sha256(chunk.path)
+
+        if self.journal is not None:
+            found, response = self.journal.lookup(chunk_hash)
+            if found:
+                if self.console_out:
+                    print("journal hit: " + chunk.path)
+                return chunk_hash, True, response
+
+        if self.cache is not None:
+            found, response = self.cache.get(self._cache_key(chunk_hash))
+            if found:
+                if self.console_out:
+                    print("cache hit: " + chunk.path)
+                if self.journal is not None:
+                    self.journal.record(chunk, chunk_hash, response)
+                return chunk_hash, True, response
+
+        return chunk_hash, False, None
+
+    def _store_response(self, chunk: AudioChunk, chunk_hash: str, response):
+        if self.cache is not None:
+            self.cache.put(self._cache_key(chunk_hash), response)
+        if self.journal is not None:
+            self.journal.record(chunk, chunk_hash, response)
+
+    def _cache_key(self, chunk_hash: str) -> str:
+        return cache_key(chunk_hash, self.provider, self._request_fingerprint())
+
+    def _request_fingerprint(self) -> dict:
+        """レスポンスに影響するリクエスト条件。サブクラスで実際の送信パラメータを返す"""
+        return {
+            "model": self.model,
+            "language": self.language,
+            "prompt": self.prompt,
+            "output_options": dataclasses.asdict(self.output_options),
+        }
+
+    def _counted_request(self, chunk: AudioChunk):
+        """スケジューラの枠を取ってから送信し、スロットリングされたら待って再送する"""
+        attempt = 0
+        while True:
+            attempt += 1
+            audio_sec = self._chunk_audio_sec(chunk)
+            if self.scheduler is not None:
+                self.scheduler.acquire(audio_sec)
+
+            try:
+                response = self._request_chunk(chunk.path)
+            except Exception as e:
+                retry_after = self._on_request_failed(e, attempt)
+                if self.scheduler is None:
+                    time.sleep(retry_after)
+                continue
+            except BaseException:
+                self._on_request_aborted()
+                raise
+
+            self._on_request_succeeded()
+            return to_jsonable(response)
+
+    async def _counted_request_async(self, chunk: AudioChunk):
+        """_counted_request の asyncio 版"""
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.scheduler is not None:
+                audio_sec = 0.0
+                if self.scheduler.needs_audio_sec:
+                    audio_sec = await asyncio.to_thread(self._chunk_audio_sec, chunk)
+                await self.scheduler.acquire_async(audio_sec)
+
+            try:
+                response = await self._request_chunk_async(chunk.path)
+            except Exception as e:
+                retry_after = self._on_request_failed(e, attempt)
+                if self.scheduler is None:
+                    await asyncio.sleep(retry_after)
+                continue
+            except BaseException:
+                self._on_request_aborted()
+                raise
+
+            self._on_request_succeeded()
+            return to_jsonable(response)
+
+    def _counted_call(self, request, *args, **kwargs):
+        """音声を送らないリクエスト（要約など）を、_counted_request と同じくスケジューラの枠を取って送る"""
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.scheduler is not None:
+                self.scheduler.acquire()
+
+            try:
+                response = request(*args, **kwargs)
+            except Exception as e:
+                retry_after = self._on_request_failed(e, attempt)
+                if self.scheduler is None:
+                    time.sleep(retry_after)
+                continue
+            except BaseException:
+                self._on_request_aborted()
+                raise
+
+            self._on_request_succeeded()
+            return response
+
+    def _on_request_succeeded(self):
+        self._count_request(failed=False)
+        if self.scheduler is not None:
+            self.scheduler.release()
+
+    def _on_request_aborted(self):
+        """キャンセル（CancelledError）や Ctrl+C で送信が中断されたら、枠数は変えずに枠だけ返す。
+        返さないとプロセス共通のスケジューラの枠が減ったままになる"""
+        if self.scheduler is not None:
+            self.scheduler.release(failed=True)
+
+    def _on_request_failed(self, e: Exception, attempt: int) -> float:
+        """失敗を記録する。再送できるなら待ち時間を返し、できなければ例外をそのまま投げる"""
+        self._count_request(failed=True)
+        retry_after = self._throttle_delay(e)
+        if self.scheduler is not None:
+            self.scheduler.release(throttled=retry_after is not None, retry_after=retry_after, failed=True)
+
+        if retry_after is None or attempt >= MAX_ATTEMPTS:
+            raise e
+
+        if self.console_out or sys.flags.debug:
+            print(f"レート制限のため {retry_after:.1f} 秒後に再送します ({attempt}/{MAX_ATTEMPTS}): {e}")
+        return retry_after
+
+    def _throttle_delay(self, e: Exception) -> float | None:
+        """429 などのスロットリングなら再送までの秒数を、それ以外なら None を返す。
+        プロバイダ固有の判定はサブクラスでオーバーライドする"""
+        status = getattr(e, "status_code", None) or getattr(e, "code", None)
+        if status != 429:
+            return None
+
+        response = getattr(e, "response", None)
+        headers = getattr(response, "headers", None) or getattr(e, "headers", None)
+        retry_after = parse_retry_after(headers)
+        return retry_after if retry_after is not None else DEFAULT_RETRY_AFTER_SEC
+
+    def _chunk_audio_sec(self, chunk: AudioChunk) -> float:
+        """音声秒数の上限があるときだけ、分割ファイルの長さを求める"""
+        if self.scheduler is None or not self.scheduler.needs_audio_sec:
+            return 0.0
+        if chunk.duration_sec is None:
+            chunk.duration_sec = probe_duration(chunk.path)
+        return chunk.duration_sec
+
+    def _count_request(self, failed: bool):
+        with self._stats_lock:
+            self.request_count += 1
+            if failed:
+                self.failure_count += 1
+
     def finalize(self) -> str:
-        """全ファイル処理後の後処理（要約集約など）。サブクラスで必要に応じてオーバーライド"""
+        """全ファイル処理後の後処理（要約集約など）。サブクラスで必要に応じてオーバーライド。
+        asyncio 版からはワーカースレッドで呼ばれる"""
         return self.transcription.transcription
 
+    def close(self):
+        """ジョブの終わりに、成功・失敗にかかわらず呼ばれる。裏で動かしているスレッドなどを片付ける。
+        サブクラスで必要に応じてオーバーライド"""
+
+    def _ensure_client(self):
+        """SDKクライアントを生成する。サブクラスで必要に応じてオーバーライド"""
+
+    async def _request_chunk_async(self, audio_file: str):
+        """_request_chunk の非同期版。非同期クライアントを持たないサブクラスはスレッドで代用する"""
+        return await asyncio.to_thread(self._request_chunk, audio_file)
+
+    async def _aclose_async_client(self):
+        """非同期クライアントの接続を閉じる。サブクラスで必要に応じてオーバーライド"""
+
+    def _prefetch_chunk(self, chunk: AudioChunk):
+        """分割ファイルを受け取った時点で、送信の空きを待たずに始められる準備（アップロードなど）を始める。
+        ジャーナル・キャッシュに結果が無い分割ファイルについてだけ、スケジューラの枠を取る前に呼ばれる。
+        サブクラスで必要に応じてオーバーライド"""
+
+    def _discard_prefetched(self):
+        """_prefetch_chunk で準備したまま使わなかったものを片付ける。サブクラスで必要に応じてオーバーライド"""
+
     @abstractmethod
-    def _transcribe_single_file(self, audio_file: str) -> str:
-        """1ファイルを文字起こしして self.transcription に追記する"""
+    def _request_chunk(self, audio_file: str):
+        """1ファイル分のAPIを呼び出してレスポンスを返す。
+        ワーカースレッドから並列に呼ばれるので self.transcription には触らないこと"""
+
+    @abstractmethod
+    def _render_chunk(self, response, offset_sec: float) -> None:
+        """_request_chunk のレスポンスを offset_sec 秒ずらして self.transcription に追記する。
+        レスポンスは to_jsonable 済み（dict/list/str）で渡される。
+        時刻は offset_sec + ファイル内の秒数 を self._source_sec() に通してから使うこと"""
 
     @abstractmethod
     def check_api_token(self) -> bool:
         """APIトークンが有効か確認する"""
 
     # ffmpegを使ってファイルを分割する
-    def split_audio(self, input_file: str, max_size: int):
-        startupinfo = None
-        if os.name == "nt":
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-
-        target_duration = self.split_segment_sec
-
+    def split_audio(self, input_file: str) -> list[AudioChunk]:
+        """ほぼ同じ長さになるよう、均等割りの位置の近くの「間」で分割する。
+        各分割ファイルの元音声での位置は、ffmpeg が書き出した分割リストの値を使う"""
         if self.dry_run:
-            target_duration = 5
-        elif target_duration == 0:
-            duration_command = [
-                "ffprobe", "-i", input_file,
-                "-show_entries", "format=duration",
-                "-v", "quiet", "-of", "csv=p=0",
-            ]
-            duration = float(
-                subprocess.check_output(
-                    duration_command,
-                    creationflags=subprocess.CREATE_NO_WINDOW,
-                    startupinfo=startupinfo,
-                ).decode("utf-8").strip()
-            )
-            size = os.path.getsize(input_file)
-            target_duration = (duration * max_size) // size
+            if self.split_segment_sec <= 0:
+                return [AudioChunk(path=input_file)]
+            duration, count, points = 10.0, 2, [5.0]
+        else:
+            duration = probe_duration(input_file)
+            count = self.planned_chunk_count(duration, os.path.getsize(input_file))
+            if count <= 1:
+                return [AudioChunk(path=input_file, duration_sec=duration)]
+            points = plan_split_points(duration, count, silence_map(input_file))
 
-        temp_dir = tempfile.mkdtemp(prefix="splitaudio_")
+        temp_dir = tempfile.mkdtemp(prefix="splitaudio_", dir=self.temp_dir)
         output_workpath = os.path.join(temp_dir, "work")
         os.makedirs(output_workpath, exist_ok=True)
-        output_filepath = os.path.join(output_workpath, "split-%03d.mp3")
+        extension = os.path.splitext(input_file)[1] or ".mp3"
+        output_filepath = os.path.join(output_workpath, "split-%03d" + extension)
 
         if self.console_out:
             print("==== split audio file: " + input_file)
-            print("==== target_duration: " + str(target_duration))
+            print("==== split points: " + ", ".join(f"{point:.3f}" for point in points))
             print("==== output_filepath: " + output_filepath)
 
         command = [
             "ffmpeg", "-i", input_file,
+            "-vn",
             "-f", "segment",
-            "-segment_time", str(target_duration),
+            "-segment_times", ",".join(f"{point:.3f}" for point in points),
+            "-reset_timestamps", "1",
+            "-segment_list", "pipe:1",
+            "-segment_list_type", "csv",
             "-acodec", "copy",
+            *BITEXACT_ARGS,
             str(output_filepath),
             "-loglevel", "quiet",
         ]
@@ -141,16 +639,47 @@ class BaseTranscriptionCaller(ABC):
             print(" ".join(command))
             return []
 
-        subprocess.run(
+        result = subprocess.run(
             command,
             check=True,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            startupinfo=startupinfo,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            **subprocess_options(),
         )
 
-        split_files = []
-        for filename in os.listdir(output_workpath):
-            if filename.startswith("split") and filename.endswith(".mp3"):
-                split_files.append(os.path.join(output_workpath, filename))
+        # 分割リストの「ファイル名,開始秒,終了秒」が、実際に切れた位置
+        chunks: list[AudioChunk] = []
+        for row in csv.reader(io.StringIO(result.stdout)):
+            if len(row) < 3:
+                continue
+            start_sec, end_sec = float(row[1]), float(row[2])
+            chunks.append(AudioChunk(
+                path=os.path.join(output_workpath, row[0]),
+                index=len(chunks),
+                start_sec=start_sec,
+                duration_sec=end_sec - start_sec,
+            ))
+        return chunks
+
+
+def _close_iterator(chunks: Iterable):
+    """ジェネレータなら閉じて、後片付け（ffmpegの停止など）を走らせる"""
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+
 
-        return sorted(split_files)
+def to_jsonable(response):
+    """SDKのレスポンス（Pydantic モデルなど）をジャーナルに書ける dict/list/str に変換する"""
+    if response is None or isinstance(response, (str, int, float, bool)):
+        return response
+    if isinstance(response, dict):
+        return {key: to_jsonable(value) for key, value in response.items()}
+    if isinstance(response, (list, tuple)):
+        return [to_jsonable(value) for value in response]
+    if hasattr(response, "model_dump"):
+        return response.model_dump(mode="json")
+    if hasattr(response, "__dict__"):
+        return {key: to_jsonable(value) for key, value in vars(response).items()}
+    return str(response)
@@ -1,61 +1,60 @@
 import datetime
-import os
-import shutil
 import sys
-import tempfile
 from typing import Iterable
 
 from lib.base_caller import BaseTranscriptionCaller
 from lib.output_options import FORMAT_VTT
+from lib.upload_encoding import audio_mime_type, upload_name
 
 
 # 沈黙閾値（秒）。タイムスタンプ付きテキスト生成時、これ以上の無音で改行する
 _SILENCE_BREAK_SEC = 1.0
 # 字幕1キューの目標長（秒）
 _CUE_TARGET_SEC = 6.0
+# 非同期クライアントの応答待ちの上限（秒）。SDK が自前でHTTPクライアントを作るときの既定値と同じ
+_REQUEST_TIMEOUT_SEC = 240
 
 
 class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
     """ElevenLabs Scribe (Speech-to-Text) APIによる文字起こし"""
 
+    provider = "elevenlabs"
+
     def __init__(self, api_key: str, timestamp_flag: bool):
         super().__init__(api_key, timestamp_flag)
         self.model = "scribe_v1"
         self.client = None
+        self.async_client = None
+        self._async_http = None
         # ファイル境界をまたいでも一貫した話者IDマッピングを使う
         self._speaker_label_map: dict[str, str] = {}
         # 字幕用キュー (start_sec, end_sec, body) を蓄積
         self._subtitle_cues: list[tuple[float, float, str]] = []
 
     @staticmethod
-    def _ensure_ascii_path(audio_file: str):
-        """日本語などASCII以外を含むパスならASCII名のテンポラリへコピーする。
-        戻り値: (アップロードに使うパス, 後始末コールバック)
-        """
-        try:
-            os.fsencode(audio_file).decode("ascii")
-            return audio_file, lambda: None
-        except (UnicodeDecodeError, UnicodeEncodeError):
-            pass
-
-        ext = os.path.splitext(audio_file)[1] or ".mp3"
-        fd, ascii_path = tempfile.mkstemp(prefix="elevenlabs_upload_", suffix=ext)
-        os.close(fd)
-        shutil.copyfile(audio_file, ascii_path)
-
-        def _cleanup():
-            try:
-                os.unlink(ascii_path)
-            except OSError:
-                pass
-
-        return ascii_path, _cleanup
+    def _upload_file(audio_file: str, fh):
+        """開いたファイルをそのまま送る。日本語のファイル名でも送れるよう、ASCIIのファイル名と MIME タイプを明示する"""
+        return (upload_name(audio_file), fh, audio_mime_type(audio_file))
 
     def _ensure_client(self):
         if self.client is None:
             from elevenlabs.client import ElevenLabs
             self.client = ElevenLabs(api_key=self.api_key)
 
+    def _ensure_async_client(self):
+        if self.async_client is None:
+            import httpx
+            from elevenlabs.client import AsyncElevenLabs
+            # SDK のクライアントには接続を閉じる手段が無いので、HTTPクライアントを自前で渡して後で閉じる
+            self._async_http = httpx.AsyncClient(timeout=_REQUEST_TIMEOUT_SEC, follow_redirects=True)
+            self.async_client = AsyncElevenLabs(api_key=self.api_key, httpx_client=self._async_http)
+
+    async def _aclose_async_client(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+        self.async_client = None
+
     def _build_request_options(self) -> dict:
         opts = self.output_options
         kwargs: dict = {
@@ -66,11 +65,8 @@ class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
         if opts.speaker_diarization:
             kwargs["diarize"] = True
 
-        # タイムスタンプ・字幕・話者識別のいずれかが必要なら word 単位で取得
-        if opts.timestamp or opts.is_subtitle() or opts.speaker_diarization:
-            kwargs["timestamps_granularity"] = "word"
-        else:
-            kwargs["timestamps_granularity"] = "none"
+        # 出力形式を後から作り直せるよう、常に word 単位のタイムスタンプを取得する
+        kwargs["timestamps_granularity"] = "word"
 
         # prompt を keyterms 配列として渡す（1行1キーターム、最大1000）
         if self.prompt:
@@ -84,10 +80,9 @@ class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
 
         return kwargs
 
-    def _transcribe_single_file(self, audio_file: str) -> str:
+    def _request_chunk(self, audio_file: str):
         if self.dry_run:
-            self._render_dry_run()
-            return self.transcription.transcription
+            return None
 
         self._ensure_client()
         assert self.client is not None
@@ -95,22 +90,40 @@ class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
         if self.console_out:
             print("transcribe_single_file(): " + audio_file)
 
-        upload_path, cleanup = self._ensure_ascii_path(audio_file)
-        try:
-            with open(upload_path, "rb") as fh:
-                response = self.client.speech_to_text.convert(
-                    file=fh,
-                    **self._build_request_options(),
-                )
-        finally:
-            cleanup()
+        with open(audio_file, "rb") as fh:
+            response = self.client.speech_to_text.convert(
+                file=self._upload_file(audio_file, fh),
+                **self._build_request_options(),
+            )
 
-        self._render_response(response)
-        return self.transcription.transcription
+        return response
 
-    def _render_dry_run(self):
+    async def _request_chunk_async(self, audio_file: str):
+        if self.dry_run:
+            return None
+
+        self._ensure_async_client()
+        assert self.async_client is not None
+
+        if self.console_out:
+            print("transcribe_single_file_async(): " + audio_file)
+
+        with open(audio_file, "rb") as fh:
+            response = await self.async_client.speech_to_text.convert(
+                file=self._upload_file(audio_file, fh),
+                **self._build_request_options(),
+            )
+
+        return response
+
+    def _render_chunk(self, response, offset_sec: float) -> None:
+        if self.dry_run:
+            self._render_dry_run(int(offset_sec))
+        else:
+            self._render_response(response, offset_sec)
+
+    def _render_dry_run(self, offset: int):
         opts = self.output_options
-        offset = self.transcription.last_timestamp_sec
         if opts.is_subtitle():
             self._subtitle_cues.append((offset + 0.0, offset + 5.0, "これはテストです。"))
             self.transcription.add_transcription("", offset + 5)
@@ -123,10 +136,9 @@ class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
         else:
             self.transcription.add_transcription("これはテストです。", offset + 5)
 
-    def _render_response(self, response):
+    def _render_response(self, response, offset: float):
         """ElevenLabs のレスポンスを output_options に応じて整形して self.transcription に追記"""
         opts = self.output_options
-        offset = float(self.transcription.last_timestamp_sec)
         words = self._extract_words(response)
 
         if opts.is_subtitle():
@@ -183,8 +195,15 @@ class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
                 return
             parts = []
             if opts.timestamp:
-                ts = str(datetime.timedelta(seconds=int(offset + current_start)))
+                start_sec = self._source_sec(offset + current_start)
+                ts = str(datetime.timedelta(seconds=int(start_sec)))
                 parts.append(f"[{ts}]")
+                self.transcription.add_segment(
+                    start_sec,
+                    self._source_sec(offset + end_sec),
+                    buffer_text.strip(),
+                    current_speaker if opts.speaker_diarization else None,
+                )
             if opts.speaker_diarization and current_speaker:
                 parts.append(f"{current_speaker}:")
             parts.append(buffer_text.strip())
@@ -250,14 +269,14 @@ class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
 
             if cue_end - cue_start >= _CUE_TARGET_SEC:
                 self._subtitle_cues.append(
-                    (offset + cue_start, offset + cue_end, cue_text.strip())
+                    (self._source_sec(offset + cue_start), self._source_sec(offset + cue_end), cue_text.strip())
                 )
                 cue_start = None
                 cue_text = ""
 
         if cue_start is not None and cue_text.strip():
             self._subtitle_cues.append(
-                (offset + cue_start, offset + cue_end, cue_text.strip())
+                (self._source_sec(offset + cue_start), self._source_sec(offset + cue_end), cue_text.strip())
             )
 
     def finalize(self) -> str:
@@ -284,6 +303,9 @@ class ElevenLabsTranscriptionCaller(BaseTranscriptionCaller):
 
         return self.transcription.transcription
 
+    def _request_fingerprint(self) -> dict:
+        return self._build_request_options()
+
     def check_api_token(self) -> bool:
         try:
             self._ensure_client()
@@ -0,0 +1,103 @@
+import json
+import os
+import subprocess
+from dataclasses import dataclass
+
+
+def subprocess_options() -> dict:
+    """ffmpeg/ffprobe 起動時にコンソールウィンドウを出さないための subprocess 引数。
+    Windows 以外では空の dict を返す"""
+    if os.name != "nt":
+        return {}
+
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return {
+        "startupinfo": startupinfo,
+        "creationflags": subprocess.CREATE_NO_WINDOW,
+    }
+
+
+def probe_duration(input_file: str) -> float:
+    """ffprobe でメディアの長さ（秒）を取得する"""
+    command = [
+        "ffprobe", "-i", input_file,
+        "-show_entries", "format=duration",
+        "-v", "quiet", "-of", "csv=p=0",
+    ]
+    return float(
+        subprocess.check_output(command, **subprocess_options()).decode("utf-8").strip()
+    )
+
+
+def probe_audio_format(input_file: str) -> tuple[int, int]:
+    """ffprobe で先頭の音声ストリームの (サンプリングレート, チャンネル数) を取得する"""
+    command = [
+        "ffprobe", "-i", input_file,
+        "-select_streams", "a:0",
+        "-show_entries", "stream=sample_rate,channels",
+        "-v", "quiet", "-of", "default=noprint_wrappers=1",
+    ]
+    output = subprocess.check_output(command, **subprocess_options()).decode("utf-8")
+    values = dict(line.strip().split("=", 1) for line in output.splitlines() if "=" in line)
+    return int(values["sample_rate"]), int(values["channels"])
+
+
+@dataclass
+class MediaInfo:
+    """probe_media の結果。取得できなかった値は None"""
+
+    size: int
+    duration_sec: float | None
+    codec: str | None
+    bitrate: int | None
+    sample_rate: int | None
+    channels: int | None
+    has_video: bool
+
+
+def probe_media(input_file: str) -> MediaInfo:
+    """1回の ffprobe で、先頭の音声ストリームのコーデック・長さ・ビットレート・チャンネル数とサイズを取得する"""
+    command = [
+        "ffprobe", "-i", input_file,
+        "-show_entries",
+        "format=duration,size,bit_rate"
+        ":stream=codec_type,codec_name,bit_rate,sample_rate,channels"
+        ":stream_disposition=attached_pic",
+        "-v", "quiet", "-of", "json",
+    ]
+    output = subprocess.check_output(command, **subprocess_options()).decode("utf-8")
+    probed = json.loads(output or "{}")
+    media_format = probed.get("format", {})
+    streams = probed.get("streams", [])
+
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), {})
+    # MP3 などのカバー画像は映像として扱わない
+    has_video = any(
+        stream.get("codec_type") == "video" and not stream.get("disposition", {}).get("attached_pic")
+        for stream in streams
+    )
+    size = _to_number(int, media_format.get("size")) or os.path.getsize(input_file)
+    duration = _to_number(float, media_format.get("duration"))
+    # ストリームのビットレートが無い形式（Ogg など）はコンテナ全体の値で代用する
+    bitrate = _to_number(int, audio.get("bit_rate")) or _to_number(int, media_format.get("bit_rate"))
+    if bitrate is None and duration and not has_video:
+        bitrate = int(size * 8 / duration)
+
+    return MediaInfo(
+        size=size,
+        duration_sec=duration,
+        codec=audio.get("codec_name"),
+        bitrate=bitrate,
+        sample_rate=_to_number(int, audio.get("sample_rate")),
+        channels=_to_number(int, audio.get("channels")),
+        has_video=has_video,
+    )
+
+
+def _to_number(cast, value):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
@@ -1,186 +1,509 @@
+import asyncio
 import datetime
+import json
 import os
 import re
-import shutil
 import sys
-import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from lib.audio_chunk import AudioChunk
 from lib.base_caller import BaseTranscriptionCaller
+from lib.rate_limiter import DEFAULT_RETRY_AFTER_SEC
+from lib.summarizer import ACTION_ITEMS_MARKER, SUMMARY_MARKER, MapReduceSummarizer
+from lib.upload_encoding import audio_mime_type, upload_name
+
+
+# これ以下の分割ファイルはアップロードせず、generate_content のリクエストに直接載せる。
+# リクエスト全体の上限 20MB から、base64 で増える分と指示文の分を引いた大きさ
+INLINE_MAX_BYTES = 14 * 1024 * 1024
+# 生成を待たずに先にアップロードしておく同時数
+PREFETCH_UPLOADS = 2
+# アップロードしたファイルを裏で削除する同時数
+JANITOR_WORKERS = 2
+# 指示文を cached content に置ける最小のトークン数（モデルごと）。これに満たない指示文は毎回リクエストに載せる。
+# 既定の指示文は数百トークンなので、キャッシュするのは辞書入りのプロンプトなど長い場合だけ
+CACHE_MIN_TOKENS = {
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+    "gemini-2.0-flash": 4096,
+}
+CACHE_MIN_TOKENS_DEFAULT = 4096
+# 指示文のキャッシュの有効期間。finalize で削除するが、途中で失敗したジョブの分もこの時間で消える
+CACHE_TTL_SEC = 2 * 60 * 60
+
+# タイムスタンプ付きで出力するとき、発話ごとの区間を JSON で返させるスキーマ。
+# 時刻は分割ファイルの先頭からの秒数で受け取るので、テキストから時刻を読み取り直さない
+SEGMENTS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "segments": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "heading": {"type": "STRING", "description": "話題が変わる発話にだけ付ける見出し"},
+                    "start": {"type": "NUMBER", "description": "発話の開始時刻（音声の先頭からの秒数）"},
+                    "end": {"type": "NUMBER", "description": "発話の終了時刻（音声の先頭からの秒数）"},
+                    "speaker": {"type": "STRING", "description": "話者ラベル（話者A, 話者B, ...）"},
+                    "text": {"type": "STRING", "description": "発話の文字起こし"},
+                },
+                "required": ["start", "end", "text"],
+                "propertyOrdering": ["heading", "start", "end", "speaker", "text"],
+            },
+        },
+    },
+    "required": ["segments"],
+}
+# 以前の形式（[MM:SS] 付きのテキスト）の生データを読むときの行の形
+_TIMESTAMP_LINE = re.compile(r"^\[(\d{1,2}):(\d{2})\]\s*(.*)$")
 
 
 class GeminiTranscriptionCaller(BaseTranscriptionCaller):
     """Google Gemini APIによる音声文字起こし"""
 
+    provider = "google"
+
     def __init__(self, api_key: str, timestamp_flag: bool):
         super().__init__(api_key, timestamp_flag)
         self.model = "gemini-2.5-flash"
         self.client = None
-        self._summary_buffer: list[str] = []  # 各分割ファイルの要約結果を集約
+        self._summary_buffer: list[str] = []  # 以前の形式の生データにある、分割ファイルごとの要約
+        self._chunk_texts: list[str] = []  # 要約の材料にする、分割ファイルごとの本文
+        # 先にアップロードを始めた分割ファイル → アップロードの Future
+        self._uploads: dict[str, Future] = {}
+        self._uploads_lock = threading.Lock()
+        self._upload_executor: ThreadPoolExecutor | None = None
+        self._janitor: ThreadPoolExecutor | None = None
+        self._janitor_lock = threading.Lock()
+        # ジョブの間、指示文を置いておく cached content の名前。作れなかったときは None のまま毎回送る
+        self._cache_name: str | None = None
+        self._cache_tried = False
+        self._cache_lock = threading.Lock()
 
     @staticmethod
-    def _ensure_ascii_path(audio_file: str):
-        """日本語などASCII以外を含むパスならASCII名のテンポラリへコピーする。
-        戻り値: (アップロードに使うパス, 後始末コールバック)
-        """
-        try:
-            os.fsencode(audio_file).decode("ascii")
-            return audio_file, lambda: None
-        except (UnicodeDecodeError, UnicodeEncodeError):
-            pass
-
-        ext = os.path.splitext(audio_file)[1] or ".mp3"
-        fd, ascii_path = tempfile.mkstemp(prefix="gemini_upload_", suffix=ext)
-        os.close(fd)
-        shutil.copyfile(audio_file, ascii_path)
-
-        def _cleanup():
-            try:
-                os.unlink(ascii_path)
-            except OSError:
-                pass
-
-        return ascii_path, _cleanup
+    def _upload_config(audio_file: str) -> dict:
+        """開いたファイルから送るので MIME タイプを明示する。
+        表示名も、SDK がHTTPヘッダにASCIIで載せるので日本語を含まない名前にする"""
+        return {"mime_type": audio_mime_type(audio_file), "display_name": upload_name(audio_file)}
 
     def _ensure_client(self):
         if self.client is None:
             from google import genai
             self.client = genai.Client(api_key=self.api_key)
 
+    async def _aclose_async_client(self):
+        if self.client is None:
+            return
+        # 古い SDK の非同期クライアントには aclose が無いので、あるときだけ閉じる
+        aclose = getattr(self.client.aio, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
     def _build_instruction(self) -> str:
         opts = self.output_options
         sections: list[str] = ["以下の音声を日本語で文字起こししてください。"]
 
-        if opts.speaker_diarization:
-            sections.append(
-                "発話ごとに話者を識別し、`話者A:` `話者B:` のように行頭にラベルを付けてください。"
-                "同一話者と判断した発話には同じラベルを使ってください。"
-            )
-
         if opts.timestamp:
+            # 区間はスキーマに沿った JSON で受け取る
             sections.append(
-                "各発話（または話者交替）の先頭に [MM:SS] 形式のタイムスタンプを付与してください。"
+                "発話（または話者交替）ごとに segments の1要素とし、"
+                "start と end にその発話の開始・終了時刻を音声の先頭からの秒数で入れてください。"
             )
+            if opts.speaker_diarization:
+                sections.append(
+                    "発話ごとに話者を識別し、speaker に `話者A` `話者B` のようなラベルを入れてください。"
+                    "同一話者と判断した発話には同じラベルを使ってください。"
+                )
+            if opts.structured:
+                sections.append(
+                    "話題が大きく変わる発話には heading に短い見出しを入れてください。"
+                    "text は元の発話内容を改変せず、フィラーの除去と読点の整理にとどめてください。"
+                )
+        else:
+            if opts.speaker_diarization:
+                sections.append(
+                    "発話ごとに話者を識別し、`話者A:` `話者B:` のように行頭にラベルを付けてください。"
+                    "同一話者と判断した発話には同じラベルを使ってください。"
+                )
 
-        if opts.structured:
-            sections.append(
-                "話題が大きく変わる箇所で `## 見出し` のMarkdown見出しを挿入し、"
-                "適切に段落・箇条書きを使って整形してください。"
-                "ただし元の発話内容は改変せず、フィラーの除去と読点・改行の整理にとどめてください。"
-            )
+            if opts.structured:
+                sections.append(
+                    "話題が大きく変わる箇所で `## 見出し` のMarkdown見出しを挿入し、"
+                    "適切に段落・箇条書きを使って整形してください。"
+                    "ただし元の発話内容は改変せず、フィラーの除去と読点・改行の整理にとどめてください。"
+                )
 
-        if opts.summary:
             sections.append(
-                "文字起こし本文の後ろに、以下のセクションを必ず付け加えてください:\n"
-                "  `--- SUMMARY ---` 行の下に3〜5行の要約\n"
-                "  `--- ACTION ITEMS ---` 行の下にTODO・決定事項を箇条書き（無ければ「特になし」）"
+                "上記以外の解説や前置き、Markdownのコードフェンスは付けず、結果のみを出力してください。"
             )
 
-        sections.append(
-            "上記以外の解説や前置き、Markdownのコードフェンスは付けず、結果のみを出力してください。"
-        )
-
         if self.prompt:
             sections.append(self.prompt)
 
         return "\n\n".join(sections)
 
-    def _transcribe_single_file(self, audio_file: str) -> str:
-        if self.dry_run:
-            text = self._dry_run_text()
-            self._append_chunk(text)
+    def _instruction_cache(self) -> str | None:
+        """最初の分割ファイルの準備で指示文を cached content に置き、その名前を返す。
+        トークン数の計測も作成もスケジューラの枠を取って呼ぶので、送信の枠を持ったまま呼ばないこと
+        （他の送信が終わるのを待って詰まる）"""
+        with self._cache_lock:
+            if self._cache_tried:
+                return self._cache_name
+            self._cache_tried = True
+
+            instruction = self._build_instruction()
+            assert self.client is not None
+            try:
+                # 文字数ではトークン数を見積もれないので、作る前に数える
+                counted = self._counted_call(
+                    self.client.models.count_tokens, model=self.model, contents=[instruction]
+                )
+                if (counted.total_tokens or 0) < CACHE_MIN_TOKENS.get(self.model, CACHE_MIN_TOKENS_DEFAULT):
+                    return None
+                cache = self._counted_call(
+                    self.client.caches.create,
+                    model=self.model,
+                    config={
+                        "contents": [instruction],
+                        "ttl": f"{CACHE_TTL_SEC}s",
+                        "display_name": "snackwhisper-instruction",
+                    },
+                )
+                self._cache_name = cache.name
+            except Exception as e:
+                # モデルが対応していないなどの場合は毎回送る
+                if sys.flags.debug:
+                    print("Gemini指示文のキャッシュ作成に失敗:", e)
+            return self._cache_name
+
+    def _generate_args(self, audio) -> dict:
+        """generate_content の引数。指示文のキャッシュがあれば、音声だけを送ってキャッシュを参照する"""
+        config: dict = {}
+        if self.output_options.timestamp:
+            config["response_mime_type"] = "application/json"
+            config["response_schema"] = SEGMENTS_SCHEMA
+
+        # 送信中（枠を取った後）に呼ばれるので、キャッシュは作らず _prefetch_chunk で作ったものだけを使う
+        with self._cache_lock:
+            cache_name = self._cache_name
+        if cache_name is None:
+            return {"model": self.model, "contents": [self._build_instruction(), audio], "config": config or None}
+        config["cached_content"] = cache_name
+        return {"model": self.model, "contents": [audio], "config": config}
+
+    def _parse_response(self, response):
+        """タイムスタンプ付きなら {"segments": [...]} を、それ以外は本文のテキストを返す"""
+        text = (response.text or "").strip()
+        if self.console_out:
+            print(text)
+        if not self.output_options.timestamp:
             return text
 
+        data = json.loads(text or "{}")
+        if not isinstance(data, dict) or not isinstance(data.get("segments"), list):
+            raise ValueError("Geminiの応答が区間のJSONになっていません")
+        return data
+
+    def _release_instruction_cache(self):
+        with self._cache_lock:
+            name = self._cache_name
+            self._cache_name = None
+            self._cache_tried = False
+        if name is not None:
+            self._submit_janitor(self._delete_cache, name)
+
+    def _delete_cache(self, name: str):
+        assert self.client is not None
+        try:
+            self.client.caches.delete(name=name)
+        except Exception:
+            if sys.flags.debug:
+                print("Gemini指示文のキャッシュの削除に失敗しました")
+
+    @staticmethod
+    def _is_inline(audio_file: str) -> bool:
+        return os.path.getsize(audio_file) <= INLINE_MAX_BYTES
+
+    @staticmethod
+    def _inline_part(audio_file: str):
+        """アップロードせずにリクエストへ直接載せる音声"""
+        from google.genai import types
+
+        with open(audio_file, "rb") as fh:
+            return types.Part.from_bytes(data=fh.read(), mime_type=audio_mime_type(audio_file))
+
+    def _upload(self, audio_file: str):
+        assert self.client is not None
+        # Gemini SDK は日本語を含むパスをHTTPヘッダにASCIIで載せようとして失敗するため、
+        # パスではなく開いたファイルを渡す（テンポラリへのコピーはしない）
+        with open(audio_file, "rb") as fh:
+            return self.client.files.upload(file=fh, config=self._upload_config(audio_file))
+
+    def _prefetch_chunk(self, chunk: AudioChunk):
+        """最初の1回は指示文のキャッシュを用意する。
+        インラインで送れない大きさなら、送信の順番を待たずにアップロードを始めておく"""
+        if self.dry_run:
+            return
+
+        self._ensure_client()
+        self._instruction_cache()
+        if self._is_inline(chunk.path):
+            return
+
+        with self._uploads_lock:
+            if chunk.path in self._uploads:
+                return
+            if self._upload_executor is None:
+                self._upload_executor = ThreadPoolExecutor(
+                    max_workers=PREFETCH_UPLOADS, thread_name_prefix="gemini-upload"
+                )
+            self._uploads[chunk.path] = self._upload_executor.submit(self._upload, chunk.path)
+
+    def _take_upload(self, audio_file: str) -> Future | None:
+        with self._uploads_lock:
+            return self._uploads.pop(audio_file, None)
+
+    def _discard_prefetched(self):
+        """失敗やキャンセルで送らなかった分のアップロードを消す"""
+        with self._uploads_lock:
+            futures = list(self._uploads.values())
+            self._uploads.clear()
+        for future in futures:
+            if not future.cancel():
+                future.add_done_callback(self._delete_when_uploaded)
+
+    def _delete_when_uploaded(self, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            self._delete_later(future.result().name)
+
+    def _delete_later(self, name: str):
+        """アップロードしたファイルの削除は結果を待たずに裏で行う"""
+        self._submit_janitor(self._delete_uploaded, name)
+
+    def _submit_janitor(self, fn, name: str):
+        with self._janitor_lock:
+            if self._janitor is None:
+                self._janitor = ThreadPoolExecutor(max_workers=JANITOR_WORKERS, thread_name_prefix="gemini-janitor")
+            self._janitor.submit(fn, name)
+
+    def close(self):
+        """送らなかったアップロードと指示文のキャッシュを消し、裏の削除が終わるまで待ってスレッドを止める"""
+        self._discard_prefetched()
+        self._release_instruction_cache()
+        # アップロードが終わると削除を janitor に積むので、先にアップロードの方を止める
+        with self._uploads_lock:
+            upload_executor, self._upload_executor = self._upload_executor, None
+        if upload_executor is not None:
+            upload_executor.shutdown(wait=True)
+        with self._janitor_lock:
+            janitor, self._janitor = self._janitor, None
+        if janitor is not None:
+            janitor.shutdown(wait=True)
+
+    def _delete_uploaded(self, name: str):
+        assert self.client is not None
+        try:
+            self.client.files.delete(name=name)
+        except Exception:
+            if sys.flags.debug:
+                print("Geminiアップロードファイルの削除に失敗しました")
+
+    def _request_chunk(self, audio_file: str):
+        if self.dry_run:
+            return self._dry_run_response()
+
         self._ensure_client()
         assert self.client is not None
 
         if self.console_out:
             print("transcribe_single_file(): " + audio_file)
 
-        # Gemini SDK は日本語を含むパスをHTTPヘッダにASCIIで載せようとして失敗するため、
-        # ASCII名のテンポラリにコピーしてからアップロードする
-        upload_path, cleanup = self._ensure_ascii_path(audio_file)
-        try:
-            uploaded = self.client.files.upload(file=upload_path)
+        # 小さいファイルはアップロード・削除を省き、1回のリクエストで済ませる
+        if self._is_inline(audio_file):
+            response = self.client.models.generate_content(**self._generate_args(self._inline_part(audio_file)))
+        else:
+            future = self._take_upload(audio_file)
+            uploaded = future.result() if future is not None else self._upload(audio_file)
             try:
-                response = self.client.models.generate_content(
-                    model=self.model,
-                    contents=[self._build_instruction(), uploaded],
-                )
+                response = self.client.models.generate_content(**self._generate_args(uploaded))
             finally:
-                try:
-                    self.client.files.delete(name=uploaded.name)
-                except Exception:
-                    if sys.flags.debug:
-                        print("Geminiアップロードファイルの削除に失敗しました")
-        finally:
-            cleanup()
+                self._delete_later(uploaded.name)
 
-        text = (response.text or "").strip()
+        return self._parse_response(response)
+
+    async def _request_chunk_async(self, audio_file: str):
+        if self.dry_run:
+            return self._dry_run_response()
+
+        self._ensure_client()
+        assert self.client is not None
 
         if self.console_out:
-            print(text)
+            print("transcribe_single_file_async(): " + audio_file)
+
+        aio = self.client.aio
+        if self._is_inline(audio_file):
+            part = await asyncio.to_thread(self._inline_part, audio_file)
+            response = await aio.models.generate_content(**self._generate_args(part))
+        else:
+            # 同期版と同じく、アップロードは開いたファイルから行う
+            future = self._take_upload(audio_file)
+            if future is not None:
+                uploaded = await asyncio.wrap_future(future)
+            else:
+                with open(audio_file, "rb") as fh:
+                    uploaded = await aio.files.upload(file=fh, config=self._upload_config(audio_file))
+            try:
+                response = await aio.models.generate_content(**self._generate_args(uploaded))
+            finally:
+                self._delete_later(uploaded.name)
 
-        self._append_chunk(text)
-        return text
+        return self._parse_response(response)
 
-    def _dry_run_text(self) -> str:
+    def _render_chunk(self, response, offset_sec: float) -> None:
+        if isinstance(response, dict):
+            self._append_segments(response.get("segments") or [], offset_sec)
+        else:
+            self._append_chunk(response, offset_sec)
+
+    def _dry_run_response(self):
         opts = self.output_options
-        head = "[00:00] " if opts.timestamp else ""
+        if opts.timestamp:
+            segment = {"start": 0.0, "end": 5.0, "text": "これはテストです。"}
+            if opts.speaker_diarization:
+                segment["speaker"] = "話者A"
+            return {"segments": [segment]}
         spk = "話者A: " if opts.speaker_diarization else ""
-        body = f"{head}{spk}これはテストです。"
-        if opts.summary:
-            body += "\n\n--- SUMMARY ---\nテスト要約。\n--- ACTION ITEMS ---\n- 特になし"
-        return body
+        return f"{spk}これはテストです。"
 
-    def _append_chunk(self, text: str) -> None:
-        """summary/action 部分は末尾に集約、本文はタイムスタンプを補正して追記"""
+    def _append_segments(self, segments: list[dict], offset_sec: float) -> None:
+        """スキーマで受け取った区間を、元音声の時刻に直して追記する"""
+        opts = self.output_options
+        lines: list[str] = []
+        last_sec_in_chunk = 0.0
+
+        for segment in segments:
+            text = str(segment.get("text") or "").strip()
+            if not text:
+                continue
+            start = float(segment.get("start") or 0.0)
+            end = segment.get("end")
+            end = float(end) if end is not None else None
+            last_sec_in_chunk = max(last_sec_in_chunk, end if end is not None else start)
+
+            heading = str(segment.get("heading") or "").strip() if opts.structured else ""
+            if heading:
+                lines += ([""] if lines else []) + [f"## {heading}", ""]
+
+            speaker = str(segment.get("speaker") or "").strip() if opts.speaker_diarization else ""
+            source_start = self._source_sec(offset_sec + start)
+            source_end = self._source_sec(offset_sec + end) if end is not None else None
+            timestamp = str(datetime.timedelta(seconds=int(source_start)))
+            label = f"{speaker}: " if speaker else ""
+            lines.append(f"[{timestamp}] {label}{text}")
+            self.transcription.add_segment(source_start, source_end, text, speaker or None)
+
+        body = "\n".join(lines)
+        self._chunk_texts.append(body)
+        self.transcription.add_transcription(body.rstrip() + "\n", int(offset_sec + last_sec_in_chunk))
+
+    def _append_chunk(self, text: str, offset_sec: float = 0.0) -> None:
+        """テキストの応答を追記し、要約の材料として取っておく。
+        タイムスタンプ付きの行は、以前の形式の生データのときだけ来る"""
         body, summary_block = self._split_summary(text)
         if summary_block:
             self._summary_buffer.append(summary_block)
+        self._chunk_texts.append(body)
 
-        offset = self.transcription.last_timestamp_sec
         last_sec_in_chunk = 0
         out_lines: list[str] = []
 
         if self.output_options.timestamp:
             for line in body.splitlines():
-                m = re.match(r"^\[(\d{1,2}):(\d{2})\]\s*(.*)$", line)
+                m = _TIMESTAMP_LINE.match(line)
                 if m:
                     minutes, seconds, rest = int(m.group(1)), int(m.group(2)), m.group(3)
                     sec = minutes * 60 + seconds
                     last_sec_in_chunk = max(last_sec_in_chunk, sec)
-                    total = offset + sec
-                    timestamp = str(datetime.timedelta(seconds=total))
+                    total = self._source_sec(offset_sec + sec)
+                    timestamp = str(datetime.timedelta(seconds=int(total)))
                     out_lines.append(f"[{timestamp}] {rest}")
+                    # Gemini の時刻は秒単位なので終了時刻は持たない
+                    self.transcription.add_segment(total, None, rest)
                 else:
                     out_lines.append(line)
             shifted = "\n".join(out_lines).rstrip() + "\n"
         else:
             shifted = body.rstrip() + "\n"
 
-        self.transcription.add_transcription(shifted, offset + last_sec_in_chunk)
+        self.transcription.add_transcription(shifted, int(offset_sec) + last_sec_in_chunk)
 
     def _split_summary(self, text: str) -> tuple[str, str]:
-        """本文と要約セクションを分離する"""
+        """本文と要約セクションを分離する（分割ファイルごとに要約させていた頃の生データ用）"""
         if not self.output_options.summary:
             return text, ""
 
-        marker = "--- SUMMARY ---"
-        idx = text.find(marker)
+        idx = text.find(SUMMARY_MARKER)
         if idx == -1:
             return text, ""
         return text[:idx].rstrip(), text[idx:].strip()
 
     def finalize(self) -> str:
         """全分割ファイル処理後に呼び出し、要約セクションを末尾に追加する"""
-        if not self._summary_buffer:
+        self._release_instruction_cache()
+        if not self.output_options.summary:
+            return self.transcription.transcription
+
+        if not self.transcription.summary:
+            if self._summary_buffer:
+                self.transcription.summary = "\n\n".join(self._summary_buffer)
+            elif not self.offline:
+                self.transcription.summary = self._summarize()
+        if not self.transcription.summary:
             return self.transcription.transcription
 
-        merged_summary = "\n\n".join(self._summary_buffer)
         if not self.transcription.transcription.endswith("\n"):
             self.transcription.transcription += "\n"
-        self.transcription.transcription += "\n" + merged_summary + "\n"
+        self.transcription.transcription += "\n" + self.transcription.summary + "\n"
         return self.transcription.transcription
 
+    def _summarize(self) -> str:
+        """文字起こしとは別に、本文だけを送って全体の要約とTODOを作る"""
+        if self.dry_run:
+            return f"{SUMMARY_MARKER}\nテスト要約。\n{ACTION_ITEMS_MARKER}\n- 特になし"
+        if self.console_out:
+            print(f"==== summarize {len(self._chunk_texts)} chunks")
+        summarizer = MapReduceSummarizer(
+            lambda instruction, text: self._counted_call(self._generate_text, instruction, text),
+            self.parallelism,
+        )
+        return summarizer.summarize(self._chunk_texts)
+
+    def _generate_text(self, instruction: str, text: str) -> str:
+        self._ensure_client()
+        assert self.client is not None
+        response = self.client.models.generate_content(model=self.model, contents=[instruction, text])
+        return (response.text or "").strip()
+
+    def _throttle_delay(self, e: Exception) -> float | None:
+        """RESOURCE_EXHAUSTED(429) に加え、混雑時の UNAVAILABLE(503) も待って再送する。
+        エラー詳細の RetryInfo.retryDelay があればそれに従う"""
+        code = getattr(e, "code", None)
+        if code == 503:
+            return DEFAULT_RETRY_AFTER_SEC
+        retry_after = super()._throttle_delay(e)
+        if retry_after is None:
+            return None
+        delay = _retry_delay_from_details(getattr(e, "details", None))
+        return delay if delay is not None else retry_after
+
+    def _request_fingerprint(self) -> dict:
+        return {
+            "model": self.model,
+            "instruction": self._build_instruction(),
+            "response_schema": SEGMENTS_SCHEMA if self.output_options.timestamp else None,
+        }
+
     def check_api_token(self) -> bool:
         try:
             self._ensure_client()
@@ -194,3 +517,20 @@ class GeminiTranscriptionCaller(BaseTranscriptionCaller):
             if "api key" in msg or "unauthenticated" in msg or "permission" in msg:
                 return False
             return True
+
+
+def _retry_delay_from_details(details) -> float | None:
+    """google.rpc.RetryInfo の retryDelay（"17s" 形式）を秒で取り出す"""
+    if not isinstance(details, dict):
+        return None
+    error = details.get("error", details)
+    for item in error.get("details", None) or []:
+        if not isinstance(item, dict):
+            continue
+        delay = item.get("retryDelay")
+        if isinstance(delay, str) and delay.endswith("s"):
+            try:
+                return float(delay[:-1])
+            except ValueError:
+                return None
+    return None
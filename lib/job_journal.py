@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import threading
+from lib.app_paths import app_data_dir
+from lib.audio_chunk import AudioChunk
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def job_id(job_key: dict) -> str:
+    """入力ファイルとリクエスト条件から、再実行しても変わらないジョブIDを作る"""
+    encoded = json.dumps(job_key, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+class JobJournal:
+    """分割ファイルごとのAPI結果（生レスポンス）を1行1件のJSONで追記していく。
+    同じ入力・同じ条件で再実行したときは、記録済みの分割ファイルをAPIに送らず結果を再利用する。
+    分割ファイルの同一性は、パスではなく中身のハッシュで判定する"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def open_for(cls, job_key: dict) -> "JobJournal":
+        return cls(os.path.join(app_data_dir("journal"), job_id(job_key) + ".jsonl"))
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で止まった最終行は捨てる
+                    continue
+                self._entries[entry["sha256"]] = entry["response"]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, chunk_hash: str) -> tuple[bool, object]:
+        with self._lock:
+            if chunk_hash in self._entries:
+                return True, self._entries[chunk_hash]
+            return False, None
+
+    def record(self, chunk: AudioChunk, chunk_hash: str, response):
+        entry = {
+            "index": chunk.index,
+            "start_sec": chunk.start_sec,
+            "sha256": chunk_hash,
+            "response": response,
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._entries[chunk_hash] = response
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def complete(self):
+        """ジョブが最後まで成功したらジャーナルを消す"""
+        with self._lock:
+            self._entries.clear()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
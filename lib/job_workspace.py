@@ -0,0 +1,167 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from configparser import ConfigParser
+from dataclasses import dataclass
+
+
+# 作業ディレクトリを残す条件
+KEEP_NEVER = "never"
+KEEP_ON_ERROR = "on_error"
+KEEP_ALWAYS = "always"
+KEEP_POLICIES = (KEEP_NEVER, KEEP_ON_ERROR, KEEP_ALWAYS)
+
+# use_tmpfs のときに作業ディレクトリを置く場所（Linux）
+TMPFS_ROOT = "/dev/shm"
+# 残すことにした作業ディレクトリに置く目印。起動時の掃除で消さない
+KEEP_MARKER = ".keep"
+# 前回の異常終了などで残った作業ディレクトリを、起動時に消すまでの経過時間（秒）
+STALE_AFTER_SEC = 24 * 60 * 60
+# 容量の上限を超えているとき、空きを確認し直す間隔（秒）
+BUDGET_POLL_SEC = 1.0
+
+
+@dataclass
+class WorkspaceSettings:
+    """config.ini の [WORKSPACE] セクション"""
+
+    root: str = ""
+    use_tmpfs: bool = False
+    keep: str = KEEP_NEVER
+    max_size_mb: int = 0
+
+
+class JobWorkspace:
+    """ジョブ1つ分の作業ディレクトリ。抽出・分割の一時ファイルはすべてこの下に作る。
+    with を抜けると、成功・失敗・キャンセルのいずれでも keep の設定に従って削除する"""
+
+    def __init__(self, manager: "WorkspaceManager", path: str, reserved_bytes: int = 0):
+        self.manager = manager
+        self.path = path
+        # 開いたときの容量の見積もり。書き出しが進む前から、この分を使用中として数える
+        self.reserved_bytes = reserved_bytes
+        self.closed = False
+
+    def __enter__(self) -> "JobWorkspace":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(failed=exc_type is not None)
+
+    def close(self, failed: bool = False):
+        if self.closed:
+            return
+        self.closed = True
+
+        keep = self.manager.settings.keep
+        if keep == KEEP_ALWAYS or (keep == KEEP_ON_ERROR and failed):
+            with open(os.path.join(self.path, KEEP_MARKER), "w", encoding="utf-8"):
+                pass
+            if sys.flags.debug:
+                print("==== keep workspace: " + self.path)
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.manager.release(self)
+
+
+class WorkspaceManager:
+    """ジョブごとの作業ディレクトリを1つのルートの下に作る。
+    max_size_mb を超えている間、新しいジョブは実行中のジョブの作業ディレクトリが消えるまで待つ"""
+
+    def __init__(self, settings: WorkspaceSettings):
+        self.settings = settings
+        self._condition = threading.Condition()
+        self._active: list[JobWorkspace] = []
+        self._swept = False
+
+    @property
+    def root(self) -> str:
+        if self.settings.root:
+            return self.settings.root
+        base = tempfile.gettempdir()
+        if self.settings.use_tmpfs and os.path.isdir(TMPFS_ROOT):
+            base = TMPFS_ROOT
+        return os.path.join(base, "snackwhisper")
+
+    def open(self, name: str, reserve_bytes: int = 0) -> JobWorkspace:
+        """name はディレクトリ名に含める目印。reserve_bytes はこのジョブが使いそうな容量の見積もり"""
+        root = self.root
+        os.makedirs(root, exist_ok=True)
+        prefix = "job_" + re.sub(r"[^0-9A-Za-z_-]", "_", name)[:32] + "_"
+
+        with self._condition:
+            if not self._swept:
+                self._sweep_stale(root)
+                self._swept = True
+            # 実行中のジョブが無ければ、上限を超える見積もりでも待たずに始める
+            while self._active and self._over_budget(reserve_bytes):
+                self._condition.wait(BUDGET_POLL_SEC)
+
+            workspace = JobWorkspace(self, tempfile.mkdtemp(prefix=prefix, dir=root), reserve_bytes)
+            self._active.append(workspace)
+        return workspace
+
+    def release(self, workspace: JobWorkspace):
+        with self._condition:
+            if workspace in self._active:
+                self._active.remove(workspace)
+            self._condition.notify_all()
+
+    def _over_budget(self, reserve_bytes: int) -> bool:
+        limit = self.settings.max_size_mb * 1024 * 1024
+        if limit <= 0:
+            return False
+        # 始まったばかりのジョブはまだほとんど書いていないので、見積もりと実際の大きい方で数える
+        used = sum(max(workspace.reserved_bytes, directory_size(workspace.path)) for workspace in self._active)
+        return used + reserve_bytes > limit
+
+    @staticmethod
+    def _sweep_stale(root: str):
+        """前回までに消し損ねた作業ディレクトリを消す（残す設定にしたものは除く）"""
+        now = time.time()
+        for entry in os.scandir(root):
+            if not entry.is_dir() or not entry.name.startswith("job_"):
+                continue
+            if os.path.exists(os.path.join(entry.path, KEEP_MARKER)):
+                continue
+            try:
+                if now - entry.stat().st_mtime > STALE_AFTER_SEC:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                pass
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for current, _dirs, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(current, filename))
+            except OSError:
+                # 書き込み中に消えたファイルは数えない
+                pass
+    return total
+
+
+_manager = WorkspaceManager(WorkspaceSettings())
+
+
+def load_workspace_settings(config: ConfigParser) -> None:
+    """config.ini の [WORKSPACE] から作業ディレクトリの設定を読み込む"""
+    section = "WORKSPACE"
+    default = WorkspaceSettings()
+    keep = config.get(section, "keep", fallback=default.keep).strip()
+    _manager.settings = WorkspaceSettings(
+        root=config.get(section, "root", fallback=default.root).strip(),
+        use_tmpfs=config.get(section, "use_tmpfs", fallback=str(default.use_tmpfs)) == "True",
+        keep=keep if keep in KEEP_POLICIES else default.keep,
+        max_size_mb=int(config.get(section, "max_size_mb", fallback=str(default.max_size_mb))),
+    )
+
+
+def open_job_workspace(name: str, reserve_bytes: int = 0) -> JobWorkspace:
+    return _manager.open(name, reserve_bytes)
@@ -5,6 +5,9 @@ from typing import List, Optional
 
 PROFILE_SECTION_PREFIX = "profile:"
 
+# 分割ファイルを同時にAPIへ送る数のデフォルト
+DEFAULT_PARALLELISM = 4
+
 
 PROVIDER_PRESETS: dict[str, list[str]] = {
     "openai": ["whisper-1", "gpt-4o-mini-transcribe", "gpt-4o-transcribe"],
@@ -13,6 +16,65 @@ PROVIDER_PRESETS: dict[str, list[str]] = {
 }
 
 
+@dataclass(frozen=True)
+class ChunkingCapability:
+    """1リクエストで送れる音声の上限と、分割するときの目安。
+    max_duration_sec が None のモデルは長さの上限なし。
+    preferred_chunk_sec より長い音声は、1つあたりの待ち時間が延びすぎないよう分割する"""
+
+    max_bytes: int
+    max_duration_sec: float | None
+    preferred_chunk_sec: float
+    max_parallelism: int
+
+    @property
+    def chunk_sec(self) -> float:
+        """分割ファイル1つあたりの長さの上限"""
+        if self.max_duration_sec is None:
+            return self.preferred_chunk_sec
+        return min(self.preferred_chunk_sec, self.max_duration_sec)
+
+
+MB = 1024 * 1024
+
+# プロバイダごとの上限と分割の目安
+CHUNKING_CAPABILITIES: dict[str, ChunkingCapability] = {
+    # Audio API はファイル 25MB まで
+    "openai": ChunkingCapability(
+        max_bytes=25 * MB, max_duration_sec=None, preferred_chunk_sec=20 * 60, max_parallelism=8
+    ),
+    # Files API は 2GB・1回の指示で 9.5 時間まで。出力トークンの上限があるので長すぎる音声は分ける
+    "google": ChunkingCapability(
+        max_bytes=2048 * MB, max_duration_sec=9.5 * 60 * 60, preferred_chunk_sec=60 * 60, max_parallelism=8
+    ),
+    # Scribe は 1GB 程度まで送れる。話者識別を通して保つため、なるべく長いまま送る
+    "elevenlabs": ChunkingCapability(
+        max_bytes=1024 * MB, max_duration_sec=8 * 60 * 60, preferred_chunk_sec=2 * 60 * 60, max_parallelism=4
+    ),
+}
+
+# モデルごとに上限が違うもの
+MODEL_CHUNKING_CAPABILITIES: dict[str, ChunkingCapability] = {
+    # gpt-4o 系の文字起こしは長さの上限がある
+    "gpt-4o-transcribe": ChunkingCapability(
+        max_bytes=25 * MB, max_duration_sec=1400, preferred_chunk_sec=20 * 60, max_parallelism=8
+    ),
+    "gpt-4o-mini-transcribe": ChunkingCapability(
+        max_bytes=25 * MB, max_duration_sec=1400, preferred_chunk_sec=20 * 60, max_parallelism=8
+    ),
+    # 出力トークンの上限が 8192 なので、1つあたり20分程度にする
+    "gemini-2.0-flash": ChunkingCapability(
+        max_bytes=2048 * MB, max_duration_sec=9.5 * 60 * 60, preferred_chunk_sec=20 * 60, max_parallelism=8
+    ),
+}
+
+
+def chunking_capability(provider: str, model: str) -> ChunkingCapability:
+    if model in MODEL_CHUNKING_CAPABILITIES:
+        return MODEL_CHUNKING_CAPABILITIES[model]
+    return CHUNKING_CAPABILITIES.get(provider, CHUNKING_CAPABILITIES["openai"])
+
+
 # プロバイダ別のデフォルトプロンプト。プロファイル新規作成時や `prompt` が空のときに使われる。
 DEFAULT_PROMPTS: dict[str, str] = {
     # OpenAI Whisper API は `prompt` を語彙ヒント（直前のコンテキスト）として使うため、
@@ -63,6 +125,14 @@ def _decode_prompt(stored: str) -> str:
     return "".join(out)
 
 
+def _parse_parallelism(stored: str) -> int:
+    """不正な値ならデフォルトに戻す。最小は1（逐次処理）"""
+    try:
+        return max(1, int(stored))
+    except ValueError:
+        return DEFAULT_PARALLELISM
+
+
 @dataclass
 class ModelProfile:
     name: str
@@ -70,6 +140,8 @@ class ModelProfile:
     model: str
     api_key: str = ""
     prompt: str = ""
+    parallelism: int = DEFAULT_PARALLELISM
+    use_cache: bool = True
 
     def is_valid(self) -> bool:
         return bool(self.name and self.provider and self.model)
@@ -101,6 +173,10 @@ class ProfileRegistry:
                 model=config.get(section, "model", fallback=""),
                 api_key=config.get(section, "api_key", fallback=""),
                 prompt=_decode_prompt(stored_prompt),
+                parallelism=_parse_parallelism(
+                    config.get(section, "parallelism", fallback=str(DEFAULT_PARALLELISM))
+                ),
+                use_cache=config.get(section, "use_cache", fallback="True") == "True",
             )
             if profile.is_valid():
                 registry.profiles.append(profile)
@@ -137,6 +213,8 @@ class ProfileRegistry:
                 "model": profile.model,
                 "api_key": profile.api_key,
                 "prompt": _encode_prompt(profile.prompt or ""),
+                "parallelism": str(profile.parallelism),
+                "use_cache": str(profile.use_cache),
             }
 
         if self.selected:
@@ -183,6 +261,8 @@ class ProfileRegistry:
             existing.model = profile.model
             existing.api_key = profile.api_key
             existing.prompt = profile.prompt
+            existing.parallelism = profile.parallelism
+            existing.use_cache = profile.use_cache
 
     def remove(self, name: str) -> None:
         existing = self.find(name)
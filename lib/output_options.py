@@ -32,6 +32,19 @@ def supports_timestamps(provider: str, model: str) -> bool:
     return False
 
 
+def unsupported_output_error(provider: str, model: str, options: "OutputOptions") -> str | None:
+    """このモデルでは作れない出力形式・オプションなら、その理由を返す。
+    APIを呼んでから描画時に失敗しないよう、音声の抽出・送信の前に確認する"""
+    if options.is_subtitle() and model not in SUBTITLE_CAPABLE_MODELS:
+        return (
+            f"{options.output_format.upper()} 形式は whisper-1 / scribe_v1 / scribe_v2 のみ対応です。"
+            f"現在のモデル「{model}」では生成できません。"
+        )
+    if options.timestamp and not supports_timestamps(provider, model):
+        return f"現在のモデル「{model}」はタイムスタンプ付きの出力に対応していません。"
+    return None
+
+
 @dataclass
 class OutputOptions:
     """文字起こし出力に付与する情報・フォーマットの設定"""
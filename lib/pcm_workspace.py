@@ -0,0 +1,307 @@
+import os
+import subprocess
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Generator, Iterable, Iterator
+import numpy as np
+from lib.ffmpeg_utils import probe_audio_format, subprocess_options
+from lib.silence_detector import SilenceDetector, ms_to_frame
+from lib.upload_encoding import UploadEncoding
+
+
+# ffmpegから一度に読む・PcmWorkspace から一度に返すPCMの長さ（秒）
+PCM_BLOCK_SEC = 10
+# PcmWorkspace の生ファイル名
+WORKSPACE_FILENAME = "pcm.s16le"
+# これより短い音声は、範囲に分けて並列にデコードしない（秒）
+PARALLEL_DECODE_MIN_SEC = 10 * 60
+
+
+class PcmWorkspace:
+    """ジョブごとに1回だけデコードした 16bit PCM を生ファイルに置き、numpy.memmap で読む。
+    静音検出・発話率・分割位置の検出・エンコードはすべてここから読むので、
+    段階ごとにデコードし直すことも、音声全体をメモリにコピーすることもない"""
+
+    def __init__(self, path: str, sample_rate: int, channels: int):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        frames = os.path.getsize(path) // (channels * 2)
+        # 長さ0のファイルは memmap できない
+        self.samples: np.ndarray = (
+            np.memmap(path, dtype=np.int16, mode="r", shape=(frames, channels))
+            if frames
+            else np.empty((0, channels), dtype=np.int16)
+        )
+
+    @classmethod
+    def decode(
+        cls,
+        input_file: str,
+        directory: str,
+        sample_rate: int | None = None,
+        channels: int | None = None,
+        duration_sec: float | None = None,
+        processes: int = 1,
+    ) -> "PcmWorkspace":
+        """input_file を directory 内の生ファイルにデコードする。
+        sample_rate/channels を省略すると元の音声のまま。
+        長さが分かっている長い音声は、範囲ごとに ffmpeg をシークさせて processes 個並列にデコードする"""
+        path = os.path.join(directory, WORKSPACE_FILENAME)
+        if processes > 1 and duration_sec is not None and duration_sec >= PARALLEL_DECODE_MIN_SEC:
+            if sample_rate is None or channels is None:
+                source_rate, source_channels = probe_audio_format(input_file)
+                sample_rate = sample_rate or source_rate
+                channels = channels or source_channels
+            decode_ranges(input_file, path, sample_rate, channels, duration_sec, processes)
+            return cls(path, sample_rate, channels)
+
+        sample_rate, channels, blocks = open_pcm_blocks(input_file, sample_rate, channels)
+        try:
+            with open(path, "wb") as f:
+                for block in blocks:
+                    f.write(block.tobytes())
+        finally:
+            blocks.close()
+        return cls(path, sample_rate, channels)
+
+    def __enter__(self) -> "PcmWorkspace":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def duration_sec(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def blocks(self, intervals: list[tuple[int, int]] | None = None) -> Iterator[np.ndarray]:
+        """PCM_BLOCK_SEC 秒ずつのブロックを返す。
+        intervals (開始ms, 終了ms) を渡すと、その区間だけをつないだ音声として返す"""
+        block_frames = self.sample_rate * PCM_BLOCK_SEC
+        if intervals is None:
+            for start in range(0, len(self.samples), block_frames):
+                yield self.samples[start:start + block_frames]
+            return
+
+        # SilenceDetector はブロックが1秒の整数倍であることを前提にするので、つないだ後でブロック長にそろえる
+        pending: list[np.ndarray] = []
+        pending_frames = 0
+        for start_ms, end_ms in intervals:
+            first = ms_to_frame(start_ms, self.sample_rate)
+            last = ms_to_frame(end_ms, self.sample_rate)
+            while first < last:
+                take = min(last - first, block_frames - pending_frames)
+                pending.append(self.samples[first:first + take])
+                pending_frames += take
+                first += take
+                if pending_frames == block_frames:
+                    yield np.concatenate(pending)
+                    pending, pending_frames = [], 0
+        if pending:
+            yield np.concatenate(pending)
+
+    def speech_intervals(self, detector: SilenceDetector) -> list[tuple[int, int]]:
+        """detector で残す区間 (開始ms, 終了ms)。閾値を変えて何度呼んでもデコードし直さない"""
+        for _kept in detector.stream(self.blocks(), self.sample_rate):
+            pass
+        return list(detector.kept_intervals)
+
+    def speech_ratio(self, intervals: list[tuple[int, int]]) -> float:
+        """音声全体のうち intervals が占める割合"""
+        total_ms = self.duration_sec * 1000
+        if total_ms <= 0:
+            return 0.0
+        return sum(end - start for start, end in intervals) / total_ms
+
+    def encode(self, output_file: str, encoding: UploadEncoding, intervals: list[tuple[int, int]] | None = None):
+        """intervals の区間（省略時は全体）をつないで送信形式にエンコードする"""
+        encode_pcm(self.blocks(intervals), output_file, self.sample_rate, self.channels, encoding)
+
+    def close(self):
+        """memmap を閉じて生ファイルを削除する"""
+        samples, self.samples = self.samples, np.empty((0, self.channels), dtype=np.int16)
+        mmap = getattr(samples, "_mmap", None)
+        del samples
+        if mmap is not None:
+            try:
+                mmap.close()
+            except BufferError:
+                # ブロックへの参照が残っている間は閉じられない。参照が消えれば解放される
+                pass
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def decode_ranges(
+    input_file: str, path: str, sample_rate: int, channels: int, duration_sec: float, processes: int
+):
+    """音声を processes 個の範囲に分け、範囲ごとの ffmpeg のデコード結果を1つの生ファイルの該当位置へ書き込む。
+    範囲の境目は1秒単位にそろえ、シーク位置とファイル上の位置がフレーム単位で一致するようにする"""
+    frame_bytes = channels * 2
+    range_sec = max(1, -(-int(duration_sec) // processes))
+    starts = list(range(0, int(duration_sec) + 1, range_sec))
+    with open(path, "wb"):
+        pass
+
+    def decode_range(index: int):
+        start_sec = starts[index]
+        # 最後の範囲は長さを指定せず、見積もりより長くても末尾まで読む
+        length = range_sec if index < len(starts) - 1 else None
+        limit = length * sample_rate if length is not None else None
+        blocks = decode_pcm_blocks(input_file, sample_rate, channels, float(start_sec), length)
+        written = 0
+        try:
+            with open(path, "r+b") as f:
+                f.seek(start_sec * sample_rate * frame_bytes)
+                for block in blocks:
+                    if limit is not None:
+                        block = block[: limit - written]
+                    f.write(block.tobytes())
+                    written += len(block)
+        finally:
+            blocks.close()
+        # 見積もりより短く終わった範囲は無音で埋め、後ろの範囲の位置をずらさない
+        if limit is not None and written < limit:
+            with open(path, "r+b") as f:
+                f.seek((start_sec * sample_rate + written) * frame_bytes)
+                f.write(bytes((limit - written) * frame_bytes))
+
+    with ThreadPoolExecutor(max_workers=processes, thread_name_prefix="decode") as executor:
+        for future in [executor.submit(decode_range, index) for index in range(len(starts))]:
+            future.result()
+
+
+def seek_args(start_sec: float | None = None, duration_sec: float | None = None) -> list[str]:
+    """入力の一部だけを読む ffmpeg の入力オプション（-i の前に置く）"""
+    args: list[str] = []
+    if start_sec is not None:
+        args += ["-ss", f"{start_sec:.3f}"]
+    if duration_sec is not None:
+        args += ["-t", f"{duration_sec:.3f}"]
+    return args
+
+
+def open_pcm_blocks(
+    input_file: str,
+    sample_rate: int | None = None,
+    channels: int | None = None,
+    start_sec: float | None = None,
+    duration_sec: float | None = None,
+) -> tuple[int, int, Generator[np.ndarray, None, None]]:
+    """(サンプリングレート, チャンネル数, PCMブロックのジェネレータ) を返す。
+    sample_rate/channels を省略すると元の音声のまま。
+    範囲指定の無い、指定どおりの 16bit の WAV はそのまま読み、それ以外は ffmpeg でデコードする"""
+    seeking = start_sec is not None or duration_sec is not None
+    if not seeking and os.path.splitext(input_file)[1].lower() == ".wav":
+        try:
+            with wave.open(input_file, "rb") as wav:
+                if (
+                    wav.getsampwidth() == 2
+                    and sample_rate in (None, wav.getframerate())
+                    and channels in (None, wav.getnchannels())
+                ):
+                    return wav.getframerate(), wav.getnchannels(), read_wav_blocks(input_file)
+        except wave.Error:
+            pass
+
+    if sample_rate is None or channels is None:
+        source_rate, source_channels = probe_audio_format(input_file)
+        sample_rate = sample_rate or source_rate
+        channels = channels or source_channels
+    return sample_rate, channels, decode_pcm_blocks(input_file, sample_rate, channels, start_sec, duration_sec)
+
+
+def read_wav_blocks(input_file: str) -> Generator[np.ndarray, None, None]:
+    """16bit の WAV を PCM_BLOCK_SEC 秒ずつ読む"""
+    with wave.open(input_file, "rb") as wav:
+        channels = wav.getnchannels()
+        block_frames = wav.getframerate() * PCM_BLOCK_SEC
+        while True:
+            data = wav.readframes(block_frames)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype=np.int16).reshape(-1, channels)
+
+
+def decode_pcm_blocks(
+    input_file: str,
+    sample_rate: int,
+    channels: int,
+    start_sec: float | None = None,
+    duration_sec: float | None = None,
+) -> Generator[np.ndarray, None, None]:
+    """ffmpeg で 16bit PCM にデコードし、PCM_BLOCK_SEC 秒ずつ (フレーム数, チャンネル数) の配列で返す"""
+    command = [
+        "ffmpeg",
+        *seek_args(start_sec, duration_sec),
+        "-i",
+        input_file,
+        "-vn",
+        "-f",
+        "s16le",
+        "-acodec",
+        "pcm_s16le",
+        "-ar",
+        str(sample_rate),
+        "-ac",
+        str(channels),
+        "pipe:1",
+        "-loglevel",
+        "quiet",
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, **subprocess_options())
+    assert process.stdout is not None
+    block_bytes = sample_rate * PCM_BLOCK_SEC * channels * 2
+
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            # 途中で切れたフレームは捨てる
+            usable = len(data) - len(data) % (channels * 2)
+            yield np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, channels)
+
+        returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command)
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+
+def encode_pcm(
+    blocks: Iterable[np.ndarray], output_file: str, sample_rate: int, channels: int, encoding: UploadEncoding
+):
+    """16bit PCM のブロックを順に ffmpeg の標準入力へ流し込み、送信形式にエンコードする"""
+    command = [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "s16le",
+        "-ar",
+        str(sample_rate),
+        "-ac",
+        str(channels),
+        "-i",
+        "pipe:0",
+        *encoding.ffmpeg_args(),
+        output_file,
+        "-loglevel",
+        "quiet",
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, **subprocess_options())
+    assert process.stdin is not None
+    try:
+        for block in blocks:
+            process.stdin.write(np.ascontiguousarray(block).tobytes())
+    finally:
+        process.stdin.close()
+        returncode = process.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, command)
@@ -0,0 +1,190 @@
+import asyncio
+import email.utils
+import hashlib
+import threading
+import time
+from configparser import ConfigParser
+from dataclasses import dataclass, replace
+
+
+@dataclass
+class ProviderQuota:
+    """プロバイダごとの上限。0 は無制限"""
+
+    requests_per_min: float = 0
+    audio_sec_per_min: float = 0
+    max_concurrency: int = 16
+
+
+# 既定の上限。アカウントのティアで実際の上限は変わるので、
+# config.ini の [RATE_LIMIT] で `<provider>_requests_per_min` などとして上書きできる
+DEFAULT_QUOTAS: dict[str, ProviderQuota] = {
+    "openai": ProviderQuota(requests_per_min=50, audio_sec_per_min=0, max_concurrency=16),
+    "google": ProviderQuota(requests_per_min=150, audio_sec_per_min=0, max_concurrency=16),
+    "elevenlabs": ProviderQuota(requests_per_min=0, audio_sec_per_min=0, max_concurrency=8),
+}
+
+# 429 で Retry-After が無いときの待ち時間（秒）
+DEFAULT_RETRY_AFTER_SEC = 5.0
+# 1分割ファイルあたりの最大試行回数
+MAX_ATTEMPTS = 6
+
+_quotas: dict[str, ProviderQuota] = dict(DEFAULT_QUOTAS)
+_schedulers: dict[tuple[str, str], "RateLimitScheduler"] = {}
+_registry_lock = threading.Lock()
+
+
+def load_quotas(config: ConfigParser) -> None:
+    """config.ini の [RATE_LIMIT] からプロバイダ別の上限を読み込む"""
+    section = "RATE_LIMIT"
+    for provider, default in DEFAULT_QUOTAS.items():
+        _quotas[provider] = replace(
+            default,
+            requests_per_min=float(
+                config.get(section, f"{provider}_requests_per_min", fallback=str(default.requests_per_min))
+            ),
+            audio_sec_per_min=float(
+                config.get(section, f"{provider}_audio_sec_per_min", fallback=str(default.audio_sec_per_min))
+            ),
+            max_concurrency=int(
+                config.get(section, f"{provider}_max_concurrency", fallback=str(default.max_concurrency))
+            ),
+        )
+
+
+def get_scheduler(provider: str, api_key: str) -> "RateLimitScheduler":
+    """プロバイダ+APIキーごとに共有されるスケジューラを返す。
+    同じキーを使う複数ジョブは、同じ上限の中で送信枠を分け合う"""
+    key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    with _registry_lock:
+        scheduler = _schedulers.get((provider, key_hash))
+        if scheduler is None:
+            scheduler = RateLimitScheduler(_quotas.get(provider, ProviderQuota()))
+            _schedulers[(provider, key_hash)] = scheduler
+        return scheduler
+
+
+class TokenBucket:
+    """1分あたり per_min だけ補充されるトークンバケット。ロックは呼び出し側で取る"""
+
+    def __init__(self, per_min: float):
+        self.capacity = per_min
+        self.rate = per_min / 60.0
+        self.tokens = per_min
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を取り出せるまでの秒数。0 なら今すぐ取り出せる"""
+        self._refill(now)
+        # バケット容量を超える要求は、満タンになった時点で通す
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimitScheduler:
+    """リクエスト数/分・音声秒数/分のトークンバケットと、
+    429 に応じて同時実行数を増減する AIMD（1枠ずつ増やし、スロットリングで半減）を組み合わせる。
+    スレッドと asyncio の両方から使えるよう、判定はロック内の非ブロッキング処理にまとめている"""
+
+    def __init__(self, quota: ProviderQuota):
+        self.quota = quota
+        self.max_concurrency = max(1, quota.max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.request_bucket = TokenBucket(quota.requests_per_min) if quota.requests_per_min > 0 else None
+        self.audio_bucket = TokenBucket(quota.audio_sec_per_min) if quota.audio_sec_per_min > 0 else None
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    def _try_acquire(self, audio_sec: float) -> float:
+        """枠が取れたら 0 を返す。取れなければ再試行までの秒数を返す"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= int(self.limit):
+            return 0.5
+
+        wait = 0.0
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.audio_bucket is not None:
+            wait = max(wait, self.audio_bucket.wait_time(audio_sec, now))
+        if wait > 0:
+            return wait
+
+        if self.request_bucket is not None:
+            self.request_bucket.take(1)
+        if self.audio_bucket is not None:
+            self.audio_bucket.take(audio_sec)
+        self.in_flight += 1
+        return 0.0
+
+    @property
+    def needs_audio_sec(self) -> bool:
+        return self.audio_bucket is not None
+
+    def acquire(self, audio_sec: float = 0.0):
+        with self._released:
+            while True:
+                wait = self._try_acquire(audio_sec)
+                if wait == 0:
+                    return
+                self._released.wait(timeout=wait)
+
+    async def acquire_async(self, audio_sec: float = 0.0):
+        while True:
+            with self._lock:
+                wait = self._try_acquire(audio_sec)
+            if wait == 0:
+                return
+            await asyncio.sleep(min(wait, 1.0))
+
+    def release(self, throttled: bool = False, retry_after: float | None = None, failed: bool = False):
+        """枠を返す。成功なら枠数を少し増やし、スロットリングなら半減する。
+        それ以外の失敗や中断（failed=True）は混み具合と関係ないので枠数を変えない"""
+        with self._released:
+            self.in_flight -= 1
+            if throttled:
+                # Multiplicative decrease: 同時実行数を半分にし、Retry-After の間は全体を止める
+                self.limit = max(1.0, self.limit / 2)
+                delay = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER_SEC
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            elif not failed:
+                # Additive increase: 現在の枠数ぶん成功したら1枠増える
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._released.notify_all()
+
+
+def parse_retry_after(headers) -> float | None:
+    """Retry-After / retry-after-ms ヘッダを秒に変換する"""
+    if headers is None:
+        return None
+    try:
+        value_ms = headers.get("retry-after-ms")
+        if value_ms:
+            return float(value_ms) / 1000
+        value = headers.get("retry-after")
+    except AttributeError:
+        return None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # HTTP-date 形式
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time())
@@ -0,0 +1,63 @@
+import datetime
+import json
+import os
+from lib.model_profile import ModelProfile
+
+
+# 文字起こし結果の横に保存する生データのファイル名末尾と形式
+RAW_POSTFIX = "_raw"
+RAW_FORMAT = "snackwhisper-raw/1"
+
+
+def build_raw_document(
+    source_file: str,
+    profile: ModelProfile,
+    language: str,
+    rendered_chunks: list[dict],
+    summary: str = "",
+) -> dict:
+    """分割ファイルごとのAPIレスポンスを、出力形式を作り直せる形でまとめる。
+    要約はAPIを呼ばずに作り直せないので、あれば一緒に保存する"""
+    document = {
+        "format": RAW_FORMAT,
+        "source_file": os.path.basename(source_file),
+        "provider": profile.provider,
+        "model": profile.model,
+        "language": language,
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "chunks": rendered_chunks,
+    }
+    if summary:
+        document["summary"] = summary
+    return document
+
+
+def is_raw_response_file(path: str) -> bool:
+    """build_raw_document で保存したファイルか（中身の形式まで確認する）"""
+    if not path.endswith(RAW_POSTFIX + ".json") or not os.path.isfile(path):
+        return False
+    try:
+        return load_raw_document(path) is not None
+    except ValueError:
+        return False
+
+
+def load_raw_document(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            document = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"生データを読み込めません: {e}") from e
+
+    if not isinstance(document, dict) or document.get("format") != RAW_FORMAT:
+        raise ValueError(f"対応していない生データです: {os.path.basename(path)}")
+    return document
+
+
+def raw_document_profile(document: dict) -> ModelProfile:
+    """生データを作ったときのプロバイダ/モデル。作り直しにAPIキーは不要"""
+    return ModelProfile(
+        name=f"{document['provider']}/{document['model']}",
+        provider=document["provider"],
+        model=document["model"],
+    )
@@ -4,6 +4,7 @@ from typing import Callable, Optional
 
 from lib.about_dialog import AboutDialog
 from lib.model_profile import (
+    DEFAULT_PARALLELISM,
     DEFAULT_PROMPTS,
     PROVIDER_PRESETS,
     ModelProfile,
@@ -137,9 +138,21 @@ class SettingsDialog:
             row=3, column=1, **field_opts
         )
 
+        ttk.Label(form, text="並列数").grid(row=4, column=0, **label_opts)
+        self.parallelism_var = tk.StringVar(value=str(DEFAULT_PARALLELISM))
+        parallel_row = ttk.Frame(form)
+        parallel_row.grid(row=4, column=1, sticky="w", pady=4)
+        ttk.Spinbox(parallel_row, textvariable=self.parallelism_var, from_=1, to=16, width=6).pack(
+            side=tk.LEFT
+        )
+        self.use_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            parallel_row, text="同じ音声の結果を再利用する（キャッシュ）", variable=self.use_cache_var
+        ).pack(side=tk.LEFT, padx=(16, 0))
+
         # プロンプト欄（ヘッダ + Text + 「デフォルトに戻す」）
         prompt_header = ttk.Frame(form)
-        prompt_header.grid(row=4, column=0, columnspan=2, sticky="ew", pady=(8, 2))
+        prompt_header.grid(row=5, column=0, columnspan=2, sticky="ew", pady=(8, 2))
         prompt_header.columnconfigure(0, weight=1)
         ttk.Label(prompt_header, text="プロンプト", style="Section.TLabel").grid(row=0, column=0, sticky="w")
         ttk.Button(
@@ -149,7 +162,7 @@ class SettingsDialog:
         ).grid(row=0, column=1, sticky="e")
 
         prompt_box = ttk.Frame(form)
-        prompt_box.grid(row=5, column=0, columnspan=2, sticky="nsew", pady=(0, 4))
+        prompt_box.grid(row=6, column=0, columnspan=2, sticky="nsew", pady=(0, 4))
         prompt_box.columnconfigure(0, weight=1)
         prompt_box.rowconfigure(0, weight=1)
 
@@ -171,7 +184,7 @@ class SettingsDialog:
         self.prompt_text.config(yscrollcommand=prompt_scroll.set)
 
         form_btns = ttk.Frame(form)
-        form_btns.grid(row=6, column=0, columnspan=2, pady=(8, 0), sticky="e")
+        form_btns.grid(row=7, column=0, columnspan=2, pady=(8, 0), sticky="e")
         ttk.Button(form_btns, text="このプロファイルを保存", command=self._on_apply).pack(side=tk.LEFT)
 
         # 下部: About / OK / キャンセル
@@ -219,6 +232,8 @@ class SettingsDialog:
         self.model_combo.config(values=PROVIDER_PRESETS.get(profile.provider, []))
         self.model_var.set(profile.model)
         self.api_key_var.set(profile.api_key)
+        self.parallelism_var.set(str(profile.parallelism))
+        self.use_cache_var.set(profile.use_cache)
         # 空ならプロバイダのデフォルトを表示
         prompt = profile.prompt if profile.prompt else DEFAULT_PROMPTS.get(profile.provider, "")
         self._set_prompt_text(prompt)
@@ -230,6 +245,8 @@ class SettingsDialog:
         self.model_combo.config(values=PROVIDER_PRESETS["openai"])
         self.model_var.set("")
         self.api_key_var.set("")
+        self.parallelism_var.set(str(DEFAULT_PARALLELISM))
+        self.use_cache_var.set(True)
         self._set_prompt_text(DEFAULT_PROMPTS.get("openai", ""))
 
     def _on_provider_change(self, _event):
@@ -284,9 +301,22 @@ class SettingsDialog:
         if not model:
             messagebox.showerror("入力エラー", "モデルを入力または選択してください。", parent=self.window)
             return None
+        try:
+            parallelism = int(self.parallelism_var.get().strip())
+        except ValueError:
+            parallelism = 0
+        if parallelism < 1:
+            messagebox.showerror("入力エラー", "並列数は1以上の整数で入力してください。", parent=self.window)
+            return None
 
         return ModelProfile(
-            name=name, provider=provider, model=model, api_key=api_key, prompt=prompt
+            name=name,
+            provider=provider,
+            model=model,
+            api_key=api_key,
+            prompt=prompt,
+            parallelism=parallelism,
+            use_cache=self.use_cache_var.get(),
         )
 
     def _on_apply(self):
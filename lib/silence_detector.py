@@ -0,0 +1,237 @@
+import math
+from typing import Iterable, Iterator
+import numpy as np
+
+
+# pydub.silence.split_on_silence に渡していた値
+SILENCE_THRESH_DBFS = -55
+MIN_SILENCE_MS = 100
+KEEP_SILENCE_MS = 100
+
+# 16bit PCM の最大振幅
+_MAX_AMPLITUDE = 32768
+# 二乗和を計算する単位（ミリ秒）。float64 の一時配列が大きくなりすぎないよう区切る
+_BLOCK_MS = 60_000
+
+
+class SilenceDetector:
+    """16bit PCM から発話区間（ミリ秒）を求める。
+    pydub の split_on_silence と同じく、min_silence_ms の窓を1msずつずらして RMS が閾値以下なら無音とみなし、
+    発話区間の前後に keep_silence_ms の余白を付ける。重なった区間はつなげて返す"""
+
+    def __init__(
+        self,
+        silence_thresh_dbfs: float = SILENCE_THRESH_DBFS,
+        min_silence_ms: int = MIN_SILENCE_MS,
+        keep_silence_ms: int = KEEP_SILENCE_MS,
+    ):
+        self.min_silence_ms = min_silence_ms
+        self.keep_silence_ms = keep_silence_ms
+        # pydub は切り捨てた整数の RMS と閾値を比べるので、
+        # 「RMS < floor(閾値) + 1」を「二乗和 < (floor(閾値) + 1)^2 * サンプル数」として比べる
+        threshold = math.floor(_MAX_AMPLITUDE * 10 ** (silence_thresh_dbfs / 20)) + 1
+        self.threshold_power = float(threshold * threshold)
+        # 直近の stream() で読んだ長さと残した長さ（ms）、残した区間 (開始ms, 終了ms)
+        self.total_ms = 0
+        self.kept_ms = 0
+        self.kept_intervals: list[tuple[int, int]] = []
+
+    def speech_intervals(self, samples: np.ndarray, sample_rate: int) -> list[tuple[int, int]]:
+        """samples は (フレーム数, チャンネル数) の int16 配列。
+        戻り値は残す区間 (開始ms, 終了ms) のリスト"""
+        power, counts = ms_power(samples, sample_rate)
+        return self.intervals_from_power(power, counts)
+
+    def intervals_from_power(self, power: np.ndarray, counts: np.ndarray) -> list[tuple[int, int]]:
+        """1msごとの二乗和とサンプル数から、残す区間を求める"""
+        total_ms = len(power)
+        if total_ms < self.min_silence_ms:
+            return [(0, total_ms)] if total_ms > 0 else []
+
+        window = self.min_silence_ms
+        power_sum = np.concatenate(([0.0], np.cumsum(power)))
+        count_sum = np.concatenate(([0], np.cumsum(counts)))
+        window_power = power_sum[window:] - power_sum[:-window]
+        window_count = count_sum[window:] - count_sum[:-window]
+        silent = window_power < self.threshold_power * window_count
+
+        # 無音窓の連続を (開始ms, 終了ms) にまとめる
+        edges = np.diff(silent.astype(np.int8), prepend=0, append=0)
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1) - 1 + window
+
+        # 無音区間の隙間が発話区間
+        speech_starts = np.concatenate(([0], run_ends))
+        speech_ends = np.concatenate((run_starts, [total_ms]))
+        keep = speech_ends > speech_starts
+        speech_starts = speech_starts[keep]
+        speech_ends = speech_ends[keep]
+
+        intervals: list[tuple[int, int]] = []
+        for start, end in zip(speech_starts.tolist(), speech_ends.tolist()):
+            start = max(0, start - self.keep_silence_ms)
+            end = min(total_ms, end + self.keep_silence_ms)
+            if intervals and start <= intervals[-1][1]:
+                intervals[-1] = (intervals[-1][0], end)
+            else:
+                intervals.append((start, end))
+        return intervals
+
+
+    def stream(self, blocks: Iterable[np.ndarray], sample_rate: int) -> Iterator[np.ndarray]:
+        """speech_intervals の逐次版。PCMブロックを受け取りながら、残す部分を順に返す。
+        判定に必要な前後 (keep_silence_ms + min_silence_ms) ms 分だけを保持するので、
+        入力がどれだけ長くても使うメモリは一定。
+        blocks の各ブロックは1秒の整数倍の長さであること（最後のブロックを除く）"""
+        context_ms = self.keep_silence_ms + self.min_silence_ms - 1
+        self.total_ms = 0
+        self.kept_ms = 0
+        self.kept_intervals = []
+
+        # 判定前のPCMと、その前の判定済み context_ms 分の二乗和（先頭の ms は base_ms）
+        pcm: np.ndarray | None = None
+        power = np.empty(0, dtype=np.float64)
+        counts = np.empty(0, dtype=np.int64)
+        base_ms = 0
+        decided_ms = 0
+
+        def emit(end_ms: int) -> Iterator[np.ndarray]:
+            nonlocal pcm
+            assert pcm is not None
+            keep = self._keep_mask(power, counts, decided_ms - base_ms, end_ms - base_ms)
+            pcm_start = ms_to_frame(decided_ms, sample_rate)
+            edges = np.diff(keep.astype(np.int8), prepend=0, append=0)
+            for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                self.kept_ms += int(end - start)
+                self._add_kept(decided_ms + int(start), decided_ms + int(end))
+                first = ms_to_frame(decided_ms + int(start), sample_rate) - pcm_start
+                last = ms_to_frame(decided_ms + int(end), sample_rate) - pcm_start
+                yield pcm[first:last]
+            pcm = pcm[ms_to_frame(end_ms, sample_rate) - pcm_start:]
+
+        for block in blocks:
+            if len(block) == 0:
+                continue
+            block_power, block_counts = ms_power(block, sample_rate)
+            power = np.concatenate((power, block_power))
+            counts = np.concatenate((counts, block_counts))
+            pcm = block if pcm is None else np.concatenate((pcm, block))
+            self.total_ms += len(block_power)
+
+            # 後ろ context_ms 分はまだ後続の音声次第なので判定しない
+            end_ms = self.total_ms - context_ms
+            if end_ms <= decided_ms:
+                continue
+            yield from emit(end_ms)
+            decided_ms = end_ms
+
+            # 次の判定に必要な分だけ残す
+            drop = max(0, decided_ms - context_ms - base_ms)
+            power = power[drop:]
+            counts = counts[drop:]
+            base_ms += drop
+
+        if pcm is not None and self.total_ms > decided_ms:
+            yield from emit(self.total_ms)
+
+    def _add_kept(self, start_ms: int, end_ms: int):
+        # ブロックの境目で分かれた区間はつなげる
+        if self.kept_intervals and self.kept_intervals[-1][1] == start_ms:
+            self.kept_intervals[-1] = (self.kept_intervals[-1][0], end_ms)
+        else:
+            self.kept_intervals.append((start_ms, end_ms))
+
+    def silences(self, blocks: Iterable[np.ndarray], sample_rate: int) -> list[tuple[int, int]]:
+        """min_silence_ms 以上続く無音区間 (開始ms, 終了ms) を返す。
+        PCMブロックは読み捨てていくので、入力の長さによらず使うメモリは一定"""
+        window = self.min_silence_ms
+        ranges: list[tuple[int, int]] = []
+        power = np.empty(0, dtype=np.float64)
+        counts = np.empty(0, dtype=np.int64)
+        base_ms = 0
+
+        for block in blocks:
+            if len(block) == 0:
+                continue
+            block_power, block_counts = ms_power(block, sample_rate)
+            power = np.concatenate((power, block_power))
+            counts = np.concatenate((counts, block_counts))
+            if len(power) < window:
+                continue
+
+            power_sum = np.concatenate(([0.0], np.cumsum(power)))
+            count_sum = np.concatenate(([0], np.cumsum(counts)))
+            silent = (
+                power_sum[window:] - power_sum[:-window]
+                < self.threshold_power * (count_sum[window:] - count_sum[:-window])
+            )
+            edges = np.diff(silent.astype(np.int8), prepend=0, append=0)
+            for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                # 開始位置 start..end-1 の窓が無音 = start から end-1+window までが無音
+                start_ms = base_ms + int(start)
+                end_ms = base_ms + int(end) - 1 + window
+                if ranges and start_ms <= ranges[-1][1]:
+                    ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end_ms))
+                else:
+                    ranges.append((start_ms, end_ms))
+
+            # 窓の開始位置として未評価の、末尾 window - 1 ms 分だけ残す
+            drop = len(silent)
+            power = power[drop:]
+            counts = counts[drop:]
+            base_ms += drop
+
+        return ranges
+
+    def _keep_mask(self, power: np.ndarray, counts: np.ndarray, start: int, end: int) -> np.ndarray:
+        """power[start:end] の各 ms を残すかどうか。
+        power の前後には判定に必要な分（入力の末尾でなければ後ろに context_ms 分）が含まれていること"""
+        window = self.min_silence_ms
+        total = len(power)
+
+        # 無音窓（開始位置 i から window ms）で覆われた ms が無音
+        covered = np.zeros(total + 1, dtype=np.int64)
+        if total >= window:
+            power_sum = np.concatenate(([0.0], np.cumsum(power)))
+            count_sum = np.concatenate(([0], np.cumsum(counts)))
+            silent = (
+                power_sum[window:] - power_sum[:-window]
+                < self.threshold_power * (count_sum[window:] - count_sum[:-window])
+            ).astype(np.int64)
+            covered[: len(silent)] += silent
+            covered[window: window + len(silent)] -= silent
+        speech = np.cumsum(covered[:total]) == 0
+
+        # 発話の前後 keep_silence_ms 以内を残す
+        speech_sum = np.concatenate(([0], np.cumsum(speech)))
+        positions = np.arange(start, end)
+        lower = np.clip(positions - self.keep_silence_ms, 0, total)
+        upper = np.clip(positions + self.keep_silence_ms + 1, 0, total)
+        return speech_sum[upper] - speech_sum[lower] > 0
+
+
+def ms_power(samples: np.ndarray, sample_rate: int) -> tuple[np.ndarray, np.ndarray]:
+    """1msごとの二乗和（全チャンネル合計）とサンプル数を返す"""
+    frames = len(samples)
+    total_ms = -(-frames * 1000 // sample_rate)
+    boundaries = np.minimum(np.arange(total_ms + 1, dtype=np.int64) * sample_rate // 1000, frames)
+    channels = samples.shape[1] if samples.ndim > 1 else 1
+
+    power = np.empty(total_ms, dtype=np.float64)
+    for block_start in range(0, total_ms, _BLOCK_MS):
+        block_end = min(total_ms, block_start + _BLOCK_MS)
+        first, last = boundaries[block_start], boundaries[block_end]
+        block = samples[first:last].astype(np.float64)
+        frame_power = (block * block).reshape(last - first, -1).sum(axis=1)
+        power[block_start:block_end] = np.add.reduceat(
+            frame_power, boundaries[block_start:block_end] - first
+        )
+
+    counts = np.diff(boundaries) * channels
+    # サンプル数 0 の ms（reduceat は隣の値を返す）は無音扱い
+    power[counts == 0] = 0.0
+    return power, counts
+
+
+def ms_to_frame(ms: int, sample_rate: int) -> int:
+    return ms * sample_rate // 1000
@@ -0,0 +1,69 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+# 1回の要約に渡す文字起こしの文字数の目安。短い分割ファイルはこの長さまでまとめて1回で要約する
+MAP_MAX_CHARS = 40_000
+# 部分ごとの要約メモを、1回の集約でいくつまでまとめるか
+REDUCE_FANIN = 8
+
+SUMMARY_MARKER = "--- SUMMARY ---"
+ACTION_ITEMS_MARKER = "--- ACTION ITEMS ---"
+
+MAP_INSTRUCTION = (
+    "以下は音声の文字起こしの一部です。この部分で話された内容の要点を箇条書きで書き出し、"
+    "TODO・決定事項があれば `TODO:` で始まる箇条書きで書き出してください。"
+    "前置きや解説は付けず、結果のみを出力してください。"
+)
+REDUCE_INSTRUCTION = (
+    "以下は音声の文字起こしを部分ごとに要約したメモです。重複をまとめて1つのメモにしてください。"
+    "要点は箇条書きで、TODO・決定事項は `TODO:` で始まる箇条書きで、漏れなく残してください。"
+    "前置きや解説は付けず、結果のみを出力してください。"
+)
+FINAL_INSTRUCTION = (
+    "以下は音声の文字起こし、またはそれを部分ごとに要約したメモです。全体について次の形式で出力してください:\n"
+    f"  `{SUMMARY_MARKER}` 行の下に3〜5行の要約\n"
+    f"  `{ACTION_ITEMS_MARKER}` 行の下にTODO・決定事項を箇条書き（無ければ「特になし」）\n"
+    "前置きや解説、Markdownのコードフェンスは付けず、結果のみを出力してください。"
+)
+
+
+class MapReduceSummarizer:
+    """文字起こし本文から、全体で1つの要約とTODOを作る。
+    分割ファイルごとのテキストを並列に要約し（map）、REDUCE_FANIN 個ずつ段階的にまとめ直してから（reduce）、
+    最後に要約とTODOの形式で出力させる。generate(指示文, テキスト) はテキストだけのリクエストを送って応答を返す"""
+
+    def __init__(self, generate: Callable[[str, str], str], parallelism: int = 1):
+        self.generate = generate
+        self.parallelism = max(1, parallelism)
+
+    def summarize(self, texts: list[str]) -> str:
+        parts = pack_texts([text.strip() for text in texts if text.strip()], MAP_MAX_CHARS)
+        if not parts:
+            return ""
+        # 1回で読める長さなら、文字起こしから直接まとめる
+        if len(parts) > 1:
+            parts = self._map(MAP_INSTRUCTION, parts)
+            while len(parts) > REDUCE_FANIN:
+                groups = [parts[i: i + REDUCE_FANIN] for i in range(0, len(parts), REDUCE_FANIN)]
+                parts = self._map(REDUCE_INSTRUCTION, ["\n\n".join(group) for group in groups])
+        return self.generate(FINAL_INSTRUCTION, "\n\n".join(parts)).strip()
+
+    def _map(self, instruction: str, texts: list[str]) -> list[str]:
+        """texts をそれぞれ並列に要約し、元の順番で返す"""
+        if len(texts) == 1 or self.parallelism == 1:
+            return [self.generate(instruction, text).strip() for text in texts]
+        workers = min(self.parallelism, len(texts))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summary") as executor:
+            return [result.strip() for result in executor.map(lambda text: self.generate(instruction, text), texts)]
+
+
+def pack_texts(texts: list[str], max_chars: int) -> list[str]:
+    """隣り合うテキストを、合計が max_chars を超えない範囲でつなげる（1つで超えるものはそのまま）"""
+    packed: list[str] = []
+    for text in texts:
+        if packed and len(packed[-1]) + len(text) + 2 <= max_chars:
+            packed[-1] += "\n\n" + text
+        else:
+            packed.append(text)
+    return packed
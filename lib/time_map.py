@@ -0,0 +1,52 @@
+import bisect
+
+
+class TimeMap:
+    """静音除去後の音声の時刻を、元の音声の時刻に戻すための対応表。
+    残した区間ごとに (除去後の開始秒, 元音声の開始秒, 長さ秒) を持つ"""
+
+    def __init__(self, ranges: list[tuple[float, float, float]]):
+        self.ranges = ranges
+        self._output_starts = [output_start for output_start, _source_start, _length in ranges]
+
+    @classmethod
+    def from_kept_ms(cls, kept_ms: list[tuple[int, int]], sample_rate: int) -> "TimeMap":
+        """残した区間 (開始ms, 終了ms) から作る。除去後の音声はこれらをフレーム単位でつないだもの"""
+        ranges: list[tuple[float, float, float]] = []
+        output_frames = 0
+        for start_ms, end_ms in kept_ms:
+            first = start_ms * sample_rate // 1000
+            last = end_ms * sample_rate // 1000
+            ranges.append((output_frames / sample_rate, first / sample_rate, (last - first) / sample_rate))
+            output_frames += last - first
+        return cls(ranges)
+
+    @classmethod
+    def from_list(cls, ranges: list) -> "TimeMap":
+        return cls([(float(a), float(b), float(c)) for a, b, c in ranges])
+
+    def to_list(self) -> list[list[float]]:
+        return [[round(value, 6) for value in entry] for entry in self.ranges]
+
+    @property
+    def output_duration(self) -> float:
+        """静音除去後の音声の長さ（秒）"""
+        return sum(length for _output_start, _source_start, length in self.ranges)
+
+    def shifted(self, offset_sec: float) -> "TimeMap":
+        """除去後・元音声の両方の時刻を offset_sec ずらした対応表"""
+        return TimeMap([
+            (output_start + offset_sec, source_start + offset_sec, length)
+            for output_start, source_start, length in self.ranges
+        ])
+
+    def to_source(self, output_sec: float) -> float:
+        if not self.ranges:
+            return output_sec
+        index = max(0, bisect.bisect_right(self._output_starts, output_sec) - 1)
+        output_start, source_start, length = self.ranges[index]
+        within = output_sec - output_start
+        # 最後の区間より後ろ（エンコーダの端数など）はそのまま延ばす
+        if index < len(self.ranges) - 1:
+            within = min(within, length)
+        return source_start + within
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from configparser import ConfigParser
+from lib.app_paths import app_data_dir
+
+
+# キャッシュ全体の上限サイズ（MB）と保持日数のデフォルト
+DEFAULT_MAX_SIZE_MB = 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+def cache_key(chunk_hash: str, provider: str, fingerprint: dict) -> str:
+    """分割ファイルの中身のハッシュと、リクエスト条件からキャッシュキーを作る"""
+    encoded = json.dumps(
+        {"audio": chunk_hash, "provider": provider, "request": fingerprint},
+        sort_keys=True,
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class TranscriptionCache:
+    """APIの生レスポンスを、音声の中身とリクエスト条件のハッシュをキーにディスクへ保存する。
+    ファイルの更新日時を最終利用日時として使い、古いものから消していく（LRU）"""
+
+    def __init__(self, root: str, max_bytes: int, max_age_sec: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+
+    @classmethod
+    def load(cls, config: ConfigParser) -> "TranscriptionCache":
+        """config.ini の [CACHE] から上限を読み込む"""
+        max_size_mb = float(config.get("CACHE", "max_size_mb", fallback=str(DEFAULT_MAX_SIZE_MB)))
+        max_age_days = float(config.get("CACHE", "max_age_days", fallback=str(DEFAULT_MAX_AGE_DAYS)))
+        return cls(
+            app_data_dir("cache"),
+            max_bytes=int(max_size_mb * 1024 * 1024),
+            max_age_sec=max_age_days * 24 * 3600,
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".json")
+
+    def get(self, key: str) -> tuple[bool, object]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                response = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False, None
+
+        # 使われたエントリは新しい扱いにする
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return True, response
+
+    def put(self, key: str, response):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書きかけのファイルを読まれないよう、一時ファイルに書いてから置き換える
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(response, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def evict(self):
+        """保持日数を過ぎたものを消し、さらに上限サイズを超えていれば古いものから消す"""
+        now = time.time()
+        entries: list[tuple[float, int, str]] = []
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime > self.max_age_sec:
+                    _unlink_quietly(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _mtime, size, _path in entries)
+        for _mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _unlink_quietly(path)
+            total -= size
+
+
+def _unlink_quietly(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
@@ -1,28 +1,57 @@
+import asyncio
+import dataclasses
 import datetime
 import json
 import os
-import re
+import subprocess
 import sys
-from typing import Callable
+from typing import TYPE_CHECKING, Callable, Iterator
 from lib.debug_options import DebugOptions
-from lib.status_bar import StatusBar
 from lib.constants import DEFAULT_SETTINGS, ButtonState
-from lib.audio_silencer import AudioSilencer
+from lib.audio_chunk import AudioChunk
+from lib.audio_silencer import DEFAULT_EXTRACT_PROCESSES, AudioSilencer
+from lib.audio_splitter import silence_map
 from lib.base_caller import BaseTranscriptionCaller
 from lib.whisper_caller import WhisperTranscriptionCaller
 from lib.gemini_caller import GeminiTranscriptionCaller
 from lib.elevenlabs_caller import ElevenLabsTranscriptionCaller
+from lib.ffmpeg_utils import MediaInfo, probe_media
+from lib.job_journal import JobJournal
+from lib.job_workspace import JobWorkspace, open_job_workspace
+from lib.transcription_cache import TranscriptionCache
 from lib.model_profile import ModelProfile
-from lib.output_options import FORMAT_JSON, FORMAT_MD, OutputOptions
+from lib.output_options import FORMAT_JSON, FORMAT_MD, OutputOptions, unsupported_output_error
+from lib.rate_limiter import get_scheduler
+from lib.upload_encoding import UploadEncoding, can_send_as_is, stream_copy_encoding, upload_encoding_for
+from lib.raw_response import (
+    RAW_POSTFIX,
+    build_raw_document,
+    is_raw_response_file,
+    load_raw_document,
+    raw_document_profile,
+)
 from threading import Thread
 
+if TYPE_CHECKING:
+    # StatusBar は tkinter に依存するため、GUIなしのバッチ実行では読み込まない
+    from lib.status_bar import StatusBar
 
-_TS_LINE = re.compile(r"^\[(?:(\d+):)?(\d{1,2}):(\d{2})\]\s*(.*)$")
 
+# 作業ディレクトリの容量の見積もりで、元の音声のサンプリングレート・チャンネル数が分からないときに使う値
+PCM_FALLBACK_SAMPLE_RATE = 48000
+PCM_FALLBACK_CHANNELS = 2
 
-def format_output_text(transcription_text: str, options: OutputOptions, profile: ModelProfile, source_file: str) -> str:
+
+def format_output_text(
+    transcription_text: str,
+    options: OutputOptions,
+    profile: ModelProfile,
+    source_file: str,
+    segments: list[dict] | None = None,
+) -> str:
     """出力形式に応じて最終的に書き出すテキストを組み立てる。
-    SRT/VTT は caller 側で完成済みなのでそのまま返す。"""
+    SRT/VTT は caller 側で完成済みなのでそのまま返す。
+    segments は caller が記録した区間で、JSON の segments にそのまま使う（本文から読み取り直さない）"""
 
     if options.output_format == FORMAT_MD:
         header = (
@@ -49,27 +78,22 @@ def format_output_text(transcription_text: str, options: OutputOptions, profile:
             "text": transcription_text,
         }
         if options.timestamp:
-            envelope["segments"] = _parse_timestamp_segments(transcription_text)
+            envelope["segments"] = _round_segments(segments or [])
         return json.dumps(envelope, ensure_ascii=False, indent=2)
 
     return transcription_text
 
 
-def _parse_timestamp_segments(text: str) -> list[dict]:
-    """`[H:MM:SS] 本文` 形式の行をセグメント配列に変換する"""
-    segments: list[dict] = []
-    for line in text.splitlines():
-        m = _TS_LINE.match(line)
-        if not m:
-            continue
-        h = int(m.group(1) or 0)
-        mm = int(m.group(2))
-        ss = int(m.group(3))
-        segments.append({
-            "start_sec": h * 3600 + mm * 60 + ss,
-            "text": m.group(4),
-        })
-    return segments
+def _round_segments(segments: list[dict]) -> list[dict]:
+    """秒数をミリ秒単位に丸める"""
+    rounded: list[dict] = []
+    for segment in segments:
+        segment = dict(segment)
+        for key in ("start_sec", "end_sec"):
+            if segment.get(key) is not None:
+                segment[key] = round(float(segment[key]), 3)
+        rounded.append(segment)
+    return rounded
 
 
 def build_caller(profile: ModelProfile, output_options: OutputOptions) -> BaseTranscriptionCaller:
@@ -82,6 +106,9 @@ def build_caller(profile: ModelProfile, output_options: OutputOptions) -> BaseTr
         caller = WhisperTranscriptionCaller(profile.api_key, timestamp_flag)
     caller.set_model(profile.model)
     caller.set_output_options(output_options)
+    # プロバイダが同時に受け付ける数を超えては送らない
+    caller.set_parallelism(min(profile.parallelism, caller.chunking().max_parallelism))
+    caller.set_scheduler(get_scheduler(profile.provider, profile.api_key))
     return caller
 
 
@@ -95,10 +122,21 @@ class TranscriptionController:
         self.language = "ja"
         self.prompt = None
         self.keep_silence_removed_files = False
+        # 出力形式を後から作り直せるよう、APIの生レスポンスを結果の横に保存する
+        self.save_raw_response = True
+        # 長い音声を範囲ごとに並列抽出するときの ffmpeg の数。1 なら1つの ffmpeg で順に分割する
+        self.extract_processes = DEFAULT_EXTRACT_PROCESSES
+        # probe_source の結果
+        self._media_info: MediaInfo | None = None
+        self._probed = False
+        # 実行中のジョブの作業ディレクトリ（open_workspace で設定）
+        self.temp_dir: str | None = None
 
         self.result_encoding = DEFAULT_SETTINGS.RESULT_ENCODING
         self.set_status_function: Callable[[str, ButtonState], None] | None = None
         self.debug_options = DebugOptions()
+        self.journal: JobJournal | None = None
+        self.cache: TranscriptionCache | None = None
 
     def set_debug_options(self, options: DebugOptions):
         self.debug_options = options
@@ -110,7 +148,10 @@ class TranscriptionController:
         if prompt is not None:
             self.prompt = prompt
 
-    def set_stauts_bar(self, statusbar: StatusBar):
+    def set_cache(self, cache: TranscriptionCache | None):
+        self.cache = cache
+
+    def set_stauts_bar(self, statusbar: "StatusBar"):
         self.status_bar = statusbar
 
     def set_status(self, message: str, button_state: ButtonState = ButtonState.NONE):
@@ -124,20 +165,9 @@ class TranscriptionController:
                 if sys.flags.debug:
                     saved_file = sleep_for_debugging()
                 else:
-                    saved_file = silence_and_transcribe()
+                    saved_file = self.run(flag_silence_removal)
             except Exception as e:
-                self.set_status(f"😫 エラーです: {e}", ButtonState.RELEASE)
-                if self.export_errorlog:
-                    self.output(
-                        self.audio_file,
-                        transcription=str(e),
-                        encoding=self.result_encoding,
-                        postfix="_errorlog",
-                        extension="txt",
-                    )
-
-                if sys.flags.debug:
-                    print(e)
+                self.handle_error(e)
                 return
 
             self.set_status("😇 ファイルを保存します")
@@ -145,66 +175,266 @@ class TranscriptionController:
             saved_file = saved_file.split("/")[-1]
             self.set_status(f"🤩 完了しました: {saved_file}", ButtonState.RELEASE)
 
-        def silence_and_transcribe():
-            self.set_status("😇 音声抽出と静音除去を処理しています…")
-
-            silenced_files: list[str] = []
-            if self.dry_run:
-                return self.output(
-                    self.audio_file,
-                    transcription="Dry Run",
-                    postfix="_dryrun",
-                    encoding=self.result_encoding,
-                    extension=self.output_options.file_extension(),
+        def sleep_for_debugging():
+            import time
+
+            time.sleep(5)
+            return "[DEBUG_MODE]"
+
+        thread = Thread(target=handling_transcribe_audio)
+        thread.start()
+
+    def run(self, flag_silence_removal: bool = False) -> str:
+        """音声抽出・静音除去・文字起こし・保存を現在のスレッドで実行し、保存先を返す"""
+        if is_raw_response_file(self.audio_file):
+            return self.rerender()
+
+        self.check_output_options()
+        self.open_journal(flag_silence_removal)
+        with self.open_workspace(flag_silence_removal):
+            chunks = self.stream_audio_chunks(flag_silence_removal)
+            if chunks is None:
+                return self.output_dry_run()
+
+            transcription = self.transcriptor.transcribe_chunk_stream(chunks)
+            return self.save_transcription(transcription.transcription)
+
+    async def run_async(self, flag_silence_removal: bool = False) -> str:
+        """run の asyncio 版。ffmpeg はスレッドで実行し、APIは非同期クライアントで呼ぶ"""
+        if is_raw_response_file(self.audio_file):
+            return await asyncio.to_thread(self.rerender)
+
+        self.check_output_options()
+        self.open_journal(flag_silence_removal)
+        # 容量の空き待ちでイベントループを止めないよう、スレッドで開く
+        with await asyncio.to_thread(self.open_workspace, flag_silence_removal):
+            chunks = await asyncio.to_thread(self.stream_audio_chunks, flag_silence_removal)
+            if chunks is None:
+                return self.output_dry_run()
+
+            transcription = await self.transcriptor.transcribe_chunk_stream_async(chunks)
+            # 書き出しとキャッシュの削除はファイル操作なので、イベントループを止めないようスレッドで行う
+            return await asyncio.to_thread(self.save_transcription, transcription.transcription)
+
+    def open_workspace(self, flag_silence_removal: bool = False) -> JobWorkspace:
+        """このジョブの一時ファイルを置く作業ディレクトリを開き、抽出・分割で使うよう設定する。
+        容量の上限を超えていれば、他のジョブの作業ディレクトリが消えるまで待つ"""
+        name = os.path.splitext(os.path.basename(self.audio_file))[0]
+        reserve_bytes = 0 if self.dry_run else self.workspace_bytes(flag_silence_removal)
+        workspace = open_job_workspace(name, reserve_bytes)
+        self.temp_dir = workspace.path
+        self.transcriptor.set_temp_dir(workspace.path)
+        return workspace
+
+    def stream_audio_chunks(self, flag_silence_removal: bool) -> Iterator[AudioChunk] | None:
+        """後続の分割ファイルをエンコードしている間に先頭から文字起こしできるよう、
+        分割ファイルを出来た順に返すジェネレータを用意する。ドライラン時は None を返す"""
+        self.set_status(
+            f"😇 音声抽出と {self.profile.provider} ({self.profile.model}) での文字起こしを並行して処理しています…"
+        )
+
+        if self.dry_run:
+            return None
+
+        info = self.probe_source()
+        encoding = self.upload_plan(info, flag_silence_removal)
+        if encoding is None:
+            assert info is not None
+            return iter([AudioChunk(path=self.audio_file, duration_sec=info.duration_sec)])
+
+        silencer = AudioSilencer(self.audio_file, encoding, self.temp_dir)
+        silencer.flag_silence_removal = flag_silence_removal
+        duration = info.duration_sec if info is not None else None
+
+        # コピーでの取り出しはPCMを経由せず、1つの ffmpeg で取り出しと分割を行う。
+        # 分割するなら、解析用にデコードした音声の「間」で切る位置を先に決めておく
+        if encoding.codec == "copy":
+            segment_sec = self.transcriptor.segment_duration(duration, silencer.bytes_per_sec())
+            split_points = None
+            if duration is not None and segment_sec < duration:
+                split_points = self.transcriptor.split_points(
+                    duration, silencer.bytes_per_sec(), silence_map(self.audio_file)
                 )
-            else:
-                silencer = AudioSilencer(self.audio_file)
-                silencer.flag_silence_removal = flag_silence_removal
-                silenced_files = silencer.exec()
-
-                if self.keep_silence_removed_files:
-                    input_file_path = os.path.dirname(self.audio_file)
-                    for silenced_file in silenced_files:
-                        copy_file(silenced_file, input_file_path)
-
-            msg = (
-                f"😇 {self.profile.provider} ({self.profile.model}) で文字起こし中…"
-            )
-            self.set_status(msg)
-            transcription = self.transcriptor.transcribe_audio_files(silenced_files)
+            return silencer.exec_stream(segment_sec, split_points)
+
+        # 元ファイルを1回だけPCMにデコードし、静音除去・「間」での分割・分割ファイルのエンコードをそこから行う
+        keep_file = None
+        if self.keep_silence_removed_files:
+            body = os.path.basename(self.audio_file).split(".")[0]
+            suffix = "_audio_silenced" if flag_silence_removal else "_audio"
+            keep_file = os.path.join(os.path.dirname(self.audio_file), body + suffix + encoding.extension)
+
+        def plan_split_points(duration_sec: float, pauses: list[tuple[float, float]]) -> list[float]:
+            return self.transcriptor.split_points(duration_sec, silencer.bytes_per_sec(), pauses)
+
+        return silencer.exec_chunks(plan_split_points, duration, self.extract_processes, keep_file)
+
+    def workspace_bytes(self, flag_silence_removal: bool) -> int:
+        """作業ディレクトリで使う容量の見積もり。
+        デコードしたPCM（長さ × サンプリングレート × チャンネル数 × 2バイト）と、エンコードした分割ファイルの合計"""
+        info = self.probe_source()
+        if info is None or not info.duration_sec:
+            # 長さが分からなければ元ファイルのサイズで見積もる
+            return os.path.getsize(self.audio_file)
+
+        encoding = self.upload_plan(info, flag_silence_removal)
+        if encoding is None:
+            return 0
+        encoded_bytes = info.duration_sec * encoding.bytes_per_sec()
+        if encoding.codec == "copy":
+            return int(encoded_bytes)
+        sample_rate = encoding.sample_rate or info.sample_rate or PCM_FALLBACK_SAMPLE_RATE
+        channels = encoding.channels or info.channels or PCM_FALLBACK_CHANNELS
+        return int(info.duration_sec * sample_rate * channels * 2 + encoded_bytes)
+
+    def probe_source(self) -> MediaInfo | None:
+        """元ファイルの情報。ジョブの中で何度呼んでも ffprobe は1回だけ"""
+        if not self._probed:
+            try:
+                self._media_info = probe_media(self.audio_file)
+            except (subprocess.CalledProcessError, ValueError):
+                self._media_info = None
+            self._probed = True
+        return self._media_info
+
+    def upload_plan(self, info: MediaInfo | None, flag_silence_removal: bool) -> UploadEncoding | None:
+        """APIへ送る形式を決める。元ファイルをそのまま送れるなら None を返す。
+        静音除去しない場合、プロバイダが受け付けるコーデックで分割せずに送れる長さなら再エンコードしない。
+        音声ファイルはそのまま送り、動画などからは音声トラックだけをコピーで取り出す"""
+        provider = self.profile.provider
+        encoding = upload_encoding_for(provider)
+        if flag_silence_removal or info is None or not info.duration_sec:
+            return encoding
+
+        def fits(bytes_per_sec: float) -> bool:
+            return self.transcriptor.segment_duration(info.duration_sec, bytes_per_sec) > info.duration_sec
+
+        if can_send_as_is(self.audio_file, info, provider) and fits(info.size / info.duration_sec):
+            return None
+        copy = stream_copy_encoding(info, provider)
+        if copy is not None and fits(copy.bytes_per_sec()):
+            return copy
+        return encoding
+
+    def open_journal(self, flag_silence_removal: bool):
+        """同じ入力・同じ条件の途中結果があれば、それを使うジャーナルを開く"""
+        if self.dry_run:
+            return
+
+        stat = os.stat(self.audio_file)
+        job_key = {
+            "source": os.path.abspath(self.audio_file),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "provider": self.profile.provider,
+            "model": self.profile.model,
+            "prompt": self.transcriptor.prompt,
+            "language": self.transcriptor.language,
+            "output_options": dataclasses.asdict(self.output_options),
+            "silence_removal": flag_silence_removal,
+            "split_segment_sec": self.split_segment_sec,
+        }
+        self.journal = JobJournal.open_for(job_key)
+        self.transcriptor.set_journal(self.journal)
 
-            formatted = format_output_text(
-                transcription.transcription,
-                self.output_options,
-                self.profile,
+        if len(self.journal) > 0:
+            self.set_status(f"😇 前回の途中結果 {len(self.journal)} 件を再利用します")
+
+    def save_transcription(self, transcription_text: str) -> str:
+        segments = self.transcriptor.transcription.segments
+        if self.save_raw_response:
+            document = build_raw_document(
                 self.audio_file,
+                self.profile,
+                self.transcriptor.language,
+                self.transcriptor.rendered_chunks,
+                self.transcriptor.transcription.summary,
             )
-
-            return self.output(
+            self.output(
                 self.audio_file,
-                transcription=formatted,
-                encoding=self.result_encoding,
-                extension=self.output_options.file_extension(),
+                transcription=json.dumps(document, ensure_ascii=False),
+                postfix=RAW_POSTFIX,
+                extension="json",
             )
 
-        def copy_file(src: str, dst: str):
-            import shutil
+        formatted = format_output_text(
+            transcription_text,
+            self.output_options,
+            self.profile,
+            self.audio_file,
+            segments,
+        )
 
-            if sys.platform == "win32":
-                shutil.copy(src, dst)
-            elif sys.platform == "darwin":
-                shutil.copy2(src, dst)
-            elif sys.platform == "linux":
-                shutil.copy2(src, dst)
+        saved_file = self.output(
+            self.audio_file,
+            transcription=formatted,
+            encoding=self.result_encoding,
+            extension=self.output_options.file_extension(),
+        )
 
-        def sleep_for_debugging():
-            import time
+        # 保存まで終わったら途中結果は不要
+        if self.journal is not None:
+            self.journal.complete()
+        if self.cache is not None:
+            self.cache.evict()
+        return saved_file
+
+    def rerender(self) -> str:
+        """保存済みの生データ（*_raw.json）から、現在の出力形式で結果を作り直す。APIは呼ばない"""
+        self.set_status("😇 保存済みの結果から出力を作り直しています…")
+
+        document = load_raw_document(self.audio_file)
+        profile = raw_document_profile(document)
+        caller = build_caller(profile, self.output_options)
+        caller.set_options(self.debug_options)
+        caller.dry_run = False
+        caller.language = document.get("language", caller.language)
+        transcription = caller.render_responses(document["chunks"], document.get("summary", ""))
+
+        # 元の入力ファイルと同じ名前で、生データと同じフォルダに書き出す
+        source_file = os.path.join(os.path.dirname(self.audio_file), document["source_file"])
+        formatted = format_output_text(
+            transcription.transcription,
+            self.output_options,
+            profile,
+            source_file,
+            transcription.segments,
+        )
+        return self.output(
+            source_file,
+            transcription=formatted,
+            encoding=self.result_encoding,
+            extension=self.output_options.file_extension(),
+        )
 
-            time.sleep(5)
-            return "[DEBUG_MODE]"
+    def output_dry_run(self) -> str:
+        return self.output(
+            self.audio_file,
+            transcription="Dry Run",
+            postfix="_dryrun",
+            encoding=self.result_encoding,
+            extension=self.output_options.file_extension(),
+        )
 
-        thread = Thread(target=handling_transcribe_audio)
-        thread.start()
+    def handle_error(self, e: Exception):
+        if self.journal is not None and len(self.journal) > 0:
+            self.set_status(
+                f"😫 エラーです: {e}（完了済みの {len(self.journal)} 件は再実行時に再利用します）",
+                ButtonState.RELEASE,
+            )
+        else:
+            self.set_status(f"😫 エラーです: {e}", ButtonState.RELEASE)
+        if self.export_errorlog:
+            self.output(
+                self.audio_file,
+                transcription=str(e),
+                encoding=self.result_encoding,
+                postfix="_errorlog",
+                extension="txt",
+            )
+
+        if sys.flags.debug:
+            print(e)
 
     @staticmethod
     def output(
@@ -230,12 +460,24 @@ class TranscriptionController:
             print(f"Transcription saved to: [{output_file_name}]")
         return output_file_name
 
-    def check_api_token(self):
-        self.set_status("😇 APIトークンを確認しています…")
+    def build_transcriptor(self) -> BaseTranscriptionCaller:
         self.transcriptor = build_caller(self.profile, self.output_options)
         self.transcriptor.set_options(self.debug_options)
 
         if self.prompt is not None:
             self.transcriptor.set_prompt(self.prompt)
 
-        return self.transcriptor.check_api_token()
+        if self.profile.use_cache:
+            self.transcriptor.set_cache(self.cache)
+
+        return self.transcriptor
+
+    def check_output_options(self):
+        """このモデルで作れない出力形式なら、音声の抽出・送信の前に ValueError を投げる"""
+        error = unsupported_output_error(self.profile.provider, self.profile.model, self.output_options)
+        if error is not None:
+            raise ValueError(error)
+
+    def check_api_token(self):
+        self.set_status("😇 APIトークンを確認しています…")
+        return self.build_transcriptor().check_api_token()
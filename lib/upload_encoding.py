@@ -0,0 +1,151 @@
+import mimetypes
+import os
+import re
+from configparser import ConfigParser
+from dataclasses import dataclass
+from lib.ffmpeg_utils import MediaInfo
+
+
+# 同じ範囲から作った分割ファイルが毎回同じバイト列になるようにする ffmpeg の出力オプション。
+# Ogg はストリームのシリアル番号を乱数で決めるため、これが無いとジャーナルやキャッシュの
+# キー（分割ファイルの SHA-256）が毎回変わり、再開時もキャッシュも当たらない
+BITEXACT_ARGS = ("-fflags", "+bitexact")
+BITEXACT_CODEC_ARGS = ("-flags:a", "+bitexact")
+
+
+@dataclass(frozen=True)
+class UploadEncoding:
+    """APIへ送る音声のエンコード形式。sample_rate/channels が None なら元の音声のまま"""
+
+    name: str
+    extension: str
+    codec: str
+    bitrate_kbps: int
+    sample_rate: int | None = None
+    channels: int | None = None
+    extra_args: tuple[str, ...] = ()
+
+    def ffmpeg_args(self) -> list[str]:
+        """ffmpeg の出力オプション"""
+        if self.codec == "copy":
+            return ["-acodec", "copy", *BITEXACT_ARGS]
+        return [
+            "-acodec",
+            self.codec,
+            "-b:a",
+            f"{self.bitrate_kbps}k",
+            *self.extra_args,
+            *self.format_args(),
+            *BITEXACT_ARGS,
+            *BITEXACT_CODEC_ARGS,
+        ]
+
+    def format_args(self) -> list[str]:
+        """サンプリングレート・チャンネル数を変換する ffmpeg の出力オプション"""
+        args: list[str] = []
+        if self.sample_rate is not None:
+            args += ["-ar", str(self.sample_rate)]
+        if self.channels is not None:
+            args += ["-ac", str(self.channels)]
+        return args
+
+    def bytes_per_sec(self) -> float:
+        return self.bitrate_kbps * 1000 / 8
+
+
+# 文字起こしには 16kHz モノラルで十分（Whisper も内部で 16kHz モノラルに変換している）
+UPLOAD_ENCODINGS: dict[str, UploadEncoding] = {
+    # 1時間で約11MB。OpenAI / Gemini / ElevenLabs のいずれも Ogg Opus を受け付ける
+    "opus": UploadEncoding("opus", ".ogg", "libopus", 24, 16000, 1, ("-application", "voip")),
+    # 1時間で約14MB。libopus の無い ffmpeg 向け
+    "mp3": UploadEncoding("mp3", ".mp3", "libmp3lame", 32, 16000, 1),
+    # 以前の形式（元のチャンネル数・サンプリングレートのまま 128kbps）
+    "mp3_hq": UploadEncoding("mp3_hq", ".mp3", "libmp3lame", 128),
+}
+
+# プロバイダごとの既定。config.ini の [UPLOAD] で `<provider>_encoding` として上書きできる
+DEFAULT_PROVIDER_ENCODINGS: dict[str, str] = {
+    "openai": "opus",
+    "google": "opus",
+    "elevenlabs": "opus",
+}
+
+# プロバイダが再エンコードなしで受け付けるコーデックと、それを入れるファイルの拡張子（先頭が取り出し時の拡張子）
+ACCEPTED_CODECS: dict[str, dict[str, tuple[str, ...]]] = {
+    "openai": {
+        "mp3": (".mp3",),
+        "aac": (".m4a",),
+        "flac": (".flac",),
+        "opus": (".ogg",),
+        "vorbis": (".ogg",),
+        "pcm_s16le": (".wav",),
+    },
+    # Gemini は MP4 コンテナ (m4a) を受け付けないので、AAC は ADTS で送る
+    "google": {
+        "mp3": (".mp3",),
+        "aac": (".aac",),
+        "flac": (".flac",),
+        "opus": (".ogg",),
+        "vorbis": (".ogg",),
+        "pcm_s16le": (".wav",),
+    },
+    "elevenlabs": {
+        "mp3": (".mp3",),
+        "aac": (".m4a", ".aac"),
+        "flac": (".flac",),
+        "opus": (".ogg", ".opus"),
+        "vorbis": (".ogg",),
+        "pcm_s16le": (".wav",),
+    },
+}
+
+# アップロード時に明示する MIME タイプ（.ogg や .flac は環境によって推測できないため）
+AUDIO_MIME_TYPES: dict[str, str] = {
+    ".mp3": "audio/mp3",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".aac": "audio/aac",
+    ".m4a": "audio/mp4",
+    ".flac": "audio/flac",
+    ".wav": "audio/wav",
+}
+
+_provider_encodings: dict[str, str] = dict(DEFAULT_PROVIDER_ENCODINGS)
+
+
+def load_upload_encodings(config: ConfigParser) -> None:
+    """config.ini の [UPLOAD] からプロバイダ別のエンコード形式を読み込む"""
+    for provider, default in DEFAULT_PROVIDER_ENCODINGS.items():
+        name = config.get("UPLOAD", f"{provider}_encoding", fallback=default).strip()
+        _provider_encodings[provider] = name if name in UPLOAD_ENCODINGS else default
+
+
+def upload_encoding_for(provider: str) -> UploadEncoding:
+    return UPLOAD_ENCODINGS[_provider_encodings.get(provider, "mp3_hq")]
+
+
+def can_send_as_is(path: str, info: MediaInfo, provider: str) -> bool:
+    """映像が無く、プロバイダが受け付けるコーデックと拡張子の組み合わせなら、ファイルをそのまま送れる"""
+    extensions = ACCEPTED_CODECS.get(provider, {}).get(info.codec or "", ())
+    return not info.has_video and os.path.splitext(path)[1].lower() in extensions
+
+
+def stream_copy_encoding(info: MediaInfo, provider: str) -> UploadEncoding | None:
+    """プロバイダが受け付けるコーデックなら、再エンコードせずに音声だけ取り出す形式を返す"""
+    extensions = ACCEPTED_CODECS.get(provider, {}).get(info.codec or "", ())
+    if not extensions or not info.bitrate:
+        return None
+    return UploadEncoding("copy", extensions[0], "copy", max(1, round(info.bitrate / 1000)))
+
+
+def audio_mime_type(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    return AUDIO_MIME_TYPES.get(extension) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def upload_name(path: str) -> str:
+    """アップロード時に付けるASCIIだけのファイル名。
+    SDK によってはファイル名をHTTPヘッダにASCIIで載せるので、日本語のファイル名では失敗する"""
+    body, extension = os.path.splitext(os.path.basename(path))
+    body = re.sub(r"[^0-9A-Za-z._-]", "_", body).strip("_-.") or "audio"
+    return body + re.sub(r"[^0-9A-Za-z.]", "", extension)
@@ -5,8 +5,8 @@ import sys
 import tempfile
 from types import SimpleNamespace
 from lib.base_caller import BaseTranscriptionCaller, Transcription
-from lib.output_options import FORMAT_SRT, FORMAT_VTT
-from openai import OpenAI
+from lib.output_options import FORMAT_VTT
+from openai import AsyncOpenAI, OpenAI
 
 
 __all__ = ["Transcription", "WhisperTranscriptionCaller"]
@@ -17,120 +17,158 @@ _SRT_TS = re.compile(
     r"(\d{2}):(\d{2}):(\d{2})[,.](\d{3})\s*-->\s*(\d{2}):(\d{2}):(\d{2})[,.](\d{3})"
 )
 
+# verbose_json（segments 付き）を返せるモデル
+_VERBOSE_JSON_MODELS = {"whisper-1"}
+
 
 class WhisperTranscriptionCaller(BaseTranscriptionCaller):
+    provider = "openai"
+
     def __init__(self, api_key: str, timestamp_flag: bool):
         super().__init__(api_key, timestamp_flag)
         self.model = "whisper-1"
         self.client: OpenAI | None = None
+        self.async_client: AsyncOpenAI | None = None
         self._subtitle_cues: list[tuple[float, float, str]] = []  # (start_sec, end_sec, text)
 
     def _ensure_client(self):
         if self.client is None:
             self.client = OpenAI(api_key=self.api_key)
 
-    def _transcribe_single_file(self, audio_file: str) -> str:
-        self._ensure_client()
+    def _ensure_async_client(self):
+        if self.async_client is None:
+            self.async_client = AsyncOpenAI(api_key=self.api_key)
 
+    async def _aclose_async_client(self):
+        if self.async_client is not None:
+            await self.async_client.close()
+            self.async_client = None
+
+    def _request_chunk(self, audio_file: str):
         if self.console_out:
             print("transcribe_single_file(): " + audio_file)
 
-        with open(str(audio_file), "rb") as f:
-            if self.output_options.is_subtitle():
-                self._create_subtitle(f)
-            elif self.output_options.timestamp:
-                self._create_with_timestamp(f)
-            else:
-                self._create(f)
+        if self.dry_run:
+            return self._dry_run_response()
 
-            if self.console_out:
-                print(self.transcription.transcription)
+        self._ensure_client()
+        assert self.client is not None
+        with open(str(audio_file), "rb") as f:
+            response = self.client.audio.transcriptions.create(
+                file=f, **self._request_kwargs()
+            )
+        return self._normalize_response(response)
 
-            return self.transcription.transcription
+    async def _request_chunk_async(self, audio_file: str):
+        if self.console_out:
+            print("transcribe_single_file_async(): " + audio_file)
 
-    def _create_with_timestamp(self, file_handler):
         if self.dry_run:
-            transcript = SimpleNamespace()
-            transcript.segments = [
+            return self._dry_run_response()
+
+        self._ensure_async_client()
+        assert self.async_client is not None
+        with open(str(audio_file), "rb") as f:
+            response = await self.async_client.audio.transcriptions.create(
+                file=f, **self._request_kwargs()
+            )
+        return self._normalize_response(response)
+
+    def _request_kwargs(self) -> dict:
+        """transcriptions.create の引数（file 以外）。
+        出力形式を後から作り直せるよう、出力オプションに関係なく取れる中で一番詳しい形式で受け取る"""
+        kwargs: dict = {
+            "model": self.model,
+            "language": self.language,
+            "prompt": self.prompt,
+        }
+        if self.model in _VERBOSE_JSON_MODELS:
+            kwargs["response_format"] = "verbose_json"
+        else:
+            # gpt-4o 系は json（text のみ）しか返せない
+            kwargs["response_format"] = "json"
+        return kwargs
+
+    def _normalize_response(self, response):
+        if self.console_out and self.output_options.timestamp:
+            print("segments:" + str(response))
+        return response
+
+    def _dry_run_response(self):
+        return SimpleNamespace(
+            text="これはテストです。" * 3,
+            segments=[
                 SimpleNamespace(start=0, end=5, text="これはテストです。"),
                 SimpleNamespace(start=5, end=10, text="これはテストです。"),
                 SimpleNamespace(start=10, end=15, text="これはテストです。"),
-            ]
+            ],
+        )
+
+    def _render_chunk(self, response, offset_sec: float) -> None:
+        if isinstance(response, str):
+            # 以前のバージョンがジャーナル/キャッシュに残した SRT/VTT 文字列
+            self._render_subtitle_text(response, offset_sec)
+        elif self.output_options.is_subtitle():
+            self._render_subtitle(response, offset_sec)
+        elif self.output_options.timestamp:
+            self._render_with_timestamp(response, offset_sec)
         else:
-            assert self.client is not None
-            transcript = self.client.audio.transcriptions.create(
-                model=self.model,
-                file=file_handler,
-                language=self.language,
-                response_format="verbose_json",
-                prompt=self.prompt,
-            )
+            self.transcription.add_transcription(_seg_attr(response, "text"), 0)
 
-        file_start_sec = self.transcription.last_timestamp_sec
         if self.console_out:
-            print("segments:" + str(transcript))
+            print(self.transcription.transcription)
+
+    def _segments(self, response) -> list:
+        segments = _seg_attr(response, "segments", None)
+        if segments is None and (self.output_options.timestamp or self.output_options.is_subtitle()):
+            raise ValueError(
+                f"{self.model} の結果には区間ごとの時刻が含まれないため、"
+                "タイムスタンプ付きテキストや字幕は作れません"
+            )
+        return list(segments or [])
 
+    def _render_with_timestamp(self, transcript, offset_sec: float) -> str:
         result = ""
-        begin_sec = self.transcription.last_timestamp_sec
-        last_sec = 0
-        for segment in transcript.segments:  # type: ignore
+        last_sec = 0.0
+        for segment in self._segments(transcript):
             if self.console_out:
                 print("create_with_timestamp(): " + str(segment))
             text = _seg_attr(segment, "text")
-            endsec = file_start_sec + int(_seg_attr(segment, "start"))
-            last_sec = int(_seg_attr(segment, "end"))
-            timestamp = str(datetime.timedelta(seconds=endsec))
+            start = self._source_sec(offset_sec + float(_seg_attr(segment, "start")))
+            last_sec = float(_seg_attr(segment, "end"))
+            timestamp = str(datetime.timedelta(seconds=int(start)))
             result += f"[{timestamp}] {text}\n"
-
-        self.transcription.add_transcription(result, begin_sec + last_sec)
-        return result
-
-    def _create(self, file_handler):
-        if self.dry_run:
-            transcript = SimpleNamespace(text="これはテストです。")
-        else:
-            assert self.client is not None
-            transcript = self.client.audio.transcriptions.create(
-                model=self.model,
-                file=file_handler,
-                language=self.language,
-                response_format="json",
+            self.transcription.add_segment(
+                start, self._source_sec(offset_sec + last_sec), str(text).strip()
             )
 
-        self.transcription.add_transcription(transcript.text, 0)  # type: ignore
-        return transcript.text  # type: ignore
+        self.transcription.add_transcription(result, int(offset_sec + last_sec))
+        return result
 
-    def _create_subtitle(self, file_handler):
-        """SRT/VTT文字列を取得し、ファイル境界をまたぐタイムコードに加算するために
-        いったんキューに分解して保持する"""
-        offset_sec = float(self.transcription.last_timestamp_sec)
+    def _render_subtitle(self, transcript, offset_sec: float) -> None:
+        """verbose_json の segments を1区間=1キューとして保持する"""
+        last_end = offset_sec
+        for segment in self._segments(transcript):
+            start = self._source_sec(offset_sec + float(_seg_attr(segment, "start")))
+            end = self._source_sec(offset_sec + float(_seg_attr(segment, "end")))
+            body = str(_seg_attr(segment, "text")).strip()
+            if body:
+                self._subtitle_cues.append((start, end, body))
+            last_end = max(last_end, end)
 
-        if self.dry_run:
-            text = (
-                "1\n00:00:00,000 --> 00:00:05,000\nこれはテストです。\n\n"
-                "2\n00:00:05,000 --> 00:00:10,000\nこれはテストです。\n"
-            )
-        else:
-            assert self.client is not None
-            response_format = "srt" if self.output_options.output_format == FORMAT_SRT else "vtt"
-            text = self.client.audio.transcriptions.create(
-                model=self.model,
-                file=file_handler,
-                language=self.language,
-                response_format=response_format,
-                prompt=self.prompt,
-            )
-            if not isinstance(text, str):
-                text = getattr(text, "text", str(text))
+        self.transcription.add_transcription("", int(last_end))
 
+    def _render_subtitle_text(self, text: str, offset_sec: float) -> None:
+        """ファイル境界をまたぐタイムコードに加算するため、いったんキューに分解して保持する"""
         cues = self._parse_cues(text)
         last_end = offset_sec
         for start, end, body in cues:
-            self._subtitle_cues.append((offset_sec + start, offset_sec + end, body))
+            self._subtitle_cues.append(
+                (self._source_sec(offset_sec + start), self._source_sec(offset_sec + end), body)
+            )
             last_end = max(last_end, offset_sec + end)
 
         self.transcription.add_transcription("", int(last_end))
-        return text
 
     def _parse_cues(self, text: str) -> list[tuple[float, float, str]]:
         cues: list[tuple[float, float, str]] = []
@@ -186,6 +224,15 @@ class WhisperTranscriptionCaller(BaseTranscriptionCaller):
 
         return self.transcription.transcription
 
+    def _throttle_delay(self, e: Exception) -> float | None:
+        # 残高不足の 429 は待っても回復しないので再送しない
+        if getattr(e, "code", None) == "insufficient_quota":
+            return None
+        return super()._throttle_delay(e)
+
+    def _request_fingerprint(self) -> dict:
+        return self._request_kwargs()
+
     def check_api_token(self) -> bool:
         self._ensure_client()
         assert self.client is not None
@@ -218,8 +265,15 @@ def _format_ts(seconds: float, ms_sep: str) -> str:
     return f"{h:02d}:{m:02d}:{s:02d}{ms_sep}{ms:03d}"
 
 
-def _seg_attr(segment, key: str):
+_MISSING = object()
+
+
+def _seg_attr(segment, key: str, default=_MISSING):
     """新APIの Pydantic モデル/旧APIの dict 両方から値を取得"""
     if isinstance(segment, dict):
-        return segment[key]
-    return getattr(segment, key)
+        if default is _MISSING:
+            return segment[key]
+        return segment.get(key, default)
+    if default is _MISSING:
+        return getattr(segment, key)
+    return getattr(segment, key, default)
@@ -0,0 +1,114 @@
+import os
+import numpy as np
+import pytest
+import lib.pcm_workspace
+from lib.audio_silencer import AudioSilencer, slice_kept
+from lib.pcm_workspace import WORKSPACE_FILENAME, PcmWorkspace
+from lib.silence_detector import SilenceDetector, ms_to_frame
+from lib.upload_encoding import UPLOAD_ENCODINGS
+from tests.test_silence_detector import synth
+
+SAMPLE_RATE = 16000
+# 発話3秒・無音2秒を繰り返した13秒の音声
+PATTERN = [(3000, True), (2000, False), (3000, True), (2000, False), (3000, True)]
+
+
+class TestSliceKept:
+    def test_inside_one_interval(self):
+        assert slice_kept([(1000, 5000)], 500, 1500) == [(1500, 2500)]
+
+    def test_across_intervals(self):
+        # つないだ音声の 1.5〜3.5秒は、1つ目の区間の後半と2つ目の区間の前半
+        assert slice_kept([(0, 2000), (5000, 7000)], 1500, 3500) == [(1500, 2000), (5000, 6500)]
+
+    def test_outside(self):
+        assert slice_kept([(0, 1000)], 1000, 2000) == []
+
+
+@pytest.fixture
+def samples() -> np.ndarray:
+    return synth(PATTERN, SAMPLE_RATE)
+
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch, samples):
+    """デコードは samples をそのまま生ファイルに置き、エンコードは受け取ったPCMをそのまま書き出す"""
+
+    def decode(cls, input_file, directory, sample_rate=None, channels=None, duration_sec=None, processes=1):
+        path = os.path.join(directory, WORKSPACE_FILENAME)
+        with open(path, "wb") as f:
+            f.write(samples.tobytes())
+        return cls(path, SAMPLE_RATE, samples.shape[1])
+
+    def encode_pcm(blocks, output_file, sample_rate, channels, encoding):
+        with open(output_file, "wb") as f:
+            for block in blocks:
+                f.write(np.ascontiguousarray(block).tobytes())
+
+    monkeypatch.setattr(PcmWorkspace, "decode", classmethod(decode))
+    monkeypatch.setattr(lib.pcm_workspace, "encode_pcm", encode_pcm)
+
+
+def read_pcm(path: str) -> np.ndarray:
+    with open(path, "rb") as f:
+        return np.frombuffer(f.read(), dtype=np.int16)
+
+
+def run_chunks(tmp_path, flag_silence_removal: bool, keep_file: str | None = None):
+    silencer = AudioSilencer("input.m4a", UPLOAD_ENCODINGS["opus"], str(tmp_path))
+    silencer.flag_silence_removal = flag_silence_removal
+    requests: list[tuple[float, list]] = []
+
+    def plan_split_points(duration_sec: float, pauses: list[tuple[float, float]]) -> list[float]:
+        requests.append((duration_sec, pauses))
+        return [duration_sec / 2]
+
+    chunks = list(silencer.exec_chunks(plan_split_points, processes=2, keep_file=keep_file))
+    return chunks, requests
+
+
+@pytest.mark.usefixtures("fake_ffmpeg")
+class TestExecChunks:
+    def test_chunks_hold_only_kept_audio(self, tmp_path, samples):
+        intervals = SilenceDetector().speech_intervals(samples, SAMPLE_RATE)
+        kept = np.concatenate([
+            samples[ms_to_frame(start, SAMPLE_RATE): ms_to_frame(end, SAMPLE_RATE)] for start, end in intervals
+        ]).ravel()
+        keep_file = str(tmp_path / "kept.ogg")
+
+        chunks, requests = run_chunks(tmp_path, True, keep_file)
+
+        # 分割位置は静音除去後の長さで決め、その中の「間」も渡す
+        total_sec = sum(end - start for start, end in intervals) / 1000
+        assert requests[0][0] == pytest.approx(total_sec)
+        assert isinstance(requests[0][1], list)
+        assert [chunk.index for chunk in chunks] == [0, 1]
+        assert sum(chunk.duration_sec for chunk in chunks) == pytest.approx(total_sec)
+        assert np.array_equal(np.concatenate([read_pcm(chunk.path) for chunk in chunks]), kept)
+        assert np.array_equal(read_pcm(keep_file), kept)
+
+    def test_time_map_points_to_source(self, tmp_path, samples):
+        intervals = SilenceDetector().speech_intervals(samples, SAMPLE_RATE)
+        chunks, _ = run_chunks(tmp_path, True)
+
+        total_ms = sum(end - start for start, end in intervals)
+        second = slice_kept(intervals, total_ms // 2, total_ms)
+        chunk = chunks[1]
+        assert chunk.start_sec == second[0][0] / 1000
+        # 分割ファイルの先頭と、後ろの区間の先頭は元音声の位置に戻る
+        assert chunk.time_map.to_source(chunk.start_sec) == pytest.approx(second[0][0] / 1000)
+        offset = (second[0][1] - second[0][0]) / 1000
+        assert chunk.time_map.to_source(chunk.start_sec + offset + 0.5) == pytest.approx(second[1][0] / 1000 + 0.5)
+
+    def test_without_silence_removal(self, tmp_path, samples):
+        chunks, requests = run_chunks(tmp_path, False)
+
+        assert requests[0][0] == pytest.approx(len(samples) / SAMPLE_RATE)
+        assert [chunk.start_sec for chunk in chunks] == [0.0, 6.5]
+        assert all(chunk.time_map is None for chunk in chunks)
+        assert np.array_equal(np.concatenate([read_pcm(chunk.path) for chunk in chunks]), samples.ravel())
+
+    def test_workspace_is_removed(self, tmp_path):
+        run_chunks(tmp_path, True)
+
+        assert not list(tmp_path.glob(f"*/{WORKSPACE_FILENAME}"))
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from lib.audio_splitter import SPLIT_SEARCH_MAX_SEC, SPLIT_SEARCH_RATIO, chunk_count, find_pauses, plan_split_points
+
+
+class TestPlanSplitPoints:
+    def test_even_split_without_pauses(self):
+        assert plan_split_points(300.0, 3, []) == [100.0, 200.0]
+
+    def test_single_chunk(self):
+        assert plan_split_points(300.0, 1, [(100.0, 101.0)]) == []
+
+    def test_cuts_at_middle_of_nearby_pause(self):
+        assert plan_split_points(300.0, 3, [(95.0, 97.0), (203.0, 204.0)]) == [96.0, 203.5]
+
+    def test_ignores_pause_outside_tolerance(self):
+        # 目標 100秒の前後 10%（10秒）より外の「間」は使わない
+        assert plan_split_points(300.0, 3, [(85.0, 88.0)]) == [100.0, 200.0]
+
+    def test_picks_pause_closest_to_ideal(self):
+        pauses = [(92.0, 93.0), (98.0, 99.0), (103.0, 104.0)]
+        assert plan_split_points(200.0, 2, pauses) == [98.5]
+
+    def test_long_pause_is_clamped_to_tolerance(self):
+        # 前後に長く続く「間」の中央は遠いので、探す範囲の端で切る
+        assert plan_split_points(200.0, 2, [(50.0, 106.0)]) == [90.0]
+
+    def test_tolerance_is_capped(self):
+        duration = 3600.0
+        target = duration / 2
+        tolerance = min(target * SPLIT_SEARCH_RATIO, SPLIT_SEARCH_MAX_SEC)
+        assert tolerance == SPLIT_SEARCH_MAX_SEC
+        pauses = [(target + tolerance + 1, target + tolerance + 2)]
+        assert plan_split_points(duration, 2, pauses) == [target]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_points_stay_near_even_split(self, seed):
+        rng = np.random.default_rng(seed)
+        duration = 5400.0
+        count = 7
+        starts = np.sort(rng.uniform(0, duration, 300))
+        pauses = [(float(start), float(start + length)) for start, length in zip(starts, rng.uniform(0.3, 3.0, 300))]
+        points = plan_split_points(duration, count, pauses)
+
+        target = duration / count
+        tolerance = min(target * SPLIT_SEARCH_RATIO, SPLIT_SEARCH_MAX_SEC)
+        assert len(points) == count - 1
+        assert points == sorted(points)
+        for k, point in enumerate(points, start=1):
+            assert abs(point - k * target) <= tolerance + 1e-9
+
+
+def test_chunk_count():
+    # サイズ・長さのどちらか厳しい方で決まる
+    assert chunk_count(600, 10, 25, 1500) == 1
+    assert chunk_count(600, 60, 25, 1500) == 3
+    assert chunk_count(3600, 10, 25, 1500) == 3
+    assert chunk_count(0, 0, 25, 1500) == 1
+
+
+def test_find_pauses_returns_seconds():
+    sample_rate = 16000
+    rng = np.random.default_rng(0)
+    speech = rng.integers(-8000, 8001, size=(sample_rate, 1))
+    samples = np.concatenate([speech, np.zeros((sample_rate // 2, 1)), speech]).astype(np.int16)
+    blocks = [samples[i: i + sample_rate] for i in range(0, len(samples), sample_rate)]
+    pauses = find_pauses(blocks, sample_rate)
+    assert len(pauses) == 1
+    # 窓の端に数ms の発話がかかっていても、-40dBFS に届かなければ「間」に含まれる
+    assert pauses[0] == pytest.approx((1.0, 1.5), abs=0.005)
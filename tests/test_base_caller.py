@@ -0,0 +1,154 @@
+import asyncio
+import threading
+
+import pytest
+
+from lib.audio_chunk import AudioChunk
+from lib.base_caller import BaseTranscriptionCaller
+from lib.rate_limiter import ProviderQuota, RateLimitScheduler
+
+
+class FakeCaller(BaseTranscriptionCaller):
+    """分割ファイルのパスをそのまま応答にする。finish_order の順でしか応答を返さない"""
+
+    provider = "fake"
+
+    def __init__(self, finish_order: list[str] | None = None):
+        super().__init__("dummy-key", False)
+        self.finish_order = finish_order
+        self.finished: list[str] = []
+        self._finished = threading.Condition()
+        self.async_client_closed = False
+
+    def _request_chunk(self, audio_file: str):
+        if self.finish_order is not None:
+            position = self.finish_order.index(audio_file)
+            with self._finished:
+                # 自分より先に終わるはずの分割ファイルが終わるまで待つ
+                assert self._finished.wait_for(lambda: len(self.finished) >= position, timeout=5)
+        with self._finished:
+            self.finished.append(audio_file)
+            self._finished.notify_all()
+        return audio_file
+
+    def _render_chunk(self, response, offset_sec: float) -> None:
+        self.transcription.add_transcription(f"[{offset_sec:g}] {response}\n", int(offset_sec))
+
+    async def _aclose_async_client(self):
+        self.async_client_closed = True
+
+    def check_api_token(self) -> bool:
+        return True
+
+
+def test_chunks_render_in_order_when_they_finish_in_reverse():
+    paths = [f"chunk-{i}" for i in range(4)]
+    caller = FakeCaller(finish_order=list(reversed(paths)))
+    caller.set_parallelism(4)
+
+    caller.transcribe_chunks(AudioChunk(path=path, index=i, start_sec=i * 30.0) for i, path in enumerate(paths))
+
+    assert caller.finished == list(reversed(paths))
+    assert caller.transcription.transcription == "".join(f"[{i * 30}] chunk-{i}\n" for i in range(4))
+    assert [entry["index"] for entry in caller.rendered_chunks] == [0, 1, 2, 3]
+
+
+def test_file_offsets_accumulate_real_durations(monkeypatch):
+    # 2ファイル目は、1ファイル目の応答の時刻ではなく実際の長さ（25 + 20秒）だけずれる
+    durations = {"a.mp3": [25.0, 20.0], "b.mp3": [30.0]}
+
+    def split_audio(self, input_file):
+        chunks, start = [], 0.0
+        for index, duration in enumerate(durations[input_file]):
+            chunks.append(AudioChunk(path=f"{input_file}#{index}", index=index, start_sec=start, duration_sec=duration))
+            start += duration
+        return chunks
+
+    monkeypatch.setattr(FakeCaller, "split_audio", split_audio)
+    caller = FakeCaller(finish_order=["a.mp3#1", "a.mp3#0", "b.mp3#0"])
+    caller.set_parallelism(2)
+    caller.transcribe_audio_files(["a.mp3", "b.mp3"])
+
+    assert caller.transcription.transcription == "[0] a.mp3#0\n[25] a.mp3#1\n[45] b.mp3#0\n"
+
+
+def test_async_chunks_render_in_order_and_close_client():
+    paths = [f"chunk-{i}" for i in range(3)]
+    caller = FakeCaller(finish_order=list(reversed(paths)))
+    caller.set_parallelism(3)
+
+    chunks = (AudioChunk(path=path, index=i, start_sec=i * 30.0) for i, path in enumerate(paths))
+    asyncio.run(caller.transcribe_chunk_stream_async(chunks))
+
+    assert caller.transcription.transcription == "".join(f"[{i * 30}] chunk-{i}\n" for i in range(3))
+    assert caller.async_client_closed
+
+
+def test_async_cancel_waits_for_generator_before_closing_it():
+    # 2つ目の分割ファイルを待っている間（ffmpeg の出力待ち）にキャンセルされても、
+    # 取り出し中のスレッドが戻ってからジェネレータを閉じ、後片付けを走らせる
+    waiting = threading.Event()
+    release = threading.Event()
+    events: list[str] = []
+
+    def chunks():
+        try:
+            yield AudioChunk(path="chunk-0", index=0, start_sec=0.0)
+            waiting.set()
+            release.wait(timeout=5)
+            events.append("produced")
+            yield AudioChunk(path="chunk-1", index=1, start_sec=30.0)
+        finally:
+            events.append("closed")
+
+    async def run():
+        caller = FakeCaller()
+        task = asyncio.ensure_future(caller.transcribe_chunks_async(chunks()))
+        await asyncio.to_thread(waiting.wait, 5)
+        task.cancel()
+        threading.Timer(0.1, release.set).start()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        events.append("cancelled")
+
+    asyncio.run(run())
+    assert events == ["produced", "closed", "cancelled"]
+
+
+def test_cancelled_request_returns_scheduler_slot():
+    scheduler = RateLimitScheduler(ProviderQuota(max_concurrency=4))
+    scheduler.limit = 2.0
+
+    class HangingCaller(FakeCaller):
+        async def _request_chunk_async(self, audio_file: str):
+            await asyncio.Event().wait()
+
+    async def run():
+        caller = HangingCaller()
+        caller.set_scheduler(scheduler)
+        task = asyncio.ensure_future(caller._counted_request_async(AudioChunk(path="chunk-0", index=0, start_sec=0.0)))
+        while scheduler.in_flight == 0:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert scheduler.in_flight == 0
+    assert scheduler.limit == 2.0
+
+
+def test_failed_request_does_not_grow_limit():
+    scheduler = RateLimitScheduler(ProviderQuota(max_concurrency=4))
+    scheduler.limit = 2.0
+
+    def fail():
+        raise RuntimeError("bad request")
+
+    caller = FakeCaller()
+    caller.set_scheduler(scheduler)
+    with pytest.raises(RuntimeError):
+        caller._counted_call(fail)
+
+    assert scheduler.in_flight == 0
+    assert scheduler.limit == 2.0
@@ -0,0 +1,270 @@
+import threading
+from types import SimpleNamespace
+import pytest
+import lib.gemini_caller
+from lib.audio_chunk import AudioChunk
+from lib.gemini_caller import GeminiTranscriptionCaller
+from lib.output_options import OutputOptions
+from lib.rate_limiter import ProviderQuota, RateLimitScheduler
+from lib.time_map import TimeMap
+
+
+def make_caller(**options) -> GeminiTranscriptionCaller:
+    caller = GeminiTranscriptionCaller("dummy-key", True)
+    caller.set_output_options(OutputOptions(timestamp=True, **options))
+    return caller
+
+
+def test_segments_are_offset_by_chunk_start():
+    caller = make_caller()
+    caller._render(AudioChunk(path="c1.ogg", start_sec=60.0), {"segments": [
+        {"start": 5.2, "end": 9.8, "text": "最初の発話"},
+        {"start": 3605.0, "end": 3610.5, "text": " 一時間後 "},
+    ]})
+
+    assert caller.transcription.transcription == "[0:01:05] 最初の発話\n[1:01:05] 一時間後\n"
+    assert caller.transcription.segments == [
+        {"start_sec": pytest.approx(65.2), "end_sec": pytest.approx(69.8), "text": "最初の発話"},
+        {"start_sec": pytest.approx(3665.0), "end_sec": pytest.approx(3670.5), "text": "一時間後"},
+    ]
+    assert caller.transcription.last_timestamp_sec == 3670
+
+
+def test_speaker_and_heading():
+    caller = make_caller(speaker_diarization=True, structured=True)
+    caller._render(AudioChunk(path="c0.ogg"), {"segments": [
+        {"start": 0, "end": 2, "text": "始めます", "speaker": "話者A", "heading": "開会"},
+        {"start": 2, "end": 4, "text": "はい", "speaker": "話者B"},
+        {"start": 4, "end": 6, "text": "次です", "speaker": "話者A", "heading": "議題"},
+    ]})
+
+    assert caller.transcription.transcription == (
+        "## 開会\n\n[0:00:00] 話者A: 始めます\n[0:00:02] 話者B: はい\n\n## 議題\n\n[0:00:04] 話者A: 次です\n"
+    )
+    assert [segment.get("speaker") for segment in caller.transcription.segments] == ["話者A", "話者B", "話者A"]
+
+
+def test_options_off_ignore_speaker_and_heading():
+    caller = make_caller()
+    caller._render(AudioChunk(path="c0.ogg"), {"segments": [
+        {"start": 1, "end": 2, "text": "本文", "speaker": "話者A", "heading": "見出し"},
+    ]})
+    assert caller.transcription.transcription == "[0:00:01] 本文\n"
+    assert "speaker" not in caller.transcription.segments[0]
+
+
+def test_empty_text_and_missing_end():
+    caller = make_caller()
+    caller._render(AudioChunk(path="c0.ogg", start_sec=10.0), {"segments": [
+        {"start": 0, "end": 1, "text": "  "},
+        {"start": 3, "text": "終わりなし"},
+    ]})
+    assert caller.transcription.transcription == "[0:00:13] 終わりなし\n"
+    assert caller.transcription.segments == [{"start_sec": 13.0, "end_sec": None, "text": "終わりなし"}]
+
+
+def test_times_are_mapped_back_after_silence_removal():
+    # 静音除去後の 0〜2秒 は元の 61〜63秒、2〜3秒 は元の 70〜71秒
+    time_map = TimeMap([(0.0, 1.0, 2.0), (2.0, 10.0, 1.0)]).shifted(60.0)
+    caller = make_caller()
+    caller._render(AudioChunk(path="c1.ogg", start_sec=60.0, time_map=time_map), {"segments": [
+        {"start": 0.5, "end": 1.5, "text": "前半"},
+        {"start": 2.25, "end": 2.75, "text": "後半"},
+    ]})
+
+    assert caller.transcription.transcription == "[0:01:01] 前半\n[0:01:10] 後半\n"
+    assert [(s["start_sec"], s["end_sec"]) for s in caller.transcription.segments] == [
+        pytest.approx((61.5, 62.5)),
+        pytest.approx((70.25, 70.75)),
+    ]
+    # 生データにも対応表を残す
+    assert caller.rendered_chunks[0]["time_map"] == time_map.to_list()
+
+
+def test_chunk_text_is_kept_for_summary():
+    caller = make_caller()
+    caller._render(AudioChunk(path="c0.ogg"), {"segments": [{"start": 0, "end": 1, "text": "要約の材料"}]})
+    assert caller._chunk_texts == ["[0:00:00] 要約の材料"]
+
+
+class FakeFiles:
+    def __init__(self, client: "FakeClient"):
+        self.client = client
+
+    def upload(self, file, config):
+        with self.client.lock:
+            self.client.uploaded.append(config["display_name"])
+            return SimpleNamespace(name=f"files/{len(self.client.uploaded)}")
+
+    def delete(self, name):
+        with self.client.lock:
+            self.client.deleted_files.append(name)
+
+
+class FakeModels:
+    def __init__(self, client: "FakeClient"):
+        self.client = client
+
+    def generate_content(self, model, contents, config=None):
+        with self.client.lock:
+            self.client.generated.append((contents, config))
+        audio = contents[-1]
+        return SimpleNamespace(text=f"text of {getattr(audio, 'name', 'inline')}")
+
+    def count_tokens(self, model, contents):
+        self.client.counted += 1
+        return SimpleNamespace(total_tokens=self.client.instruction_tokens)
+
+
+class FakeCaches:
+    def __init__(self, client: "FakeClient"):
+        self.client = client
+
+    def create(self, model, config):
+        if self.client.cache_error is not None:
+            raise self.client.cache_error
+        self.client.created_caches.append(config["contents"])
+        return SimpleNamespace(name="cachedContents/1")
+
+    def delete(self, name):
+        self.client.deleted_caches.append(name)
+
+
+class FakeClient:
+    """アップロード・生成・キャッシュの呼び出しを記録する genai.Client の代わり"""
+
+    def __init__(self, instruction_tokens: int = 300):
+        self.lock = threading.Lock()
+        self.instruction_tokens = instruction_tokens
+        self.cache_error: Exception | None = None
+        self.counted = 0
+        self.uploaded: list[str] = []
+        self.deleted_files: list[str] = []
+        self.generated: list = []
+        self.created_caches: list = []
+        self.deleted_caches: list[str] = []
+        self.files = FakeFiles(self)
+        self.models = FakeModels(self)
+        self.caches = FakeCaches(self)
+
+
+def uploading_caller(monkeypatch, client: FakeClient) -> GeminiTranscriptionCaller:
+    # どの大きさの分割ファイルもアップロードして送る
+    monkeypatch.setattr(lib.gemini_caller, "INLINE_MAX_BYTES", -1)
+    caller = GeminiTranscriptionCaller("dummy-key", False)
+    caller.client = client
+    return caller
+
+
+def chunk_files(tmp_path, count: int) -> list[AudioChunk]:
+    chunks = []
+    for index in range(count):
+        path = tmp_path / f"split-{index:03d}.ogg"
+        path.write_bytes(b"audio")
+        chunks.append(AudioChunk(path=str(path), index=index, start_sec=index * 60.0))
+    return chunks
+
+
+def janitor_threads() -> list[threading.Thread]:
+    return [thread for thread in threading.enumerate() if thread.name.startswith(("gemini-janitor", "gemini-upload"))]
+
+
+class TestUploads:
+    def test_prefetched_uploads_are_used_and_deleted(self, tmp_path, monkeypatch):
+        client = FakeClient()
+        caller = uploading_caller(monkeypatch, client)
+        caller.set_parallelism(2)
+
+        caller.transcribe_chunk_stream(chunk_files(tmp_path, 3))
+
+        assert sorted(client.uploaded) == ["split-000.ogg", "split-001.ogg", "split-002.ogg"]
+        # 各アップロードは1回だけ送り、送った後で消す
+        sent = sorted(contents[-1].name for contents, _config in client.generated)
+        assert sent == ["files/1", "files/2", "files/3"]
+        assert sorted(client.deleted_files) == sent
+        # 終わったら裏のスレッドは残さない
+        assert caller._janitor is None and caller._upload_executor is None
+        assert janitor_threads() == []
+
+    def test_unsent_prefetch_is_deleted_on_close(self, tmp_path, monkeypatch):
+        client = FakeClient()
+        caller = uploading_caller(monkeypatch, client)
+        chunk = chunk_files(tmp_path, 1)[0]
+
+        caller._prefetch_chunk(chunk)
+        caller.close()
+
+        assert client.uploaded == ["split-000.ogg"]
+        assert client.deleted_files == ["files/1"]
+        assert client.generated == []
+        assert janitor_threads() == []
+
+    def test_close_after_failure_stops_threads(self, tmp_path, monkeypatch):
+        client = FakeClient()
+        caller = uploading_caller(monkeypatch, client)
+
+        def fail(**kwargs):
+            raise RuntimeError("bad request")
+
+        monkeypatch.setattr(client.models, "generate_content", fail)
+        with pytest.raises(RuntimeError):
+            caller.transcribe_chunk_stream(chunk_files(tmp_path, 2))
+
+        # 送れなかった分も含め、アップロードしたものはすべて消す
+        assert sorted(client.deleted_files) == sorted(f"files/{n}" for n in range(1, len(client.uploaded) + 1))
+        assert janitor_threads() == []
+
+
+class TestInstructionCache:
+    def test_long_instruction_is_cached_for_the_job(self, tmp_path, monkeypatch):
+        client = FakeClient(instruction_tokens=5000)
+        caller = uploading_caller(monkeypatch, client)
+        caller.set_scheduler(RateLimitScheduler(ProviderQuota(max_concurrency=1)))
+
+        caller.transcribe_chunk_stream(chunk_files(tmp_path, 2))
+
+        assert client.counted == 1
+        assert client.created_caches == [[caller._build_instruction()]]
+        # 各リクエストは音声だけを送り、キャッシュを参照する
+        for contents, config in client.generated:
+            assert len(contents) == 1
+            assert config["cached_content"] == "cachedContents/1"
+        # 計測と作成もスケジューラの枠を取って送ったリクエストとして数える
+        assert caller.request_count == 4
+        assert client.deleted_caches == ["cachedContents/1"]
+
+    def test_short_instruction_is_sent_each_time(self, tmp_path, monkeypatch):
+        client = FakeClient(instruction_tokens=300)
+        caller = uploading_caller(monkeypatch, client)
+
+        caller.transcribe_chunk_stream(chunk_files(tmp_path, 2))
+
+        assert client.created_caches == []
+        assert [contents[0] for contents, _config in client.generated] == [caller._build_instruction()] * 2
+        assert client.deleted_caches == []
+
+    def test_create_failure_falls_back_to_inline_instruction(self, tmp_path, monkeypatch):
+        client = FakeClient(instruction_tokens=5000)
+        client.cache_error = RuntimeError("model does not support caching")
+        caller = uploading_caller(monkeypatch, client)
+
+        caller.transcribe_chunk_stream(chunk_files(tmp_path, 2))
+
+        assert len(client.generated) == 2
+        assert all(config is None for _contents, config in client.generated)
+        assert client.deleted_caches == []
+
+    def test_cache_is_deleted_when_job_fails(self, tmp_path, monkeypatch):
+        client = FakeClient(instruction_tokens=5000)
+        caller = uploading_caller(monkeypatch, client)
+
+        def fail(**kwargs):
+            raise RuntimeError("bad request")
+
+        monkeypatch.setattr(client.models, "generate_content", fail)
+        with pytest.raises(RuntimeError):
+            caller.transcribe_chunk_stream(chunk_files(tmp_path, 1))
+
+        assert client.deleted_caches == ["cachedContents/1"]
+        # 次のジョブでは作り直す
+        assert caller._cache_name is None and not caller._cache_tried
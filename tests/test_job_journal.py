@@ -0,0 +1,52 @@
+from lib.audio_chunk import AudioChunk
+from lib.job_journal import JobJournal, file_sha256, job_id
+
+
+def test_resume_reuses_recorded_responses(tmp_path):
+    path = str(tmp_path / "job.jsonl")
+    journal = JobJournal(path)
+    journal.record(AudioChunk(path="a.ogg", index=0), "hash-a", {"text": "こんにちは"})
+    journal.record(AudioChunk(path="b.ogg", index=1, start_sec=60.0), "hash-b", "二つ目")
+
+    # 再実行では、同じ中身の分割ファイルの結果がファイルから読み込まれる
+    resumed = JobJournal(path)
+    assert len(resumed) == 2
+    assert resumed.lookup("hash-a") == (True, {"text": "こんにちは"})
+    assert resumed.lookup("hash-b") == (True, "二つ目")
+    assert resumed.lookup("hash-c") == (False, None)
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / "job.jsonl"
+    journal = JobJournal(str(path))
+    journal.record(AudioChunk(path="a.ogg"), "hash-a", "一つ目")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"index": 1, "sha256": "hash-b", "resp')
+
+    resumed = JobJournal(str(path))
+    assert len(resumed) == 1
+    assert resumed.lookup("hash-b") == (False, None)
+
+
+def test_complete_removes_journal(tmp_path):
+    path = tmp_path / "job.jsonl"
+    journal = JobJournal(str(path))
+    journal.record(AudioChunk(path="a.ogg"), "hash-a", "一つ目")
+    journal.complete()
+    assert not path.exists()
+    assert len(JobJournal(str(path))) == 0
+    # 既に無くても失敗しない
+    journal.complete()
+
+
+def test_identity_is_by_content(tmp_path):
+    first = tmp_path / "chunk_000.ogg"
+    second = tmp_path / "別の名前.ogg"
+    first.write_bytes(b"same audio")
+    second.write_bytes(b"same audio")
+    assert file_sha256(str(first)) == file_sha256(str(second))
+
+
+def test_job_id_ignores_key_order():
+    assert job_id({"file": "a.mp3", "model": "whisper-1"}) == job_id({"model": "whisper-1", "file": "a.mp3"})
+    assert job_id({"file": "a.mp3", "model": "whisper-1"}) != job_id({"file": "a.mp3", "model": "scribe_v1"})
@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+import pytest
+from lib.job_workspace import (
+    KEEP_ALWAYS,
+    KEEP_MARKER,
+    KEEP_NEVER,
+    KEEP_ON_ERROR,
+    STALE_AFTER_SEC,
+    WorkspaceManager,
+    WorkspaceSettings,
+)
+
+MB = 1024 * 1024
+
+
+def manager(tmp_path, **kwargs) -> WorkspaceManager:
+    return WorkspaceManager(WorkspaceSettings(root=str(tmp_path), **kwargs))
+
+
+def open_in_thread(workspaces: WorkspaceManager, reserve_bytes: int):
+    opened: list = []
+    thread = threading.Thread(target=lambda: opened.append(workspaces.open("second", reserve_bytes)), daemon=True)
+    thread.start()
+    return thread, opened
+
+
+class TestBudget:
+    def test_reservation_blocks_concurrent_open(self, tmp_path):
+        # 1つ目はまだ何も書いていないが、見積もりの分だけ使用中として数える
+        workspaces = manager(tmp_path, max_size_mb=1)
+        first = workspaces.open("first", MB * 3 // 4)
+
+        thread, opened = open_in_thread(workspaces, MB * 3 // 4)
+        time.sleep(0.2)
+        assert opened == []
+
+        first.close()
+        thread.join(timeout=5)
+        assert len(opened) == 1
+        opened[0].close()
+
+    def test_actual_size_counts_when_larger(self, tmp_path):
+        workspaces = manager(tmp_path, max_size_mb=1)
+        first = workspaces.open("first", 0)
+        with open(os.path.join(first.path, "pcm.s16le"), "wb") as f:
+            f.write(bytes(MB * 3 // 4))
+
+        thread, opened = open_in_thread(workspaces, MB // 2)
+        time.sleep(0.2)
+        assert opened == []
+
+        first.close()
+        thread.join(timeout=5)
+        assert len(opened) == 1
+        opened[0].close()
+
+    def test_fits_within_budget(self, tmp_path):
+        workspaces = manager(tmp_path, max_size_mb=1)
+        with workspaces.open("first", MB // 4), workspaces.open("second", MB // 4):
+            pass
+
+    def test_first_job_starts_even_if_over_budget(self, tmp_path):
+        workspaces = manager(tmp_path, max_size_mb=1)
+        with workspaces.open("first", 10 * MB) as workspace:
+            assert os.path.isdir(workspace.path)
+
+    def test_unlimited(self, tmp_path):
+        workspaces = manager(tmp_path)
+        with workspaces.open("first", 10 * MB), workspaces.open("second", 10 * MB):
+            pass
+
+
+class TestKeepPolicy:
+    @pytest.mark.parametrize(
+        "keep, failed, kept",
+        [
+            (KEEP_NEVER, False, False),
+            (KEEP_NEVER, True, False),
+            (KEEP_ON_ERROR, False, False),
+            (KEEP_ON_ERROR, True, True),
+            (KEEP_ALWAYS, False, True),
+        ],
+    )
+    def test_close(self, tmp_path, keep, failed, kept):
+        workspaces = manager(tmp_path, keep=keep)
+        workspace = workspaces.open("job")
+        workspace.close(failed=failed)
+
+        assert os.path.isdir(workspace.path) == kept
+        assert os.path.exists(os.path.join(workspace.path, KEEP_MARKER)) == kept
+
+    def test_exception_counts_as_failure(self, tmp_path):
+        workspaces = manager(tmp_path, keep=KEEP_ON_ERROR)
+        with pytest.raises(RuntimeError):
+            with workspaces.open("job") as workspace:
+                raise RuntimeError("failed")
+
+        assert os.path.exists(os.path.join(workspace.path, KEEP_MARKER))
+
+    def test_kept_workspace_frees_budget(self, tmp_path):
+        # 残した作業ディレクトリは実行中のジョブとして数えない
+        workspaces = manager(tmp_path, keep=KEEP_ALWAYS, max_size_mb=1)
+        with workspaces.open("running", MB // 4):
+            kept = workspaces.open("kept", 0)
+            with open(os.path.join(kept.path, "pcm.s16le"), "wb") as f:
+                f.write(bytes(MB))
+            kept.close()
+
+            thread, opened = open_in_thread(workspaces, MB // 2)
+            thread.join(timeout=5)
+            assert len(opened) == 1
+            opened[0].close()
+
+
+def test_stale_workspaces_are_swept(tmp_path):
+    stale = tmp_path / "job_old_1"
+    kept = tmp_path / "job_old_2"
+    recent = tmp_path / "job_new_3"
+    for path in (stale, kept, recent):
+        path.mkdir()
+    (kept / KEEP_MARKER).touch()
+    old = time.time() - STALE_AFTER_SEC - 60
+    os.utime(stale, (old, old))
+    os.utime(kept, (old, old))
+
+    with manager(tmp_path).open("job"):
+        pass
+
+    assert not stale.exists()
+    assert kept.exists()
+    assert recent.exists()
@@ -0,0 +1,53 @@
+import pytest
+from lib.gemini_caller import GeminiTranscriptionCaller
+from lib.model_profile import (
+    CHUNKING_CAPABILITIES,
+    MB,
+    MODEL_CHUNKING_CAPABILITIES,
+    PROVIDER_PRESETS,
+    ChunkingCapability,
+    chunking_capability,
+)
+
+
+class TestChunkingCapability:
+    def test_provider_default(self):
+        assert chunking_capability("openai", "whisper-1") is CHUNKING_CAPABILITIES["openai"]
+        assert chunking_capability("elevenlabs", "scribe_v1") is CHUNKING_CAPABILITIES["elevenlabs"]
+
+    def test_model_override(self):
+        # gpt-4o 系は Whisper と同じ 25MB でも、長さに上限がある
+        capability = chunking_capability("openai", "gpt-4o-transcribe")
+        assert capability is MODEL_CHUNKING_CAPABILITIES["gpt-4o-transcribe"]
+        assert capability.max_bytes == 25 * MB
+        assert capability.chunk_sec == 20 * 60
+
+    def test_unknown_provider_falls_back_to_strictest(self):
+        assert chunking_capability("unknown", "some-model") is CHUNKING_CAPABILITIES["openai"]
+
+    @pytest.mark.parametrize("provider", sorted(PROVIDER_PRESETS))
+    def test_every_preset_has_a_capability(self, provider):
+        for model in PROVIDER_PRESETS[provider]:
+            capability = chunking_capability(provider, model)
+            assert capability.max_bytes > 0
+            assert capability.max_parallelism >= 1
+            if capability.max_duration_sec is not None:
+                assert capability.chunk_sec <= capability.max_duration_sec
+
+    def test_chunk_sec_is_capped_by_max_duration(self):
+        capability = ChunkingCapability(max_bytes=MB, max_duration_sec=600, preferred_chunk_sec=1200, max_parallelism=1)
+        assert capability.chunk_sec == 600
+
+    def test_chunk_sec_without_max_duration(self):
+        capability = ChunkingCapability(max_bytes=MB, max_duration_sec=None, preferred_chunk_sec=1200, max_parallelism=1)
+        assert capability.chunk_sec == 1200
+
+
+def test_caller_uses_its_model():
+    caller = GeminiTranscriptionCaller("dummy-key", False)
+    assert caller.chunking() is CHUNKING_CAPABILITIES["google"]
+
+    caller.set_model("gemini-2.0-flash")
+    assert caller.chunking() is MODEL_CHUNKING_CAPABILITIES["gemini-2.0-flash"]
+    # 1時間の音声は、長さの目安（20分）で3つに分ける
+    assert caller.planned_chunk_count(60 * 60, 10 * MB) == 3
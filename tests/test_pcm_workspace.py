@@ -0,0 +1,172 @@
+import os
+import wave
+import numpy as np
+import pytest
+import lib.pcm_workspace
+from lib.pcm_workspace import PARALLEL_DECODE_MIN_SEC, PCM_BLOCK_SEC, WORKSPACE_FILENAME, PcmWorkspace, decode_ranges
+from lib.silence_detector import SilenceDetector
+from tests.test_silence_detector import random_pattern, synth
+
+
+def workspace_of(tmp_path, samples: np.ndarray, sample_rate: int) -> PcmWorkspace:
+    path = tmp_path / "pcm.s16le"
+    path.write_bytes(samples.tobytes())
+    return PcmWorkspace(str(path), sample_rate, samples.shape[1])
+
+
+class TestSpeechIntervals:
+    @pytest.mark.parametrize("seed", range(3))
+    def test_streamed_detection_matches_batch(self, tmp_path, seed):
+        # ブロック境界 (PCM_BLOCK_SEC 秒) をまたぐ長さにする
+        sample_rate = 16000
+        samples = synth(random_pattern((PCM_BLOCK_SEC * 2 + 3) * 1000, seed), sample_rate, channels=2, seed=seed)
+
+        with workspace_of(tmp_path, samples, sample_rate) as workspace:
+            intervals = workspace.speech_intervals(SilenceDetector())
+
+        assert intervals == SilenceDetector().speech_intervals(samples, sample_rate)
+
+
+class TestBlocks:
+    def test_whole_audio_in_fixed_blocks(self, tmp_path):
+        sample_rate = 1000
+        samples = np.arange((PCM_BLOCK_SEC * 2 + 3) * sample_rate, dtype=np.int16).reshape(-1, 1)
+        with workspace_of(tmp_path, samples, sample_rate) as workspace:
+            blocks = [np.array(block) for block in workspace.blocks()]
+
+        assert [len(block) for block in blocks] == [PCM_BLOCK_SEC * sample_rate] * 2 + [3 * sample_rate]
+        assert np.array_equal(np.concatenate(blocks), samples)
+
+    def test_intervals_are_joined_and_realigned(self, tmp_path):
+        # つないだ音声も PCM_BLOCK_SEC 秒ずつのブロックにそろえて返す
+        sample_rate = 1000
+        samples = np.arange(30 * sample_rate, dtype=np.int16).reshape(-1, 1)
+        intervals = [(1000, 8500), (12000, 20000), (25000, 26000)]
+        with workspace_of(tmp_path, samples, sample_rate) as workspace:
+            blocks = [np.array(block) for block in workspace.blocks(intervals)]
+
+        expected = np.concatenate([samples[start:end] for start, end in intervals])
+        assert [len(block) for block in blocks] == [PCM_BLOCK_SEC * sample_rate, 6500]
+        assert np.array_equal(np.concatenate(blocks), expected)
+
+
+class TestWorkspace:
+    def test_duration_and_speech_ratio(self, tmp_path):
+        samples = np.zeros((8000 * 4, 2), dtype=np.int16)
+        with workspace_of(tmp_path, samples, 8000) as workspace:
+            assert workspace.duration_sec == 4.0
+            assert workspace.speech_ratio([(0, 1000), (2000, 3000)]) == 0.5
+
+    def test_empty_file(self, tmp_path):
+        with workspace_of(tmp_path, np.zeros((0, 1), dtype=np.int16), 16000) as workspace:
+            assert workspace.duration_sec == 0.0
+            assert list(workspace.blocks()) == []
+            assert workspace.speech_ratio([]) == 0.0
+
+    def test_close_removes_file(self, tmp_path):
+        workspace = workspace_of(tmp_path, np.ones((16000, 1), dtype=np.int16), 16000)
+        workspace.close()
+
+        assert not os.path.exists(workspace.path)
+        assert workspace.duration_sec == 0.0
+
+
+def source_samples(seconds: int, sample_rate: int, channels: int) -> np.ndarray:
+    """フレームごとに値が変わる音声。位置がずれると一致しない"""
+    frames = np.arange(seconds * sample_rate) % 30000
+    return np.repeat(frames[:, None], channels, axis=1).astype(np.int16)
+
+
+def fake_decoder(samples: np.ndarray, sample_rate: int, ranges: list, length_error: dict[int, int] | None = None):
+    """decode_pcm_blocks の代わりに samples の該当範囲を返す。
+    length_error で、開始秒ごとに実際より長く・短く返すフレーム数を指定できる"""
+    length_error = length_error or {}
+
+    def decode_pcm_blocks(input_file, rate, channels, start_sec=None, duration_sec=None):
+        ranges.append((start_sec, duration_sec))
+        first = int(start_sec * sample_rate)
+        last = len(samples) if duration_sec is None else first + int(duration_sec * sample_rate)
+        last += length_error.get(int(start_sec), 0)
+        part = samples[first:last]
+        block_frames = sample_rate * PCM_BLOCK_SEC
+        for start in range(0, len(part), block_frames):
+            yield part[start:start + block_frames]
+
+    return decode_pcm_blocks
+
+
+def read_raw(path: str, channels: int) -> np.ndarray:
+    with open(path, "rb") as f:
+        return np.frombuffer(f.read(), dtype=np.int16).reshape(-1, channels)
+
+
+class TestDecodeRanges:
+    def test_ranges_are_written_in_place(self, tmp_path, monkeypatch):
+        samples = source_samples(95, 100, 2)
+        ranges: list = []
+        monkeypatch.setattr(lib.pcm_workspace, "decode_pcm_blocks", fake_decoder(samples, 100, ranges))
+        path = str(tmp_path / WORKSPACE_FILENAME)
+
+        decode_ranges("input.m4a", path, 100, 2, 95.0, 4)
+
+        # 1秒単位にそろえた範囲に分け、最後の範囲だけは長さを指定しない
+        assert sorted(ranges) == [(0.0, 24), (24.0, 24), (48.0, 24), (72.0, None)]
+        assert np.array_equal(read_raw(path, 2), samples)
+
+    def test_overlong_range_is_truncated(self, tmp_path, monkeypatch):
+        # ffmpeg が指定より少し長く返しても、次の範囲の位置を上書きしない
+        samples = source_samples(40, 100, 1)
+        monkeypatch.setattr(lib.pcm_workspace, "decode_pcm_blocks", fake_decoder(samples, 100, [], {0: 30}))
+        path = str(tmp_path / WORKSPACE_FILENAME)
+
+        decode_ranges("input.m4a", path, 100, 1, 40.0, 2)
+
+        assert np.array_equal(read_raw(path, 1), samples)
+
+    def test_short_range_is_padded_with_silence(self, tmp_path, monkeypatch):
+        samples = source_samples(40, 100, 1)
+        monkeypatch.setattr(lib.pcm_workspace, "decode_pcm_blocks", fake_decoder(samples, 100, [], {0: -50}))
+        path = str(tmp_path / WORKSPACE_FILENAME)
+
+        decode_ranges("input.m4a", path, 100, 1, 40.0, 2)
+
+        expected = samples.copy()
+        expected[1950:2000] = 0
+        assert np.array_equal(read_raw(path, 1), expected)
+
+    def test_last_range_reads_past_estimate(self, tmp_path, monkeypatch):
+        # 見積もりより長い音声も末尾まで書く
+        samples = source_samples(45, 100, 1)
+        monkeypatch.setattr(lib.pcm_workspace, "decode_pcm_blocks", fake_decoder(samples, 100, []))
+        path = str(tmp_path / WORKSPACE_FILENAME)
+
+        decode_ranges("input.m4a", path, 100, 1, 40.0, 2)
+
+        assert np.array_equal(read_raw(path, 1), samples)
+
+
+class TestDecode:
+    def test_long_audio_is_decoded_in_parallel(self, tmp_path, monkeypatch):
+        calls: list = []
+        monkeypatch.setattr(lib.pcm_workspace, "decode_ranges", lambda *args: calls.append(args))
+        (tmp_path / WORKSPACE_FILENAME).write_bytes(b"")
+
+        workspace = PcmWorkspace.decode("input.m4a", str(tmp_path), 16000, 1, PARALLEL_DECODE_MIN_SEC, 4)
+        workspace.close()
+
+        assert calls == [("input.m4a", workspace.path, 16000, 1, PARALLEL_DECODE_MIN_SEC, 4)]
+
+    def test_wav_is_read_without_ffmpeg(self, tmp_path):
+        samples = source_samples(3, 8000, 2)
+        input_file = str(tmp_path / "input.wav")
+        with wave.open(input_file, "wb") as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(8000)
+            wav.writeframes(samples.tobytes())
+        directory = tmp_path / "work"
+        directory.mkdir()
+
+        with PcmWorkspace.decode(input_file, str(directory), 8000, 2) as workspace:
+            assert workspace.duration_sec == 3.0
+            assert np.array_equal(workspace.samples, samples)
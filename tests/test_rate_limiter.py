@@ -0,0 +1,125 @@
+import asyncio
+import email.utils
+import time
+import pytest
+from lib.rate_limiter import DEFAULT_RETRY_AFTER_SEC, ProviderQuota, RateLimitScheduler, parse_retry_after
+
+
+class TestParseRetryAfter:
+    def test_seconds(self):
+        assert parse_retry_after({"retry-after": "3"}) == 3.0
+
+    def test_milliseconds_take_precedence(self):
+        assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "10"}) == 1.5
+
+    def test_http_date(self):
+        future = email.utils.formatdate(time.time() + 30, usegmt=True)
+        assert parse_retry_after({"retry-after": future}) == pytest.approx(30, abs=2)
+
+    def test_past_date_is_zero(self):
+        past = email.utils.formatdate(time.time() - 30, usegmt=True)
+        assert parse_retry_after({"retry-after": past}) == 0.0
+
+    def test_negative_is_clamped(self):
+        assert parse_retry_after({"retry-after": "-5"}) == 0.0
+
+    @pytest.mark.parametrize("headers", [None, {}, {"retry-after": ""}, {"retry-after": "soon"}, object()])
+    def test_missing_or_invalid(self, headers):
+        assert parse_retry_after(headers) is None
+
+
+def scheduler(max_concurrency=8, **kwargs) -> RateLimitScheduler:
+    return RateLimitScheduler(ProviderQuota(max_concurrency=max_concurrency, **kwargs))
+
+
+class TestAimd:
+    def test_throttle_halves_limit(self):
+        s = scheduler(8)
+        s.acquire()
+        s.release(throttled=True, retry_after=0)
+        assert s.limit == 4.0
+        s.acquire()
+        s.release(throttled=True, retry_after=0)
+        assert s.limit == 2.0
+
+    def test_limit_never_below_one(self):
+        s = scheduler(2)
+        for _ in range(5):
+            s.acquire()
+            s.release(throttled=True, retry_after=0)
+        assert s.limit == 1.0
+
+    def test_success_grows_by_inverse_limit(self):
+        s = scheduler(8)
+        s.limit = 2.0
+        # 1回の成功で 1/枠数 だけ増え、枠数ぶん成功すると約1枠増える
+        s.acquire()
+        s.release()
+        assert s.limit == pytest.approx(2.5)
+        s.acquire()
+        s.release()
+        assert 2.5 < s.limit < 3.0
+
+    def test_growth_stops_at_max_concurrency(self):
+        s = scheduler(3)
+        for _ in range(20):
+            s.acquire()
+            s.release()
+        assert s.limit == 3.0
+
+    def test_failure_keeps_limit(self):
+        s = scheduler(8)
+        s.limit = 2.0
+        s.acquire()
+        s.release(failed=True)
+        assert s.limit == 2.0
+        assert s.in_flight == 0
+
+    def test_throttle_blocks_for_retry_after(self):
+        s = scheduler(8)
+        s.acquire()
+        s.release(throttled=True, retry_after=30)
+        assert s._try_acquire(0) == pytest.approx(30, abs=1)
+        assert s.in_flight == 0
+
+    def test_throttle_without_retry_after_uses_default(self):
+        s = scheduler(8)
+        s.acquire()
+        s.release(throttled=True)
+        assert s._try_acquire(0) == pytest.approx(DEFAULT_RETRY_AFTER_SEC, abs=1)
+
+    def test_in_flight_is_capped_by_limit(self):
+        s = scheduler(2)
+        s.acquire()
+        s.acquire()
+        assert s._try_acquire(0) > 0
+        s.release()
+        assert s._try_acquire(0) == 0
+
+
+class TestBuckets:
+    def test_requests_per_min(self):
+        s = scheduler(16, requests_per_min=2)
+        for _ in range(2):
+            s.acquire()
+            s.release()
+        # 3件目は補充（30秒で1件）を待つ
+        assert s._try_acquire(0) == pytest.approx(30, abs=1)
+
+    def test_audio_sec_per_min(self):
+        s = scheduler(16, audio_sec_per_min=600)
+        assert s.needs_audio_sec
+        s.acquire(audio_sec=600)
+        s.release()
+        assert s._try_acquire(60) == pytest.approx(6, abs=0.5)
+
+    def test_acquire_async(self):
+        s = scheduler(1)
+
+        async def run():
+            await s.acquire_async()
+            assert s.in_flight == 1
+            s.release()
+
+        asyncio.run(run())
+        assert s.in_flight == 0
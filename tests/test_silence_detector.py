@@ -0,0 +1,129 @@
+import math
+import numpy as np
+import pytest
+from lib.silence_detector import SilenceDetector, ms_power, ms_to_frame
+
+
+def synth(pattern: list[tuple[int, bool]], sample_rate: int, channels: int = 1, seed: int = 0) -> np.ndarray:
+    """(長さms, 発話か) の並びから int16 PCM を作る。無音部分も -55dBFS 未満の小さなノイズにする"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for length_ms, speech in pattern:
+        frames = ms_to_frame(length_ms, sample_rate)
+        amplitude = 8000 if speech else 20
+        parts.append(rng.integers(-amplitude, amplitude + 1, size=(frames, channels)))
+    return np.concatenate(parts).astype(np.int16)
+
+
+def random_pattern(total_ms: int, seed: int) -> list[tuple[int, bool]]:
+    rng = np.random.default_rng(seed)
+    pattern: list[tuple[int, bool]] = []
+    speech = bool(rng.integers(2))
+    while sum(length for length, _ in pattern) < total_ms:
+        # 窓 (100ms) や余白 (100ms) 前後の長さを多めに混ぜる
+        pattern.append((int(rng.choice([30, 90, 100, 101, 199, 200, 250, 800, 1500])), speech))
+        speech = not speech
+    return pattern
+
+
+def blocks_of(samples: np.ndarray, sample_rate: int, seconds: list[int]):
+    """1秒の整数倍の長さのブロックに分けて順に返す（最後は端数）"""
+    position = 0
+    index = 0
+    while position < len(samples):
+        size = seconds[index % len(seconds)] * sample_rate
+        yield samples[position: position + size]
+        position += size
+        index += 1
+
+
+def brute_force_silences(samples: np.ndarray, sample_rate: int, detector: SilenceDetector) -> list[tuple[int, int]]:
+    """窓を1msずつずらして RMS を直接比べる、遅いが素直な実装"""
+    power, counts = ms_power(samples, sample_rate)
+    window = detector.min_silence_ms
+    ranges: list[tuple[int, int]] = []
+    for start in range(len(power) - window + 1):
+        if power[start: start + window].sum() < detector.threshold_power * counts[start: start + window].sum():
+            end = start + window
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+    return ranges
+
+
+class TestSpeechIntervals:
+    def test_pads_speech_with_kept_silence(self):
+        samples = synth([(1000, True), (1000, False), (1000, True)], 16000)
+        assert SilenceDetector().speech_intervals(samples, 16000) == [(0, 1100), (1900, 3000)]
+
+    def test_short_gap_is_not_removed(self):
+        samples = synth([(1000, True), (150, False), (1000, True)], 16000)
+        assert SilenceDetector().speech_intervals(samples, 16000) == [(0, 2150)]
+
+    def test_all_silent(self):
+        samples = synth([(2000, False)], 16000)
+        assert SilenceDetector().speech_intervals(samples, 16000) == []
+
+    def test_shorter_than_window_is_kept(self):
+        samples = synth([(50, False)], 16000)
+        assert SilenceDetector().speech_intervals(samples, 16000) == [(0, 50)]
+
+    def test_threshold(self):
+        detector = SilenceDetector(silence_thresh_dbfs=-55)
+        # -55dBFS は振幅 58 前後。それより十分大きい一定の振幅は発話扱い
+        loud = np.full((16000, 1), 200, dtype=np.int16)
+        quiet = np.full((16000, 1), 20, dtype=np.int16)
+        assert detector.speech_intervals(loud, 16000) == [(0, 1000)]
+        assert detector.speech_intervals(quiet, 16000) == []
+
+
+class TestStream:
+    @pytest.mark.parametrize("sample_rate", [16000, 44100])
+    @pytest.mark.parametrize("seed", range(4))
+    @pytest.mark.parametrize("seconds", [[1], [2, 1, 3], [5]])
+    def test_matches_batch_across_block_boundaries(self, sample_rate, seed, seconds):
+        samples = synth(random_pattern(7300, seed), sample_rate, channels=2, seed=seed)
+        batch = SilenceDetector()
+        intervals = batch.speech_intervals(samples, sample_rate)
+        expected = [samples[ms_to_frame(start, sample_rate): ms_to_frame(end, sample_rate)] for start, end in intervals]
+
+        detector = SilenceDetector()
+        streamed = list(detector.stream(blocks_of(samples, sample_rate, seconds), sample_rate))
+
+        assert detector.kept_intervals == intervals
+        assert detector.total_ms == math.ceil(len(samples) * 1000 / sample_rate)
+        assert detector.kept_ms == sum(end - start for start, end in intervals)
+        if expected:
+            assert np.array_equal(np.concatenate(streamed), np.concatenate(expected))
+        else:
+            assert sum(len(part) for part in streamed) == 0
+
+    def test_boundary_inside_silence_window(self):
+        # 無音が1秒のブロック境界をまたぐ
+        sample_rate = 16000
+        samples = synth([(950, True), (120, False), (930, True), (400, False), (600, True)], sample_rate)
+        detector = SilenceDetector()
+        list(detector.stream(blocks_of(samples, sample_rate, [1]), sample_rate))
+        assert detector.kept_intervals == SilenceDetector().speech_intervals(samples, sample_rate)
+
+    def test_empty_input(self):
+        detector = SilenceDetector()
+        assert list(detector.stream([], 16000)) == []
+        assert detector.kept_intervals == []
+        assert detector.total_ms == 0
+
+
+class TestSilences:
+    @pytest.mark.parametrize("seed", range(3))
+    @pytest.mark.parametrize("seconds", [[1], [3, 1]])
+    def test_matches_brute_force(self, seed, seconds):
+        sample_rate = 8000
+        detector = SilenceDetector(silence_thresh_dbfs=-40, min_silence_ms=300)
+        samples = synth(random_pattern(6200, seed), sample_rate, seed=seed)
+        expected = brute_force_silences(samples, sample_rate, detector)
+        assert detector.silences(blocks_of(samples, sample_rate, seconds), sample_rate) == expected
+
+    def test_simple_gap(self):
+        samples = synth([(1000, True), (1000, False), (1000, True)], 16000)
+        assert SilenceDetector().silences(blocks_of(samples, 16000, [1]), 16000) == [(1000, 2000)]
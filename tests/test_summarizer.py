@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+import lib.summarizer as summarizer
+from lib.summarizer import FINAL_INSTRUCTION, MAP_INSTRUCTION, REDUCE_INSTRUCTION, MapReduceSummarizer, pack_texts
+
+
+class FakeModel:
+    """指示文ごとに呼ばれた回数を数え、入力が分かる応答を返す"""
+
+    def __init__(self, delay: bool = False):
+        self.calls: list[tuple[str, str]] = []
+        self.delay = delay
+        self._lock = threading.Lock()
+
+    def __call__(self, instruction: str, text: str) -> str:
+        if self.delay:
+            time.sleep(random.uniform(0, 0.01))
+        with self._lock:
+            self.calls.append((instruction, text))
+        if instruction == FINAL_INSTRUCTION:
+            return f" 要約({text}) \n"
+        return f"メモ[{text}]"
+
+    def count(self, instruction: str) -> int:
+        return sum(1 for called, _text in self.calls if called == instruction)
+
+
+def test_no_text_makes_no_request():
+    model = FakeModel()
+    assert MapReduceSummarizer(model).summarize(["", "  \n"]) == ""
+    assert model.calls == []
+
+
+def test_short_transcript_is_summarized_in_one_request():
+    model = FakeModel()
+    result = MapReduceSummarizer(model).summarize(["一つ目", " 二つ目 "])
+    assert result == "要約(一つ目\n\n二つ目)"
+    assert model.calls == [(FINAL_INSTRUCTION, "一つ目\n\n二つ目")]
+
+
+def test_long_transcript_is_mapped_then_summarized(monkeypatch):
+    monkeypatch.setattr(summarizer, "MAP_MAX_CHARS", 10)
+    model = FakeModel()
+    result = MapReduceSummarizer(model).summarize(["あ" * 8, "い" * 8, "う" * 8])
+    assert model.count(MAP_INSTRUCTION) == 3
+    assert model.count(REDUCE_INSTRUCTION) == 0
+    assert result == "要約(メモ[ああああああああ]\n\nメモ[いいいいいいいい]\n\nメモ[うううううううう])"
+
+
+def test_many_parts_are_reduced_in_stages(monkeypatch):
+    monkeypatch.setattr(summarizer, "MAP_MAX_CHARS", 1)
+    monkeypatch.setattr(summarizer, "REDUCE_FANIN", 3)
+    model = FakeModel()
+    texts = [f"t{i:02d}" for i in range(20)]
+    result = MapReduceSummarizer(model, parallelism=4).summarize(texts)
+
+    # 20 → map 20件 → reduce 7件 → reduce 3件 → 最終
+    assert model.count(MAP_INSTRUCTION) == 20
+    assert model.count(REDUCE_INSTRUCTION) == 7 + 3
+    assert model.count(FINAL_INSTRUCTION) == 1
+    # どの部分も最終結果まで順番どおりに残る
+    positions = [result.index(text) for text in texts]
+    assert positions == sorted(positions)
+
+
+def test_parallel_map_keeps_order(monkeypatch):
+    monkeypatch.setattr(summarizer, "MAP_MAX_CHARS", 1)
+    model = FakeModel(delay=True)
+    texts = [f"part{i}" for i in range(6)]
+    result = MapReduceSummarizer(model, parallelism=6).summarize(texts)
+    assert result == "要約(" + "\n\n".join(f"メモ[{text}]" for text in texts) + ")"
+
+
+def test_pack_texts():
+    assert pack_texts(["aa", "bb", "cc"], 6) == ["aa\n\nbb", "cc"]
+    assert pack_texts(["aaaaaaaa", "b"], 6) == ["aaaaaaaa", "b"]
+    assert pack_texts([], 6) == []
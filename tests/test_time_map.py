@@ -0,0 +1,62 @@
+import pytest
+from lib.time_map import TimeMap
+
+
+def test_from_kept_ms():
+    time_map = TimeMap.from_kept_ms([(1000, 3000), (5000, 5500)], 16000)
+    assert time_map.ranges == [(0.0, 1.0, 2.0), (2.0, 5.0, 0.5)]
+    assert time_map.output_duration == pytest.approx(2.5)
+
+
+def test_from_kept_ms_uses_frame_boundaries():
+    # 44.1kHz では 1ms が 44.1 フレームなので、区間の長さはフレーム単位で切り捨てた値になる
+    time_map = TimeMap.from_kept_ms([(1, 2), (3, 4)], 44100)
+    first, second = time_map.ranges
+    assert first == pytest.approx((0.0, 44 / 44100, 44 / 44100))
+    assert second[0] == pytest.approx(first[2])
+    assert second[1] == pytest.approx(132 / 44100)
+
+
+@pytest.mark.parametrize(
+    ("output_sec", "source_sec"),
+    [
+        (0.0, 1.0),
+        (1.5, 2.5),
+        (2.0, 5.0),
+        (2.25, 5.25),
+        # 区間の切れ目の直前は前の区間の終わりに留まる
+        (1.999, 2.999),
+    ],
+)
+def test_to_source(output_sec, source_sec):
+    time_map = TimeMap.from_kept_ms([(1000, 3000), (5000, 5500)], 16000)
+    assert time_map.to_source(output_sec) == pytest.approx(source_sec)
+
+
+def test_to_source_past_the_end_extends_last_range():
+    time_map = TimeMap([(0.0, 1.0, 2.0), (2.0, 5.0, 0.5)])
+    assert time_map.to_source(3.0) == pytest.approx(6.0)
+
+
+def test_to_source_clamps_inside_non_last_range():
+    # 前の区間の長さを超えた時刻（エンコーダの端数など）は、その区間の終わりに寄せる
+    time_map = TimeMap([(0.0, 1.0, 2.0), (2.5, 5.0, 0.5)])
+    assert time_map.to_source(2.2) == pytest.approx(3.0)
+
+
+def test_empty_map_is_identity():
+    assert TimeMap([]).to_source(12.5) == 12.5
+
+
+def test_shifted():
+    time_map = TimeMap([(0.0, 1.0, 2.0), (2.0, 5.0, 0.5)]).shifted(60.0)
+    assert time_map.ranges == [(60.0, 61.0, 2.0), (62.0, 65.0, 0.5)]
+    assert time_map.to_source(62.25) == pytest.approx(65.25)
+
+
+def test_list_round_trip():
+    time_map = TimeMap.from_kept_ms([(1, 2), (3, 4)], 44100)
+    restored = TimeMap.from_list(time_map.to_list())
+    for restored_range, original_range in zip(restored.ranges, time_map.ranges, strict=True):
+        assert restored_range == pytest.approx(original_range, abs=1e-6)
+    assert restored.to_source(0.001) == pytest.approx(time_map.to_source(0.001), abs=1e-6)
@@ -0,0 +1,63 @@
+import os
+import time
+from lib.transcription_cache import TranscriptionCache, cache_key
+
+
+def make_cache(tmp_path, max_bytes=10**6, max_age_sec=3600.0) -> TranscriptionCache:
+    return TranscriptionCache(str(tmp_path / "cache"), max_bytes=max_bytes, max_age_sec=max_age_sec)
+
+
+def set_mtime(cache: TranscriptionCache, key: str, mtime: float):
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+def test_put_and_get(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache_key("hash", "google", {"model": "gemini-2.5-flash"})
+    assert cache.get(key) == (False, None)
+    cache.put(key, {"segments": [{"text": "こんにちは"}]})
+    assert cache.get(key) == (True, {"segments": [{"text": "こんにちは"}]})
+
+
+def test_key_depends_on_request():
+    base = cache_key("hash", "openai", {"model": "whisper-1"})
+    assert base == cache_key("hash", "openai", {"model": "whisper-1"})
+    assert base != cache_key("hash", "openai", {"model": "gpt-4o-transcribe"})
+    assert base != cache_key("hash", "google", {"model": "whisper-1"})
+    assert base != cache_key("other", "openai", {"model": "whisper-1"})
+
+
+def test_evict_removes_expired(tmp_path):
+    cache = make_cache(tmp_path, max_age_sec=3600)
+    cache.put("aa-old", "古い")
+    cache.put("bb-new", "新しい")
+    set_mtime(cache, "aa-old", time.time() - 7200)
+
+    cache.evict()
+    assert cache.get("aa-old") == (False, None)
+    assert cache.get("bb-new") == (True, "新しい")
+
+
+def test_evict_removes_least_recently_used_over_size(tmp_path):
+    cache = make_cache(tmp_path)
+    now = time.time()
+    for i, key in enumerate(["aa-1", "bb-2", "cc-3"]):
+        cache.put(key, "x" * 100)
+        set_mtime(cache, key, now - 300 + i * 100)
+    entry_size = os.path.getsize(cache._path("aa-1"))
+    cache.max_bytes = entry_size * 2
+
+    # 一番古いエントリでも、読み込まれたら新しい扱いになる
+    assert cache.get("aa-1")[0]
+    cache.evict()
+    assert cache.get("aa-1")[0]
+    assert cache.get("bb-2") == (False, None)
+    assert cache.get("cc-3")[0]
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put("aa-key", "ok")
+    with open(cache._path("aa-key"), "w", encoding="utf-8") as f:
+        f.write("{")
+    assert cache.get("aa-key") == (False, None)
@@ -0,0 +1,73 @@
+import pytest
+
+# 文字起こしの呼び出しクラスが SDK を読み込むので、SDK が無い環境では実行しない
+pytest.importorskip("openai")
+
+import lib.upload_encoding
+from lib.debug_options import DebugOptions
+from lib.ffmpeg_utils import MediaInfo
+from lib.model_profile import ModelProfile
+from lib.output_options import OutputOptions
+from lib.transcription_controller import TranscriptionController
+from lib.upload_encoding import DEFAULT_PROVIDER_ENCODINGS
+
+MB = 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def default_encodings(monkeypatch):
+    monkeypatch.setattr(lib.upload_encoding, "_provider_encodings", dict(DEFAULT_PROVIDER_ENCODINGS))
+
+
+def controller(audio_file: str, provider: str = "openai", model: str = "whisper-1") -> TranscriptionController:
+    result = TranscriptionController(ModelProfile("test", provider, model), audio_file, OutputOptions())
+    result.set_debug_options(DebugOptions())
+    result.build_transcriptor()
+    return result
+
+
+def media(size: int, duration_sec: float, codec: str, bitrate: int, has_video: bool = False) -> MediaInfo:
+    return MediaInfo(
+        size=size,
+        duration_sec=duration_sec,
+        codec=codec,
+        bitrate=bitrate,
+        sample_rate=44100,
+        channels=2,
+        has_video=has_video,
+    )
+
+
+class TestUploadPlan:
+    def test_small_audio_is_sent_as_is(self):
+        info = media(5 * MB, 300.0, "mp3", 128000)
+        assert controller("talk.mp3").upload_plan(info, False) is None
+
+    def test_silence_removal_always_encodes(self):
+        info = media(5 * MB, 300.0, "mp3", 128000)
+        assert controller("talk.mp3").upload_plan(info, True).name == "opus"
+
+    def test_video_audio_is_copied(self):
+        info = media(200 * MB, 300.0, "aac", 128000, has_video=True)
+
+        encoding = controller("movie.mp4").upload_plan(info, False)
+        assert encoding.codec == "copy"
+        assert encoding.extension == ".m4a"
+
+    def test_copy_uses_container_the_provider_accepts(self):
+        info = media(200 * MB, 300.0, "aac", 128000, has_video=True)
+
+        encoding = controller("movie.mp4", "google", "gemini-2.5-flash").upload_plan(info, False)
+        assert encoding.extension == ".aac"
+
+    def test_file_that_must_be_split_is_encoded(self):
+        # 128kbps で2時間は 25MB を超えるので、そのままでもコピーでも1回で送れない
+        info = media(115 * MB, 2 * 60 * 60, "mp3", 128000)
+        assert controller("talk.mp3").upload_plan(info, False).name == "opus"
+
+    def test_unsupported_codec_is_encoded(self):
+        info = media(5 * MB, 300.0, "wmav2", 128000)
+        assert controller("talk.wma").upload_plan(info, False).name == "opus"
+
+    def test_unknown_duration_is_encoded(self):
+        assert controller("talk.mp3").upload_plan(None, False).name == "opus"
@@ -0,0 +1,115 @@
+from configparser import ConfigParser
+import pytest
+import lib.upload_encoding
+from lib.ffmpeg_utils import MediaInfo
+from lib.upload_encoding import (
+    DEFAULT_PROVIDER_ENCODINGS,
+    UPLOAD_ENCODINGS,
+    audio_mime_type,
+    can_send_as_is,
+    load_upload_encodings,
+    stream_copy_encoding,
+    upload_encoding_for,
+    upload_name,
+)
+
+
+def media(codec: str | None, has_video: bool = False, bitrate: int | None = 128000) -> MediaInfo:
+    return MediaInfo(
+        size=1000, duration_sec=60.0, codec=codec, bitrate=bitrate, sample_rate=44100, channels=2, has_video=has_video
+    )
+
+
+@pytest.fixture(autouse=True)
+def default_encodings(monkeypatch):
+    monkeypatch.setattr(lib.upload_encoding, "_provider_encodings", dict(DEFAULT_PROVIDER_ENCODINGS))
+
+
+class TestUploadEncoding:
+    def test_encode_args(self):
+        args = UPLOAD_ENCODINGS["opus"].ffmpeg_args()
+        assert args[:4] == ["-acodec", "libopus", "-b:a", "24k"]
+        assert ["-ar", "16000", "-ac", "1"] == args[args.index("-ar"): args.index("-ar") + 4]
+        # 同じ入力から毎回同じバイト列になるようにする
+        assert "+bitexact" in args
+
+    def test_keeps_source_format(self):
+        assert UPLOAD_ENCODINGS["mp3_hq"].format_args() == []
+
+    def test_bytes_per_sec(self):
+        assert UPLOAD_ENCODINGS["mp3_hq"].bytes_per_sec() == 16000
+
+
+class TestProviderEncoding:
+    def test_defaults(self):
+        assert upload_encoding_for("openai").name == "opus"
+        assert upload_encoding_for("unknown").name == "mp3_hq"
+
+    def test_config_override(self):
+        config = ConfigParser()
+        config.read_dict({"UPLOAD": {"google_encoding": "mp3", "openai_encoding": "wav"}})
+        load_upload_encodings(config)
+
+        assert upload_encoding_for("google").name == "mp3"
+        # 知らない形式は既定のまま
+        assert upload_encoding_for("openai").name == "opus"
+
+
+class TestCanSendAsIs:
+    @pytest.mark.parametrize(
+        "path, codec, provider, expected",
+        [
+            ("talk.mp3", "mp3", "openai", True),
+            ("talk.M4A", "aac", "openai", True),
+            # Gemini は m4a を受け付けない
+            ("talk.m4a", "aac", "google", False),
+            ("talk.aac", "aac", "google", True),
+            ("talk.opus", "opus", "elevenlabs", True),
+            ("talk.opus", "opus", "openai", False),
+            ("talk.wma", "wmav2", "openai", False),
+            ("talk.mp3", "mp3", "unknown", False),
+        ],
+    )
+    def test_codec_and_extension(self, path, codec, provider, expected):
+        assert can_send_as_is(path, media(codec), provider) == expected
+
+    def test_video_is_never_sent_as_is(self):
+        assert not can_send_as_is("movie.mp3", media("mp3", has_video=True), "openai")
+
+
+class TestStreamCopyEncoding:
+    @pytest.mark.parametrize(
+        "codec, provider, extension",
+        [
+            ("aac", "openai", ".m4a"),
+            ("aac", "google", ".aac"),
+            ("aac", "elevenlabs", ".m4a"),
+            ("opus", "google", ".ogg"),
+        ],
+    )
+    def test_container_for_provider(self, codec, provider, extension):
+        encoding = stream_copy_encoding(media(codec, has_video=True), provider)
+
+        assert encoding is not None
+        assert encoding.codec == "copy"
+        assert encoding.extension == extension
+        # 分割時間の見積もりには元のビットレートを使う
+        assert encoding.bytes_per_sec() == 16000
+        assert encoding.ffmpeg_args()[:2] == ["-acodec", "copy"]
+
+    def test_unsupported_codec(self):
+        assert stream_copy_encoding(media("wmav2"), "openai") is None
+
+    def test_unknown_bitrate(self):
+        assert stream_copy_encoding(media("aac", bitrate=None), "openai") is None
+
+
+class TestUploadNames:
+    def test_mime_type(self):
+        assert audio_mime_type("a.ogg") == "audio/ogg"
+        assert audio_mime_type("a.OPUS") == "audio/ogg"
+        assert audio_mime_type("a.unknown-ext") == "application/octet-stream"
+
+    def test_ascii_name(self):
+        assert upload_name("/tmp/会議 2024-01.m4a") == "2024-01.m4a"
+        assert upload_name("会議.mp3") == "audio.mp3"
@@ -16,6 +16,11 @@ from lib.my_icon import get_photo_image4icon
 from lib.transcription_controller import TranscriptionController
 from lib.constants import ButtonState
 from lib.model_profile import ProfileRegistry, effective_prompt
+from lib.rate_limiter import load_quotas
+from lib.job_workspace import load_workspace_settings
+from lib.upload_encoding import load_upload_encodings
+from lib.raw_response import is_raw_response_file, load_raw_document, raw_document_profile
+from lib.transcription_cache import TranscriptionCache
 from lib.output_options import (
     OUTPUT_FORMATS,
     SUBTITLE_CAPABLE_MODELS,
@@ -24,6 +29,7 @@ from lib.output_options import (
     FORMAT_JSON,
     OutputOptions,
     supports_timestamps,
+    unsupported_output_error,
 )
 from lib.settings_dialog import SettingsDialog
 
@@ -37,6 +43,10 @@ class TranscriptionApp:
 
         self.config = configparser.ConfigParser()
         self.config.read("config.ini", encoding="utf-8")
+        load_quotas(self.config)
+        load_upload_encodings(self.config)
+        load_workspace_settings(self.config)
+        self.transcription_cache = TranscriptionCache.load(self.config)
 
         self.window = window
         self.window.title("Snackゐsper" + (" [DEBUG]" if debug_mode else ""))
@@ -326,11 +336,9 @@ class TranscriptionApp:
 
     def _validate_output_options(self, profile, options: OutputOptions) -> str | None:
         """組み合わせの妥当性を確認。問題があれば警告メッセージを返す"""
-        if options.is_subtitle() and profile.model not in SUBTITLE_CAPABLE_MODELS:
-            return (
-                f"{options.output_format.upper()} 形式は whisper-1 / scribe_v1 / scribe_v2 のみ対応です。"
-                f"現在のモデル「{profile.model}」では生成できません。"
-            )
+        error = unsupported_output_error(profile.provider, profile.model, options)
+        if error is not None:
+            return error
 
         unsupported_flags = []
         if options.speaker_diarization and profile.provider not in ("google", "elevenlabs"):
@@ -402,6 +410,7 @@ class TranscriptionApp:
         ]
         if self.ffmpeg_installed:
             filetypes.append(("メディアファイル", "*.mp4"))
+        filetypes.append(("文字起こし生データ", "*_raw.json"))
 
         file_path = filedialog.askopenfilename(filetypes=filetypes)
         if file_path:
@@ -437,6 +446,12 @@ class TranscriptionApp:
         return True
 
     def run_transcribe(self):
+        raw_file_path = self.get_filepath()
+        if is_raw_response_file(raw_file_path):
+            # 保存済みの生データからの作り直しは ffmpeg も APIキーも使わない
+            self.rerender_raw_file(raw_file_path)
+            return
+
         if self.ffmpeg_installed is False:
             self.set_status("😮 ffmpegをインストールしてください")
             return
@@ -460,7 +475,7 @@ class TranscriptionApp:
         options = self._collect_output_options()
         warning = self._validate_output_options(profile, options)
         if warning is not None:
-            if options.is_subtitle() and profile.model not in SUBTITLE_CAPABLE_MODELS:
+            if unsupported_output_error(profile.provider, profile.model, options) is not None:
                 self.set_status("😮 " + warning.split("\n")[0])
                 messagebox.showerror("出力形式エラー", warning, parent=self.window)
                 return
@@ -486,6 +501,22 @@ class TranscriptionApp:
 
         controller.transcribe_audio(self.flag_silence_removal)
 
+    def rerender_raw_file(self, file_path):
+        options = self._collect_output_options()
+        self.output_options = options
+        self.save_settings()
+        self.load_from_widgets()
+
+        profile = raw_document_profile(load_raw_document(file_path))
+        controller = self.make_transcription_controller(profile, file_path, options)
+        controller.result_encoding = self.result_encoding
+        controller.set_debug_options(self.debug_options)
+
+        filebody = file_path.split("/")[-1]
+        self.set_status(f"😆 作り直します: {filebody}", ButtonState.DISABLE)
+
+        controller.transcribe_audio(self.flag_silence_removal)
+
     def get_filepath(self):
         file_path_display_content = self.file_path_display.get("1.0", tk.END)
         file_path = file_path_display_content.strip()
@@ -496,12 +527,17 @@ class TranscriptionApp:
 
         if self.config["DEFAULT"].get("keep_silenced", "False") == "True":
             controller.keep_silence_removed_files = True
+        controller.save_raw_response = self.config["DEFAULT"].get("save_raw_response", "True") == "True"
+        extract_processes = int(self.config["DEFAULT"].get("extract_processes", "0"))
+        if extract_processes > 0:
+            controller.extract_processes = extract_processes
 
         prompt = effective_prompt(profile)
         if prompt:
             controller.set_prompt(prompt)
 
         controller.set_status_function = self.set_status
+        controller.set_cache(self.transcription_cache)
 
         return controller
 